@@ -1,12 +1,18 @@
+import threading
+
 from langgraph.graph import StateGraph, END
 from utils.state import AgentState
 from utils.nodes import *
+from utils.metrics import instrument
+from utils.config import CHECKPOINT_ENABLED
+from utils.checkpoint import get_checkpointer
 
 # graph construction
+# every work node is wrapped with instrument() so its wall time shows up in /metrics
 graph = StateGraph(AgentState)
 
 # add the planner node and set it as the start node
-graph.add_node("planner", planner)
+graph.add_node("planner", instrument("planner", planner))
 graph.set_entry_point("planner")
 
 # add the router node
@@ -15,12 +21,13 @@ graph.add_node("router", passthrough)
 graph.add_edge("planner", "router")
 
 # add the retrieval node
-graph.add_node("retrieval", retrieve)
+graph.add_node("retrieval", instrument("retrieval", retrieve))
 
 # add the arxiv search node
+# it searches every plan step concurrently (bounded by SEARCH_MAX_PARALLEL) and clears the plan
 # conditional edge from router -> arxiv
 # edge from arxiv -> router
-graph.add_node("search_arxiv", search_arxiv)
+graph.add_node("search_arxiv", instrument("search_arxiv", search_arxiv))
 graph.add_conditional_edges(
     "router",
     router,
@@ -34,12 +41,12 @@ graph.add_edge("search_arxiv", "router")
 # add reflection and summarize node
 # conditional edge from reflection -> summarize
 # conditional edge from reflection -> planner
-graph.add_node("reflection", reflection)
+graph.add_node("reflection", instrument("reflection", reflection))
 
 # add an edge from retrieval to reflection
 graph.add_edge("retrieval", "reflection")
 
-graph.add_node("summarize", summarize)
+graph.add_node("summarize", instrument("summarize", summarize))
 graph.add_node("reflection_router", passthrough)
 graph.add_edge("reflection", "reflection_router")
 
@@ -55,4 +62,19 @@ graph.add_conditional_edges(
 # mark summarize node as the end node
 graph.add_edge("summarize", END)
 
-agent = graph.compile()
\ No newline at end of file
+# with checkpoints the state is saved after every node (see utils/checkpoint.py),
+# runs need a thread_id in config["configurable"] and resume with ainvoke(None, config)
+# the graph is compiled by get_agent() on first use, not at import, since the checkpoint store
+# opens its SQLite file and expires old runs when it is created
+agent = None
+_agent_lock = threading.Lock()
+
+def get_agent():
+    """Return the compiled agent, with the checkpoint store opened on first use."""
+    global agent
+    if agent is None:
+        with _agent_lock:
+            if agent is None:
+                checkpointer = get_checkpointer() if CHECKPOINT_ENABLED else None
+                agent = graph.compile(checkpointer=checkpointer)
+    return agent
@@ -0,0 +1,249 @@
+"""
+Offline end-to-end benchmark of the agent.
+Runs the real `agent` graph and the real /query endpoint against the local stand-ins in
+benchmarks/fakes.py (scripted chat model, fake embeddings, local Atom server) and reports:
+  - per-node latency (graph runs)
+  - time to first event, end-to-end p50/p95/p99 and throughput at N concurrent /query calls
+
+Run from the api directory:
+    python -m benchmarks.bench_agent --queries 20 --concurrency 5 --output bench.json
+    python -m benchmarks.bench_agent --compare bench.json     # fails on regressions vs a previous run
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--graph-runs", type=int, default=3, help="sequential graph runs for per-node latency")
+    parser.add_argument("--queries", type=int, default=20, help="total /query calls")
+    parser.add_argument("--concurrency", type=int, default=5, help="/query calls in flight at once")
+    parser.add_argument("--plan-steps", type=int, default=3)
+    parser.add_argument("--queries-per-step", type=int, default=2)
+    parser.add_argument("--replan", action="store_true", help="reflection is never sufficient (runs the full 3 iteration loop)")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--summary-tokens", type=int, default=400)
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="seconds per embedding call")
+    parser.add_argument("--arxiv-latency", type=float, default=0.2, help="seconds per arxiv response")
+    parser.add_argument("--arxiv-rate", type=float, default=1000.0, help="token bucket rate used against the local server")
+    parser.add_argument("--enable-caches", action="store_true", help="keep the llm cache, result cache and local index on (off for comparable runs)")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown before --compare fails")
+    return parser.parse_args()
+
+
+def stats(values) -> dict:
+    if not values:
+        return {"n": 0}
+    arr = np.array(values) * 1000
+    return {
+        "n": len(values),
+        "mean_ms": round(float(arr.mean()), 2),
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+        "p99_ms": round(float(np.percentile(arr, 99)), 2),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def bench_graph(agent, initial_state, runs: int) -> dict:
+    """ Per-node latency from the graph's debug stream (task start / task result timestamps) """
+    nodes = defaultdict(list)
+    totals = []
+
+    for i in range(runs):
+        started = {}
+        start = time.perf_counter()
+        state = initial_state(f"graph benchmark query {i}")
+        # same checkpointing as a job, events are not published
+        config = {"recursion_limit": 200, "configurable": {"thread_id": f"bench-graph-{i}-{time.time_ns()}"}}
+        async for event in agent.astream(state, config=config, stream_mode="debug", durability="sync"):
+            payload = event["payload"]
+            stamp = datetime.fromisoformat(event["timestamp"]).timestamp()
+            if event["type"] == "task":
+                started[payload["id"]] = stamp
+            elif event["type"] == "task_result" and payload["id"] in started:
+                nodes[payload["name"]].append(stamp - started.pop(payload["id"]))
+        totals.append(time.perf_counter() - start)
+
+    return {"nodes": {name: stats(values) for name, values in sorted(nodes.items())}, "e2e": stats(totals)}
+
+
+async def bench_api(app, queries: int, concurrency: int) -> dict:
+    """ Time to first event, end-to-end latency and throughput of concurrent /query calls """
+    import httpx
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/query"
+
+    ttfe, e2e, events, errors = [], [], [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(client, i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            first, count, ok = None, 0, False
+            async with client.stream("POST", url, json={"query": f"api benchmark query {i}"}) as resp:
+                async for line in resp.aiter_lines():
+                    if line.startswith("data:"):
+                        count += 1
+                        if first is None:
+                            first = time.perf_counter() - start
+                        if line.startswith("data: {\"error\""):
+                            break
+                    if line.startswith("event: end"):
+                        ok = True
+                        break
+            if not ok:
+                errors += 1
+                return
+            ttfe.append(first)
+            e2e.append(time.perf_counter() - start)
+            events.append(count)
+
+    start = time.perf_counter()
+    async with httpx.AsyncClient(timeout=None) as client:
+        await asyncio.gather(*(one(client, i) for i in range(queries)))
+    wall = time.perf_counter() - start
+
+    server.should_exit = True
+    await serve
+
+    return {
+        "queries": queries,
+        "concurrency": concurrency,
+        "errors": errors,
+        "ttfe": stats(ttfe),
+        "e2e": stats(e2e),
+        "events_per_query": round(float(np.mean(events)), 1) if events else 0,
+        "throughput_qps": round(len(e2e) / wall, 3),
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """ Return (metric, baseline, current) for every latency that regressed past the tolerance """
+    pairs = [
+        ("graph.e2e.p50_ms", baseline["graph"]["e2e"], current["graph"]["e2e"], "p50_ms"),
+        ("api.ttfe.p50_ms", baseline["api"]["ttfe"], current["api"]["ttfe"], "p50_ms"),
+        ("api.e2e.p50_ms", baseline["api"]["e2e"], current["api"]["e2e"], "p50_ms"),
+        ("api.e2e.p95_ms", baseline["api"]["e2e"], current["api"]["e2e"], "p95_ms"),
+    ]
+    for name, values in current["graph"]["nodes"].items():
+        if name in baseline["graph"]["nodes"]:
+            pairs.append((f"graph.nodes.{name}.p50_ms", baseline["graph"]["nodes"][name], values, "p50_ms"))
+
+    regressions = []
+    for metric, old, new, key in pairs:
+        if key in old and key in new and new[key] > old[key] * (1 + tolerance) and new[key] - old[key] > 5.0:
+            regressions.append((metric, old[key], new[key]))
+    return regressions
+
+
+def main():
+    args = parse_args()
+
+    from benchmarks.fakes import AtomServer, FakeEmbeddings, ScriptedResponder, scripted_chat_model_factory
+
+    atom = AtomServer(latency=args.arxiv_latency).start()
+    cache_dir = tempfile.mkdtemp(prefix="ra-bench-")
+
+    # settings are read at import time, configure before importing the app
+    os.environ.update({
+        "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY", "offline-benchmark"),
+        "RA_CACHE_DIR": cache_dir,
+        "RA_ARXIV_BASE_URL": atom.url,
+        "RA_ARXIV_RATE": str(args.arxiv_rate),
+        "RA_ARXIV_BURST": str(max(1, int(args.arxiv_rate))),
+        "RA_LLM_CACHE_ENABLED": "1" if args.enable_caches else "0",
+        "RA_LOCAL_INDEX_ENABLED": "1" if args.enable_caches else "0",
+        "RA_RESULT_CACHE_ENABLED": "1" if args.enable_caches else "0",
+    })
+
+    import setup
+    from agent import get_agent
+    from main import app
+    from utils.state import initial_state
+
+    responder = ScriptedResponder(args.plan_steps, args.queries_per_step, args.summary_tokens, sufficient=not args.replan)
+    embeddings = FakeEmbeddings(latency=args.embedding_latency)
+    setup.use_backends(
+        chat_model=scripted_chat_model_factory(responder, args.first_token_latency, args.tokens_per_second),
+        embedding_model=embeddings,
+    )
+
+    async def run():
+        graph = await bench_graph(get_agent(), initial_state, args.graph_runs)
+        api = await bench_api(app, args.queries, args.concurrency)
+        return graph, api
+
+    graph, api = asyncio.run(run())
+    atom.stop()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "graph": graph,
+        "api": api,
+        "counters": {"arxiv_requests": atom.requests, "embedding_calls": embeddings.calls},
+    }
+
+    # make the output readable on its own: stdout is full of the nodes' progress prints
+    print("\n========== BENCHMARK ==========")
+    print(f"commit {results['commit']}")
+    for name, s in graph["nodes"].items():
+        print(f"node {name:<18} p50 {s['p50_ms']:>9.1f}ms  p95 {s['p95_ms']:>9.1f}ms  (n={s['n']})")
+    print(f"graph e2e              p50 {graph['e2e']['p50_ms']:>9.1f}ms")
+    print(f"api ttfe               p50 {api['ttfe'].get('p50_ms', 0):>9.1f}ms  p95 {api['ttfe'].get('p95_ms', 0):>9.1f}ms")
+    print(
+        f"api e2e                p50 {api['e2e'].get('p50_ms', 0):>9.1f}ms  p95 {api['e2e'].get('p95_ms', 0):>9.1f}ms"
+        f"  p99 {api['e2e'].get('p99_ms', 0):>9.1f}ms"
+    )
+    print(f"throughput             {api['throughput_qps']} queries/s at concurrency {api['concurrency']} ({api['errors']} errors)")
+    print(f"counters               {results['counters']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"\ncompared with {args.compare} (commit {baseline.get('commit')}, tolerance {args.tolerance:.0%})")
+        if baseline.get("config") != results["config"]:
+            print("WARNING: benchmark settings differ from the baseline run, numbers are not comparable")
+        for metric, old, new in regressions:
+            print(f"REGRESSION {metric}: {old:.1f}ms -> {new:.1f}ms")
+        if regressions:
+            sys.exit(1)
+        print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
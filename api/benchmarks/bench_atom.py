@@ -0,0 +1,120 @@
+"""
+Parse throughput of arxiv Atom responses: the streaming parser (utils/atom.py) against feedparser,
+which the client used before. Both build the same compact paper dicts, and every feed is checked
+to give identical records. Reports feeds/s, MB/s and papers/s, and the peak memory of one parse.
+
+Feeds are recorded arxiv responses (*.xml / *.atom files in --feeds, e.g. saved with
+curl "http://export.arxiv.org/api/query?search_query=all:agents&max_results=200" > feeds/agents.xml),
+or deterministic arxiv-style feeds from benchmarks/fakes.py when no directory is given.
+
+Run from the api directory:
+    python -m benchmarks.bench_atom --sizes 5,50,500 --seconds 2 --output atom.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import feedparser
+
+from benchmarks.fakes import atom_feed
+from utils.atom import parse_feed
+from utils.papers import arxiv_id
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feeds", help="directory of recorded arxiv responses")
+    parser.add_argument("--sizes", default="5,50,500", help="max_results of the generated feeds (without --feeds)")
+    parser.add_argument("--seconds", type=float, default=2.0, help="minimum time per parser and feed set")
+    parser.add_argument("--output", help="write the results as JSON")
+    return parser.parse_args()
+
+
+def parse_feedparser(content: bytes) -> List[Dict]:
+    """ The previous parse_feed of utils/arxiv.py """
+    papers = []
+    for entry in feedparser.parse(content).entries:
+        papers.append({
+            "arxiv_id": arxiv_id({"arxiv_link": entry["link"], "title": entry["title"]}),
+            "title": entry["title"],
+            "published": entry["published"],
+            "summary": entry["summary"],
+            "arxiv_link": entry["link"],
+            "pdf_link": next((link["href"] for link in entry.get("links", []) if link.get("type") == "application/pdf"), ""),
+        })
+    return papers
+
+
+PARSERS: Dict[str, Callable[[bytes], List[Dict]]] = {"feedparser": parse_feedparser, "atom": parse_feed}
+
+
+def load_feeds(args) -> Dict[str, List[bytes]]:
+    """ Feed sets by name: one set of recorded files, or one generated set per size """
+    if args.feeds:
+        paths = sorted(glob.glob(os.path.join(args.feeds, "*.xml")) + glob.glob(os.path.join(args.feeds, "*.atom")))
+        if not paths:
+            raise SystemExit(f"no *.xml or *.atom files in {args.feeds}")
+        feeds = []
+        for path in paths:
+            with open(path, "rb") as f:
+                feeds.append(f.read())
+        return {"recorded": feeds}
+
+    queries = ["all:llm agents", "ti:retrieval augmented generation", "abs:graph neural networks", "all:prompt injection"]
+    return {f"max_results={size}": [atom_feed(query, size) for query in queries] for size in map(int, args.sizes.split(","))}
+
+
+def throughput(parse: Callable[[bytes], List[Dict]], feeds: List[bytes], seconds: float) -> Dict:
+    rounds = papers = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds or rounds == 0:
+        for content in feeds:
+            papers += len(parse(content))
+        rounds += 1
+    elapsed = time.perf_counter() - start
+    size = sum(map(len, feeds)) * rounds
+    return {"feeds_per_s": rounds * len(feeds) / elapsed, "mb_per_s": size / elapsed / 1e6, "papers_per_s": papers / elapsed}
+
+
+def peak_memory(parse: Callable[[bytes], List[Dict]], content: bytes) -> float:
+    tracemalloc.start()
+    parse(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def main():
+    args = parse_args()
+    results = {}
+
+    print("\n========== ATOM PARSING ==========")
+    for name, feeds in load_feeds(args).items():
+        mismatched = sum(parse_feed(content) != parse_feedparser(content) for content in feeds)
+        largest = max(feeds, key=len)
+        results[name] = {"feeds": len(feeds), "kb": sum(map(len, feeds)) / 1024, "mismatched_feeds": mismatched}
+        for parser, parse in PARSERS.items():
+            results[name][parser] = {**throughput(parse, feeds, args.seconds), "peak_mb": peak_memory(parse, largest)}
+
+        run = results[name]
+        speedup = run["atom"]["papers_per_s"] / run["feedparser"]["papers_per_s"]
+        print(f"{name}: {run['feeds']} feeds, {run['kb']:.0f}KB, {mismatched} with different records, atom {speedup:.1f}x faster")
+        for parser in PARSERS:
+            r = run[parser]
+            print(
+                f"  {parser:<11} {r['feeds_per_s']:>9.1f} feeds/s  {r['mb_per_s']:>7.2f} MB/s  "
+                f"{r['papers_per_s']:>9.0f} papers/s  peak {r['peak_mb']:.2f}MB"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
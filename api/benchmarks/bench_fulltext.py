@@ -0,0 +1,146 @@
+"""
+Throughput of the full-text pipeline on local fixture PDFs (benchmarks/fakes.py), in papers per second:
+  - in-process baseline: sequential extraction and chunking, no pool
+  - cold: download from the local server, extraction in the process pool, chunk cache writes
+  - embed: batched chunk embedding and ranking (fake embeddings without latency, their hashing dominates)
+  - warm: every paper served from the chunk cache
+plus the peak memory of the server process and of the extraction workers.
+Every worker count runs in a fresh interpreter with an empty cache.
+
+Run from the api directory:
+    python -m benchmarks.bench_fulltext --papers 64 --pages 12 --workers 1,2,4 --output fulltext.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", type=int, default=64, help="fixture PDFs per run")
+    parser.add_argument("--pages", type=int, default=12, help="pages per fixture PDF")
+    parser.add_argument("--workers", default="1,2,4", help="extraction process counts to compare")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def run_child(workers: int, papers: int, pages: int) -> dict:
+    env = {
+        **os.environ,
+        "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY", "offline-benchmark"),
+        "RA_CACHE_DIR": tempfile.mkdtemp(prefix="ra-fulltext-"),
+        "RA_FULLTEXT_WORKERS": str(workers),
+        "RA_FULLTEXT_MAX_PARALLEL": str(max(4, workers)),
+        # the fixture server is local, no arxiv rate limit applies
+        "RA_FULLTEXT_RATE": "1000000",
+        "RA_FULLTEXT_BURST": "1000",
+    }
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_fulltext", "--child", str(workers), "--papers", str(papers), "--pages", str(pages)],
+        cwd=API_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def child(papers: int, pages: int) -> dict:
+    import asyncio
+
+    import numpy as np
+
+    from benchmarks.fakes import AtomServer, FakeEmbeddings, fixture_pdf
+    import setup
+    from utils import fulltext
+    from utils.papers import Paper
+    from utils.pdf_text import extract_chunks
+    from utils.config import FULLTEXT_MAX_PAGES, FULLTEXT_CHUNK_WORDS, FULLTEXT_CHUNK_OVERLAP, FULLTEXT_MAX_CHUNKS
+
+    server = AtomServer(latency=0.0, pdf_pages=pages).start()
+    setup.use_backends(embedding_model=FakeEmbeddings(latency=0.0))
+    items = [
+        Paper(f"2401.{i:05d}", f"Paper {i}", "", "", f"http://arxiv.org/abs/2401.{i:05d}v1", f"{server.pdf_base}2401.{i:05d}v1")
+        for i in range(papers)
+    ]
+    result = {}
+
+    # in-process baseline on files already on disk
+    folder = tempfile.mkdtemp(prefix="ra-fixtures-")
+    paths = []
+    for paper in items:
+        paths.append(os.path.join(folder, f"{paper.arxiv_id}.pdf"))
+        with open(paths[-1], "wb") as f:
+            f.write(fixture_pdf(paper.pdf_link.rsplit("/", 1)[-1], pages))
+    start = time.perf_counter()
+    for path in paths:
+        extract_chunks(path, FULLTEXT_MAX_PAGES, FULLTEXT_CHUNK_WORDS, FULLTEXT_CHUNK_OVERLAP, FULLTEXT_MAX_CHUNKS)
+    result["baseline_papers_per_s"] = papers / (time.perf_counter() - start)
+    result["pdf_kb"] = sum(os.path.getsize(path) for path in paths) / len(paths) / 1024
+
+    async def run():
+        # start the workers outside the timed section, like a warmed up server
+        await asyncio.get_running_loop().run_in_executor(fulltext.get_pool(), extract_chunks, paths[0], 1, 10, 0, 1)
+
+        start = time.perf_counter()
+        chunks = await fulltext.fetch_chunks(items)
+        result["cold_papers_per_s"] = papers / (time.perf_counter() - start)
+        result["chunks_per_paper"] = sum(map(len, chunks.values())) / max(1, len(chunks))
+
+        query = np.asarray(setup.get_embeddings().embed_query("language model agents"), dtype=np.float32)
+        start = time.perf_counter()
+        await fulltext.rank_chunks(chunks, query / np.linalg.norm(query), 3)
+        result["embed_papers_per_s"] = papers / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await fulltext.fetch_chunks(items)
+        result["warm_papers_per_s"] = papers / (time.perf_counter() - start)
+        await fulltext.close_fulltext()
+
+    # the pipeline prints progress, keep stdout for the JSON line only
+    sys.stdout = open(os.devnull, "w")
+    asyncio.run(run())
+    sys.stdout = sys.__stdout__
+    server.stop()
+
+    # ru_maxrss is in kilobytes on linux
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    result["worker_peak_rss_mb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return result
+
+
+def main():
+    args = parse_args()
+
+    if args.child is not None:
+        print(json.dumps(child(args.papers, args.pages)))
+        return
+
+    results = {
+        "config": {"papers": args.papers, "pages": args.pages},
+        "runs": {workers: run_child(workers, args.papers, args.pages) for workers in map(int, args.workers.split(","))},
+    }
+
+    first = next(iter(results["runs"].values()))
+    print("\n========== FULL TEXT ==========")
+    print(f"{args.papers} fixture PDFs, {args.pages} pages, {first['pdf_kb']:.0f}KB and {first['chunks_per_paper']:.1f} chunks each")
+    print(f"in-process baseline    {first['baseline_papers_per_s']:>8.1f} papers/s")
+    for workers, run in results["runs"].items():
+        print(
+            f"workers={workers:<3} cold {run['cold_papers_per_s']:>8.1f}  embed {run['embed_papers_per_s']:>8.1f}  "
+            f"warm {run['warm_papers_per_s']:>8.1f} papers/s  peak rss {run['peak_rss_mb']:.0f}MB, workers {run['worker_peak_rss_mb']:.0f}MB"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
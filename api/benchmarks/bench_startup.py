@@ -0,0 +1,180 @@
+"""
+Startup profile of the API process.
+Every measurement runs in a fresh interpreter so nothing is already imported or initialized:
+  - import time of `main` (python -X importtime), with the slowest modules
+  - first-use cost of the lazily created models (real Gemini clients, construction only)
+  - time until the server accepts requests, and latency of the first and second /query
+    (offline: fake LLM, embeddings and arxiv from benchmarks/fakes.py)
+
+Run from the api directory:
+    python -m benchmarks.bench_startup --runs 5 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV = {**os.environ, "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY", "offline-benchmark"), "RA_WARMUP": "0"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to report")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def run_child(mode: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child", mode],
+        cwd=API_DIR, env=ENV, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def import_profile(runs: int, top: int) -> dict:
+    """ Cumulative import time of main and its slowest direct and indirect imports, median over runs """
+    totals, modules = [], {}
+    for _ in range(runs):
+        err = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import main"],
+            cwd=API_DIR, env=ENV, capture_output=True, text=True, check=True,
+        ).stderr
+        for line in err.splitlines():
+            match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+            if not match:
+                continue
+            cumulative, depth, name = int(match.group(2)) / 1e6, len(match.group(3)) // 2, match.group(4)
+            if name == "main":
+                totals.append(cumulative)
+            elif depth <= 2:
+                modules.setdefault(name, []).append(cumulative)
+
+    slowest = sorted(((float(np.median(v)), name) for name, v in modules.items()), reverse=True)[:top]
+    return {
+        "import_main_s": round(float(np.median(totals)), 3),
+        "slowest_modules_s": {name: round(seconds, 3) for seconds, name in slowest},
+    }
+
+
+def child_models() -> dict:
+    """ First use of the lazily created models """
+    start = time.perf_counter()
+    import setup
+    result = {"import_setup_s": time.perf_counter() - start}
+
+    start = time.perf_counter()
+    setup.get_embeddings()
+    result["first_get_embeddings_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    setup.get_chat_model(*setup.config.stage_llm("planner"))
+    result["first_get_chat_model_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    setup.get_chat_model(*setup.config.stage_llm("planner"))
+    result["pooled_get_chat_model_s"] = time.perf_counter() - start
+    return result
+
+
+def child_first_request() -> dict:
+    """ Time to a listening server and latency of the first two /query calls, offline """
+    import asyncio
+    import tempfile
+
+    start = time.perf_counter()
+    from benchmarks.fakes import AtomServer, FakeEmbeddings, ScriptedResponder, scripted_chat_model_factory
+
+    atom = AtomServer(latency=0.0).start()
+    os.environ.update({
+        "RA_CACHE_DIR": tempfile.mkdtemp(prefix="ra-startup-"),
+        "RA_ARXIV_BASE_URL": atom.url,
+        "RA_ARXIV_RATE": "1000",
+        "RA_ARXIV_BURST": "1000",
+        "RA_LLM_CACHE_ENABLED": "0",
+        "RA_RESULT_CACHE_ENABLED": "0",
+        "RA_LOCAL_INDEX_ENABLED": "0",
+    })
+
+    import httpx
+    import uvicorn
+    import setup
+    from main import app
+
+    setup.use_backends(
+        chat_model=scripted_chat_model_factory(ScriptedResponder(summary_tokens=50), 0.0, 100_000),
+        embedding_model=FakeEmbeddings(latency=0.0),
+    )
+
+    async def run() -> dict:
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+        serve = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.001)
+        result = {"server_ready_s": time.perf_counter() - start}
+        url = f"http://127.0.0.1:{server.servers[0].sockets[0].getsockname()[1]}/query"
+
+        async with httpx.AsyncClient(timeout=None) as client:
+            for name in ("first", "second"):
+                begin, first_event = time.perf_counter(), None
+                async with client.stream("POST", url, json={"query": f"startup benchmark {name} query"}) as resp:
+                    async for line in resp.aiter_lines():
+                        if line.startswith("data:") and first_event is None:
+                            first_event = time.perf_counter() - begin
+                result[f"{name}_query_ttfe_s"] = first_event
+                result[f"{name}_query_e2e_s"] = time.perf_counter() - begin
+
+        server.should_exit = True
+        await serve
+        return result
+
+    # the nodes print progress, keep stdout for the JSON line only
+    sys.stdout = open(os.devnull, "w")
+    result = asyncio.run(run())
+    sys.stdout = sys.__stdout__
+    atom.stop()
+    return result
+
+
+def median_of(results: list) -> dict:
+    return {key: round(float(np.median([r[key] for r in results])), 4) for key in results[0]}
+
+
+def main():
+    args = parse_args()
+
+    if args.child:
+        result = child_models() if args.child == "models" else child_first_request()
+        print(json.dumps(result))
+        return
+
+    results = {
+        "imports": import_profile(args.runs, args.top),
+        "models": median_of([run_child("models") for _ in range(args.runs)]),
+        "first_request": median_of([run_child("first_request") for _ in range(args.runs)]),
+    }
+
+    print("\n========== STARTUP ==========")
+    print(f"import main            {results['imports']['import_main_s'] * 1000:>9.1f}ms")
+    for name, seconds in results["imports"]["slowest_modules_s"].items():
+        print(f"  {name:<36} {seconds * 1000:>9.1f}ms")
+    for section in ("models", "first_request"):
+        for key, seconds in results[section].items():
+            print(f"{key:<22} {seconds * 1000:>9.1f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark the local vector index: bulk add throughput, query latency and compaction time.
+
+Run from the api directory:
+    python -m benchmarks.bench_vector_index --papers 100000 --dim 768
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from utils.vector_index import VectorIndex
+
+
+def percentile(values, p):
+    return float(np.percentile(np.array(values) * 1000, p))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch", type=int, default=1000, help="papers per add() call")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as path:
+        index = VectorIndex(path)
+
+        start = time.perf_counter()
+        for offset in range(0, args.papers, args.batch):
+            n = min(args.batch, args.papers - offset)
+            papers = [
+                {"arxiv_id": f"bench.{offset + i:07d}", "title": f"Paper {offset + i}", "summary": "", "arxiv_link": ""}
+                for i in range(n)
+            ]
+            index.add(papers, rng.standard_normal((n, args.dim), dtype=np.float32))
+        add_time = time.perf_counter() - start
+        print(f"add:     {args.papers} papers in {add_time:.2f}s ({args.papers / add_time:,.0f} papers/s)")
+
+        latencies = []
+        for _ in range(args.queries):
+            query = rng.standard_normal(args.dim, dtype=np.float32)
+            start = time.perf_counter()
+            index.search(query, args.k)
+            latencies.append(time.perf_counter() - start)
+        print(
+            f"search:  k={args.k} p50={percentile(latencies, 50):.2f}ms "
+            f"p95={percentile(latencies, 95):.2f}ms p99={percentile(latencies, 99):.2f}ms"
+        )
+
+        # reopen from disk, as a fresh worker would
+        start = time.perf_counter()
+        index = VectorIndex(path)
+        print(f"reopen:  {(time.perf_counter() - start) * 1000:.1f}ms ({len(index)} papers)")
+
+        index.remove([f"bench.{i:07d}" for i in range(0, args.papers, 10)])
+        start = time.perf_counter()
+        reclaimed = index.compact()
+        print(f"compact: reclaimed {reclaimed} rows in {time.perf_counter() - start:.2f}s ({len(index)} papers left)")
+
+
+if __name__ == "__main__":
+    main()
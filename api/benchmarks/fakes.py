@@ -0,0 +1,293 @@
+"""
+Deterministic local stand-ins for Gemini, the embedding model, the arxiv API and arxiv PDFs.
+Used by the offline benchmarks so the real agent graph and /query endpoint can be
+measured without network access, with results that are comparable across commits.
+"""
+
+import asyncio
+import hashlib
+import http.server
+import json
+import re
+import threading
+import time
+import zlib
+from typing import Any, AsyncIterator, Callable, Iterator, List
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from utils.prompts import system_prompt, system_prompt_reflection, query_expansion_prompt, reflection_prompt, summarize_prompt
+
+WORDS = (
+    "language models agents retrieval robustness alignment evaluation benchmark attack defense "
+    "prompt injection jailbreak reasoning planning memory transformer attention dataset fine tuning"
+).split()
+
+
+# chat model
+class ScriptedResponder:
+    """ Produces a valid response for each node prompt of the agent """
+
+    def __init__(self, plan_steps: int = 3, queries_per_step: int = 2, summary_tokens: int = 400, sufficient: bool = True):
+        self.plan_steps = plan_steps
+        self.queries_per_step = queries_per_step
+        self.summary_tokens = summary_tokens
+        self.sufficient = sufficient
+
+    def __call__(self, prompt: str) -> str:
+        if prompt.startswith(query_expansion_prompt):
+            terms = re.search(r"Search terms:(.*)", prompt).group(1)
+            return json.dumps([
+                {"search_query": f"all:{' '.join(re.findall(r'[a-z0-9]+', terms.lower()))} {i}", "max_results": 5}
+                for i in range(self.queries_per_step)
+            ])
+
+        if prompt.startswith(reflection_prompt):
+            return json.dumps({"sufficient": self.sufficient, "notes": "Scripted reflection notes."})
+
+        if prompt.startswith(summarize_prompt):
+            return " ".join(WORDS[i % len(WORDS)] for i in range(self.summary_tokens))
+
+        if prompt.startswith(system_prompt) or prompt.startswith(system_prompt_reflection):
+            query = prompt.split("User query:\n", 1)[1].split("\n", 1)[0]
+            return json.dumps({
+                "plan": [
+                    {
+                        "tool": "arxiv_search",
+                        "purpose": f"Step {i} for {query}",
+                        "query": {"search_terms": [f"{query} {WORDS[i % len(WORDS)]}"], "additional_focus": [WORDS[(i + 3) % len(WORDS)]]},
+                        "rationale": "Scripted plan step.",
+                    }
+                    for i in range(self.plan_steps)
+                ],
+                "reflection": {
+                    "purpose": "Check coverage.",
+                    "analysis_focus": [WORDS[1], WORDS[5]],
+                    "rationale": "Scripted reflection.",
+                },
+            })
+
+        return "ok"
+
+
+class ScriptedChatModel(BaseChatModel):
+    """ Streaming chat model that answers from a ScriptedResponder at a fixed token rate """
+
+    responder: Callable[[str], str]
+    first_token_latency: float = 0.3 # seconds before the first token
+    tokens_per_second: float = 200.0
+    streaming: bool = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _prompt(self, messages: List[BaseMessage]) -> str:
+        return "\n".join(str(m.content) for m in messages)
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        # ~4 characters per token, like real tokenizers
+        text = self.responder(self._prompt(messages))
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.first_token_latency + len(tokens) / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for token in self._tokens(messages):
+            time.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        # sleep in 20ms slices instead of per token so high rates stay accurate
+        tokens = self._tokens(messages)
+        per_slice = max(1, int(self.tokens_per_second * 0.02))
+        for i in range(0, len(tokens), per_slice):
+            await asyncio.sleep(len(tokens[i:i + per_slice]) / self.tokens_per_second)
+            for token in tokens[i:i + per_slice]:
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+                if run_manager:
+                    await run_manager.on_llm_new_token(token, chunk=chunk)
+                yield chunk
+
+
+def scripted_chat_model_factory(responder: Callable[[str], str], first_token_latency: float, tokens_per_second: float):
+    """ Chat model factory for setup.use_backends, the model name and temperature are ignored """
+    def factory(model: str, temperature: float):
+        return ScriptedChatModel(
+            responder=responder,
+            first_token_latency=first_token_latency,
+            tokens_per_second=tokens_per_second,
+            streaming=True,
+        )
+    return factory
+
+
+# embeddings
+class FakeEmbeddings(Embeddings):
+    """ Deterministic bag-of-words embeddings, so related texts are actually similar """
+
+    def __init__(self, dim: int = 768, latency: float = 0.05):
+        self.model = f"fake-{dim}"
+        self.dim = dim
+        self.latency = latency # seconds per call, whatever the batch size
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            seed = zlib.crc32(word.encode("utf-8"))
+            vector += np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+        if not vector.any():
+            vector[0] = 1.0
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self._embed(text)
+
+
+# arxiv
+def atom_feed(search_query: str, max_results: int, pdf_base: str = "http://arxiv.org/pdf/") -> bytes:
+    """ Deterministic arxiv-style Atom response for a search query """
+    seed = zlib.crc32(search_query.encode("utf-8"))
+    rng = np.random.default_rng(seed)
+    terms = re.findall(r"[a-z0-9]+", search_query.lower())
+    entries = []
+    for i in range(max_results):
+        # overlapping ids across queries, like real searches
+        pid = f"24{int(rng.integers(1, 13)):02d}.{int(rng.integers(0, 2000)):05d}"
+        words = " ".join(WORDS[int(j)] for j in rng.integers(0, len(WORDS), 40))
+        entries.append(
+            "<entry>"
+            f"<id>http://arxiv.org/abs/{pid}v1</id>"
+            "<updated>2024-05-02T00:00:00Z</updated><published>2024-05-01T00:00:00Z</published>"
+            f"<title>On {' '.join(terms[:4])}: study {pid}</title>"
+            f"<summary>  We investigate {' '.join(terms)} and related problems. {words}.\n  Results show clear gains.</summary>"
+            "<author><name>A. Author</name></author><author><name>B. Author</name></author>"
+            f'<arxiv:comment xmlns:arxiv="http://arxiv.org/schemas/atom">12 pages</arxiv:comment>'
+            f'<link href="http://arxiv.org/abs/{pid}v1" rel="alternate" type="text/html"/>'
+            f'<link title="pdf" href="{pdf_base}{pid}v1" rel="related" type="application/pdf"/>'
+            '<arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="cs.CL" scheme="http://arxiv.org/schemas/atom"/>'
+            '<category term="cs.CL" scheme="http://arxiv.org/schemas/atom"/>'
+            "</entry>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom">'
+        f'<title type="html">ArXiv Query: search_query={search_query}</title>'
+        f'<id>http://arxiv.org/api/{hashlib.md5(search_query.encode()).hexdigest()}</id>'
+        "<updated>2024-05-03T00:00:00-04:00</updated>"
+        f'<opensearch:totalResults xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">{max_results}</opensearch:totalResults>'
+        + "".join(entries)
+        + "</feed>"
+    ).encode("utf-8")
+
+
+_PDF_ESCAPE = str.maketrans({"\\": r"\\", "(": r"\(", ")": r"\)"})
+
+
+def make_pdf(pages: List[List[str]]) -> bytes:
+    """ Minimal valid PDF with one line of Helvetica text per string """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        text = "".join(f"({line.translate(_PDF_ESCAPE)}) '\n" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 800 Td\n{text}ET".encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def fixture_pdf(arxiv_id: str, pages: int = 8, lines_per_page: int = 60) -> bytes:
+    """ Deterministic paper-like PDF for an arxiv id """
+    rng = np.random.default_rng(zlib.crc32(arxiv_id.encode("utf-8")))
+    return make_pdf([
+        [" ".join(WORDS[int(j)] for j in rng.integers(0, len(WORDS), 12)) + "." for _ in range(lines_per_page)]
+        for _ in range(pages)
+    ])
+
+
+class AtomServer:
+    """ Local HTTP server answering arxiv API queries with generated Atom feeds, and /pdf/<id> with fixture PDFs """
+
+    def __init__(self, latency: float = 0.2, pdf_pages: int = 8):
+        self.latency = latency # seconds per response
+        self.pdf_pages = pdf_pages
+        self.requests = 0
+        self.pdf_requests = 0
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path.startswith("/pdf/"):
+                    server.pdf_requests += 1
+                    self.reply(fixture_pdf(url.path[len("/pdf/"):], server.pdf_pages), "application/pdf")
+                    return
+
+                server.requests += 1
+                params = parse_qs(url.query)
+                body = atom_feed(params.get("search_query", [""])[0], int(params.get("max_results", ["10"])[0]), server.pdf_base)
+                time.sleep(server.latency)
+                self.reply(body, "application/atom+xml; charset=utf-8")
+
+            def reply(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: Any):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/api/query?"
+
+    @property
+    def pdf_base(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/pdf/"
+
+    def start(self) -> "AtomServer":
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
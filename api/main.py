@@ -1,21 +1,30 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Header, HTTPException
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse
 import uvicorn
-from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import json
 
-from agent import agent
-from setup import *
-from IPython.display import display, Markdown
+from agent import get_agent
+from utils.arxiv import close_client
+from utils.fulltext import close_fulltext
+from utils import sse
+from utils.jobs import JobManager, JobQueueFull
+from utils import metrics as metrics_registry
+from utils.result_cache import get_result_cache
+from utils.config import ADMIN_TOKEN, WARMUP
+import setup
 
 import asyncio
-import anyio
-import contextlib
+import secrets
+import time
+from contextlib import aclosing
+from functools import partial
 
 app = FastAPI(title="Research Agent API", version="1.0")
 
+# agent runs that outlive the request that started them, the graph is compiled by the first one
+jobs = JobManager(get_agent)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -27,11 +36,38 @@ app.add_middleware(
 # request schema
 class QueryRequest(BaseModel):
     query: str
+    metrics: bool = False # stream a per-request `metrics` event before the final state
+    cache: bool = True # answer from the result cache when possible, false also starts over instead of resuming
+    resume: bool = True # continue an interrupted run of the same query from its last checkpoint
 
-class Event(BaseModel):
-    stage: str
-    message: str
-    meta: dict | None = None
+# job schema
+class JobRequest(BaseModel):
+    query: str
+    metrics: bool = False # append a `metrics` event before the final state
+    cache: bool = True
+    resume: bool = True
+
+@app.on_event("startup")
+async def startup():
+    # build the models and the agent in the background, the server accepts requests right away
+    if WARMUP:
+        app.state.warmup = asyncio.get_running_loop().run_in_executor(None, warmup)
+
+def warmup():
+    start = time.perf_counter()
+    try:
+        get_agent()
+        setup.warmup()
+        print(f">> MODELS READY IN {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f">> MODEL WARMUP FAILED, MODELS WILL BE CREATED ON FIRST USE: {e}")
+
+@app.on_event("shutdown")
+async def shutdown():
+    # release the pooled arxiv and PDF connections and the extraction workers
+    await jobs.shutdown()
+    await close_client()
+    await close_fulltext()
 
 # root endpoint
 @app.get("/")
@@ -39,63 +75,102 @@ def home():
     return {"message": "Research Agent API is running 🚀"}
 
 
+# prometheus metrics endpoint
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/query")
 async def run_query(request: QueryRequest):
     """
     Handler function that handles the POST route to /query.
-    Takes a user query and runs the agent.
+    Takes a user query and runs the agent, identical queries already in flight share one run.
     """
-    # thread safe queue to handle tokens as they are streamed
-    q: asyncio.Queue[Event] = asyncio.Queue()
-
-    # function to put events into the queue
-    async def publish(stage: str, message: str, meta: dict | None = None):
-        await q.put(Event(stage=stage, message=message, meta=meta or {}))
-
-    # initialize the graph state
-    init_state = {
-        "query": request.query,
-        "original_plan": {},
-        "plan": [],
-        "results": {"arxiv": []},
-        "reflection": None,
-        "reflection_notes": "",
-        "summary": "",
-        "relevant_docs": [],
-        "count": 0,
-        "publish": publish,
-    }
+    # start a job, or subscribe to the running job for the same query
+    try:
+        job = await jobs.submit(request.query, request.metrics, keep=False, cache=request.cache, resume=request.resume)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"too many queries in flight ({e})", headers={"Retry-After": "5"})
 
     async def event_stream():
-        try:
-            # run agent in background
-            task = asyncio.create_task(
-                agent.ainvoke(init_state, config={"recursion_limit": 200})
-                if hasattr(agent, "ainvoke")
-                else anyio.to_thread.run_sync(agent.invoke, init_state, {"recursion_limit": 100})
-            )
-
-            # stream queue items as they arrive
-            while not task.done() or not q.empty():
-                try:
-                    event = await asyncio.wait_for(q.get(), timeout=0.2)
-                    yield f"data: {json.dumps(event.dict())}\n\n"
-                    q.task_done()
-                except asyncio.TimeoutError:
-                    if task.done() and q.empty():
-                        break
-
-            final_state = await task
-            final_state.pop("publish", None)
-            yield f"data: {json.dumps({'final_state': final_state})}\n\n"
-            yield "event: end\ndata: {}\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        finally:
-            with contextlib.suppress(asyncio.CancelledError):
-                pass
-
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+        # buffered events are replayed first, then the live tail until the run ends (the run waits while this client is behind)
+        async with aclosing(job.subscribe()) as events:
+            async for _, event, payload in events:
+                yield sse.encode(payload, event=event)
+
+    # client gone (even before the stream started): stop the run if nobody else is following it
+    return sse.EventStreamResponse(event_stream(), on_close=partial(jobs.release, job))
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Start the agent for a query in the background and return its job ID.
+    Rejected with 429 while every worker is busy and the job queue is full.
+    """
+    try:
+        job = await jobs.submit(request.query, request.metrics, cache=request.cache, resume=request.resume)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"too many jobs in flight ({e})", headers={"Retry-After": "5"})
+    return {"job_id": job.id, "status": job.status, "events": f"/jobs/{job.id}/events"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """ Status of a job, with the final state once it is done """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown or expired job")
+    return job.info()
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """ Stop a running job """
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown or expired job")
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, last_event_id: int | None = Header(None), after: int = 0):
+    """
+    Stream the events of a job as SSE, in the same format as /query plus an `id:` on every frame.
+    Reconnecting with the Last-Event-ID header (or ?after=<id>) resumes right after that event,
+    the job keeps running while no client is attached.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown or expired job")
+
+    async def event_stream():
+        async for id, event, payload in job.events(last_event_id if last_event_id is not None else after):
+            yield sse.encode(payload, event=event, id=id)
+
+    return sse.EventStreamResponse(event_stream())
+
+def check_admin(token: str | None):
+    # without a configured token the admin endpoints are off, CORS lets any origin call them
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="admin endpoints are disabled, set RA_ADMIN_TOKEN to enable them")
+    if token is None or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="admin token required")
+
+
+@app.get("/admin/cache/results")
+async def result_cache_stats(x_admin_token: str | None = Header(None)):
+    """ Hit / miss statistics of the final result cache """
+    check_admin(x_admin_token)
+    return get_result_cache().info()
+
+
+@app.delete("/admin/cache/results")
+async def invalidate_result_cache(query: str | None = None, x_admin_token: str | None = Header(None)):
+    """ Drop the cached result of one query (?query=...), or every cached result """
+    check_admin(x_admin_token)
+    return {"invalidated": get_result_cache().invalidate(query)}
 
 # ----- Run locally -----
 if __name__ == "__main__":
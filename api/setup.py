@@ -1,24 +1,78 @@
 # setup llm, embeddings and any other things that need to be setup
+# models (and the google client libraries) are created on first use, not at import,
+# so the api process starts fast; warmup() builds them ahead of the first request
 
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from utils.streaming_callback import StreamingCallback
+from utils import config
+import threading
 
 # load api keys
 load_dotenv()
 
-# llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
+# chat model used by every stage unless overridden per stage (see utils/config.py)
+LLM_MODEL = config.LLM_MODEL
 
-# initialize an embedding model
-embeddings = GoogleGenerativeAIEmbeddings(model="text-embedding-004")
+# embedding model, created by get_embeddings() on first use
+embeddings = None
+_embeddings_lock = threading.Lock()
 
-# return an LLM with a handler attached
-def get_streaming_llm(publish, stage: str):
-    """Return a Gemini LLM with token streaming callbacks."""
-    handler = StreamingCallback(publish, stage)
+def gemini_embeddings():
+    """Default embedding model."""
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model=config.EMBEDDING_MODEL)
+
+def gemini_chat_model(model: str, temperature: float):
+    """Default chat model factory: streaming Gemini."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
     return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        temperature=0,
+        model=model,
+        temperature=temperature,
         streaming=True,
-        callbacks=[handler],
-    )
\ No newline at end of file
+    )
+
+# factory used by the client pool, swappable for offline runs (see benchmarks/fakes.py)
+chat_model_factory = gemini_chat_model
+
+# long-lived chat clients keyed by (model, temperature), shared by every request
+_chat_models = {}
+_chat_models_lock = threading.Lock()
+
+def use_backends(chat_model=None, embedding_model=None):
+    """Swap the chat model factory and/or the embedding model used by every node."""
+    global chat_model_factory, embeddings
+    if chat_model is not None:
+        chat_model_factory = chat_model
+        with _chat_models_lock:
+            _chat_models.clear()
+    if embedding_model is not None:
+        embeddings = embedding_model
+
+def get_embeddings():
+    """Return the active embedding model, created on first use."""
+    global embeddings
+    if embeddings is None:
+        with _embeddings_lock:
+            if embeddings is None:
+                embeddings = gemini_embeddings()
+    return embeddings
+
+def get_chat_model(model: str, temperature: float):
+    """Return the pooled chat client for a model and temperature, created on first use."""
+    key = (model, temperature)
+    with _chat_models_lock:
+        if key not in _chat_models:
+            _chat_models[key] = chat_model_factory(model, temperature)
+        return _chat_models[key]
+
+def warmup():
+    """Create the embedding model and the chat client of every stage ahead of the first request."""
+    get_embeddings()
+    for stage in config.LLM_STAGES:
+        get_chat_model(*config.stage_llm(stage))
+
+# return an LLM with a handler attached
+def get_streaming_llm(publish, stage: str, on_token=None):
+    """Return the stage's pooled chat LLM, with token streaming callbacks bound for this call only."""
+    handler = StreamingCallback(publish, stage, on_token=on_token)
+    return get_chat_model(*config.stage_llm(stage)).with_config(callbacks=[handler])
@@ -0,0 +1,16 @@
+"""
+Tests run from the api directory (python -m pytest) without network access or API keys.
+Every test session gets its own cache directory, set before utils.config is imported.
+"""
+
+import os
+import sys
+import tempfile
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-tests")
+os.environ["RA_CACHE_DIR"] = tempfile.mkdtemp(prefix="ra-tests-")
+os.environ["RA_WARMUP"] = "0"
+os.environ["RA_RESULT_CACHE_ENABLED"] = "0" # storing a result would embed the query
@@ -0,0 +1,62 @@
+import asyncio
+import tempfile
+import time
+
+import pytest
+
+from benchmarks.fakes import AtomServer
+from utils import arxiv
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = AtomServer(latency=0).start()
+    monkeypatch.setattr(arxiv, "ARXIV_BASE_URL", server.url)
+    monkeypatch.setattr(arxiv, "rate_limiter", arxiv.TokenBucket(1000, 1000))
+    monkeypatch.setattr(arxiv, "CACHE_DIR", tempfile.mkdtemp())
+    monkeypatch.setattr(arxiv, "_cache", None)
+    yield server
+    server.stop()
+
+
+def fetch(*args, **kwargs):
+    async def run():
+        try:
+            return await arxiv.fetch_papers(*args, **kwargs)
+        finally:
+            await arxiv.close_client()
+    return asyncio.run(run())
+
+
+def test_responses_are_cached_by_normalized_query_and_parameters(server):
+    papers = fetch("all:LLM  agents", max_results=3)
+    assert len(papers) == 3 and server.requests == 1
+
+    assert fetch("all:llm agents", max_results=3) == papers
+    assert server.requests == 1
+    # another result count or order is another response
+    fetch("all:llm agents", max_results=4)
+    fetch("all:llm agents", max_results=3, sort_order="ascending")
+    assert server.requests == 3
+
+
+def test_expired_responses_are_fetched_again(server):
+    fetch("all:llm agents", max_results=3)
+    cache = arxiv.get_response_cache()
+    cache._conn.execute("UPDATE responses SET created = ?", (time.time() - arxiv.ARXIV_CACHE_TTL - 1,))
+    fetch("all:llm agents", max_results=3)
+    assert server.requests == 2
+
+
+def test_replay_only_serves_the_cache_and_never_expires_it(server, monkeypatch):
+    papers = fetch("all:llm agents", max_results=3)
+
+    monkeypatch.setattr(arxiv, "ARXIV_REPLAY_ONLY", True)
+    monkeypatch.setattr(arxiv, "_cache", None) # reopened the way a replay process opens it
+    cache = arxiv.get_response_cache()
+    assert cache.ttl is None
+    cache._conn.execute("UPDATE responses SET created = ?", (time.time() - arxiv.ARXIV_CACHE_TTL - 1,))
+
+    assert fetch("all:llm agents", max_results=3) == papers
+    assert fetch("all:graph neural networks", max_results=3) == []
+    assert server.requests == 1
@@ -0,0 +1,54 @@
+from xml.etree.ElementTree import ParseError
+
+import pytest
+
+from benchmarks.fakes import atom_feed
+from utils.atom import AtomParser, parse_feed
+
+QUERIES = ["all:llm agents", "ti:retrieval augmented generation", "abs:graph neural networks"]
+
+ERROR_FEED = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">'
+    b"<entry><id>http://arxiv.org/api/errors#incorrect_id_format_for_1234</id><title>Error</title>"
+    b"<summary>incorrect id format for 1234</summary>"
+    b'<link href="http://arxiv.org/api/errors#incorrect_id_format_for_1234" rel="alternate" type="text/html"/></entry>'
+    b"</feed>"
+)
+
+
+def test_papers_match_feedparser():
+    pytest.importorskip("feedparser") # only needed to compare against the parser it replaced
+    from benchmarks.bench_atom import parse_feedparser
+
+    for query in QUERIES:
+        content = atom_feed(query, 20)
+        assert parse_feed(content) == parse_feedparser(content)
+
+
+def test_records_keep_only_the_fields_the_agent_uses():
+    paper = parse_feed(atom_feed("all:llm agents", 1, pdf_base="http://127.0.0.1/pdf/"))[0]
+    assert set(paper) == {"arxiv_id", "title", "published", "summary", "arxiv_link", "pdf_link"}
+    assert paper["arxiv_link"] == f"http://arxiv.org/abs/{paper['arxiv_id']}v1"
+    assert paper["pdf_link"] == f"http://127.0.0.1/pdf/{paper['arxiv_id']}v1"
+    assert paper["published"] == "2024-05-01T00:00:00Z"
+    assert paper["summary"].startswith("We investigate") and paper["summary"].endswith("clear gains.")
+
+
+def test_entries_come_out_as_the_bytes_arrive():
+    content = atom_feed("all:llm agents", 10)
+    parser = AtomParser()
+    batches = [parser.feed(content[i:i + 97]) for i in range(0, len(content), 97)]
+    batches.append(parser.close())
+    assert sum(batches, []) == parse_feed(content)
+    # entries are returned as soon as their end tag is read, not all at close()
+    assert sum(1 for batch in batches if batch) > 5
+
+
+def test_error_entries_are_not_papers_and_truncated_responses_raise():
+    assert parse_feed(ERROR_FEED) == []
+
+    content = atom_feed("all:llm agents", 3)
+    parser = AtomParser()
+    assert len(parser.feed(content[:content.rindex(b"<entry>")])) == 2
+    with pytest.raises(ParseError):
+        parser.close()
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from utils.channel import EventChannel
+
+
+async def drain(channel: EventChannel):
+    return [event async for event in channel]
+
+
+def test_reader_stops_at_the_end_sentinel():
+    async def run():
+        channel = EventChannel(4)
+        reader = asyncio.create_task(drain(channel))
+        for i in range(3):
+            await channel.publish(i)
+        await channel.close()
+        await channel.publish(3) # after the end, ignored
+        assert await reader == [0, 1, 2]
+    asyncio.run(run())
+
+
+def test_publisher_waits_for_a_slow_reader():
+    async def run():
+        channel = EventChannel(2, policy="block")
+        await channel.publish(0, debug=True)
+        await channel.publish(1, debug=True)
+        blocked = asyncio.create_task(channel.publish(2, debug=True))
+        await asyncio.sleep(0.01)
+        assert not blocked.done() # the run is throttled, nothing is dropped
+
+        assert await channel.__anext__() == 0
+        await asyncio.wait_for(blocked, 1)
+        await channel.close()
+        assert await drain(channel) == [1, 2] and channel.dropped == 0
+    asyncio.run(run())
+
+
+def test_debug_events_are_dropped_before_the_run_waits():
+    async def run():
+        channel = EventChannel(3, policy="drop_debug")
+        await channel.publish("token 1", debug=True)
+        await channel.publish("plan")
+        await channel.publish("token 2", debug=True)
+
+        await channel.publish("token 3", debug=True) # full: a new debug event is dropped
+        await channel.publish("search") # full: the oldest debug event makes room
+        assert channel.dropped == 2
+
+        await channel.publish("token 4", debug=True) # dropped
+        await channel.publish("reflection") # token 2, the last debug event left, makes room
+        blocked = asyncio.create_task(channel.publish("summary")) # only content left, the run waits
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        await channel.close() # a client that leaves never leaves the run waiting
+        await asyncio.wait_for(blocked, 1)
+        assert await drain(channel) == ["plan", "search", "reflection"] and channel.dropped == 4
+    asyncio.run(run())
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        EventChannel(policy="drop_all")
@@ -0,0 +1,177 @@
+import asyncio
+import os
+import tempfile
+import time
+from typing import List, TypedDict
+
+import numpy as np
+import pytest
+from langgraph.graph import StateGraph, START, END
+
+from utils.checkpoint import SqliteCheckpointer, StateSerializer
+from utils.papers import PaperRegistry
+
+
+class State(TypedDict):
+    query: str
+    steps: List[str]
+    registry: PaperRegistry
+
+
+def make_registry() -> PaperRegistry:
+    registry = PaperRegistry()
+    pid = registry.add({
+        "arxiv_link": "http://arxiv.org/abs/2401.00001v2", "title": "A paper", "published": "2024-01-01", "summary": "Abstract.",
+    })
+    registry.add({"arxiv_link": "http://arxiv.org/abs/cs/0112017v1", "title": "Old paper", "summary": "Old abstract."})
+    registry.set_embeddings([pid], np.array([[3.0, 4.0]], dtype=np.float32))
+    registry.similarities([pid], "query", np.array([1.0, 0.0], dtype=np.float32))
+    registry.select(pid, 0.6)
+    registry.passages[pid] = ["a passage"]
+    return registry
+
+
+def assert_same_registry(a: PaperRegistry, b: PaperRegistry):
+    assert [paper.to_dict() for paper in a.papers.values()] == [paper.to_dict() for paper in b.papers.values()]
+    assert a.embeddings.keys() == b.embeddings.keys()
+    for pid in a.embeddings:
+        np.testing.assert_allclose(a.embeddings[pid], b.embeddings[pid])
+    assert (a.scores, a.score_query, a.selected, a.passages) == (b.scores, b.score_query, b.selected, b.passages)
+
+
+def build_graph(checkpointer: SqliteCheckpointer, calls: dict, fail: set):
+    """ plan -> (left, right) -> summarize, nodes in `fail` raise once """
+
+    def node(name: str):
+        async def run(state: State):
+            calls[name] = calls.get(name, 0) + 1
+            if name in fail:
+                fail.discard(name)
+                raise RuntimeError(f"{name} failed")
+            # like the agent's nodes, the registry is mutated in place
+            state["registry"].add({"arxiv_link": f"http://arxiv.org/abs/2401.{len(calls):05d}v1", "title": name, "summary": ""})
+            return {"steps": state["steps"] + [name], "registry": state["registry"]}
+        return run
+
+    async def right(state: State):
+        calls["right"] = calls.get("right", 0) + 1
+        if "right" in fail:
+            fail.discard("right")
+            raise RuntimeError("right failed")
+        return {}
+
+    graph = StateGraph(State)
+    graph.add_node("plan", node("plan"))
+    graph.add_node("left", node("left"))
+    graph.add_node("right", right)
+    graph.add_node("summarize", node("summarize"))
+    graph.add_edge(START, "plan")
+    graph.add_edge("plan", "left")
+    graph.add_edge("plan", "right")
+    graph.add_edge(["left", "right"], "summarize")
+    graph.add_edge("summarize", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def config(thread_id: str, run_key: str = "query") -> dict:
+    return {"configurable": {"thread_id": thread_id, "run_key": run_key}}
+
+
+@pytest.fixture
+def path():
+    return os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite")
+
+
+def test_serializer_round_trips_the_registry_alone_and_inside_a_state():
+    serde = StateSerializer()
+    registry = make_registry()
+
+    assert_same_registry(serde.loads_typed(serde.dumps_typed(registry)), registry)
+
+    state = serde.loads_typed(serde.dumps_typed({"query": "q", "steps": ["plan"], "registry": registry}))
+    assert state["query"] == "q" and state["steps"] == ["plan"]
+    assert_same_registry(state["registry"], registry)
+
+    # anything else goes through the default serializer
+    assert serde.loads_typed(serde.dumps_typed({"plan": [{"tool": "arxiv_search"}]})) == {"plan": [{"tool": "arxiv_search"}]}
+
+
+def test_completed_run_is_saved_pruned_and_reloaded(path):
+    checkpointer = SqliteCheckpointer(path, keep=2)
+    agent = build_graph(checkpointer, {}, set())
+    state = {"query": "q", "steps": [], "registry": make_registry()}
+    final = asyncio.run(agent.ainvoke(state, config("t1"), durability="sync"))
+
+    # only the latest checkpoints are kept, with the values they point to
+    info = checkpointer.info()
+    assert (info["threads"], info["checkpoints"]) == (1, 2)
+    saved = checkpointer.get_tuple(config("t1"))
+    referenced = {
+        (channel, str(version))
+        for item in checkpointer.list(config("t1"))
+        for channel, version in item.checkpoint["channel_versions"].items()
+    }
+    stored = set(checkpointer._conn.execute("SELECT channel, version FROM blobs WHERE thread_id = 't1'").fetchall())
+    assert stored <= referenced and len(stored) == info["blobs"]
+
+    # a fresh process reads the same state back
+    reopened = SqliteCheckpointer(path, keep=2).get_tuple(config("t1"))
+    values = reopened.checkpoint["channel_values"]
+    assert values["steps"] == final["steps"] == ["plan", "left", "summarize"]
+    assert_same_registry(values["registry"], final["registry"])
+    assert reopened.config["configurable"]["checkpoint_id"] == saved.config["configurable"]["checkpoint_id"]
+
+
+def test_failed_run_resumes_from_its_last_node(path):
+    checkpointer = SqliteCheckpointer(path, keep=2)
+    calls = {}
+    agent = build_graph(checkpointer, calls, {"summarize"})
+
+    with pytest.raises(RuntimeError, match="summarize failed"):
+        asyncio.run(agent.ainvoke({"query": "q", "steps": [], "registry": PaperRegistry()}, config("t1"), durability="sync"))
+    assert checkpointer.latest_thread("query") == "t1"
+
+    # a new process picks the thread up by its run key and only runs what is left
+    resumed = build_graph(SqliteCheckpointer(path, keep=2), calls, set())
+    final = asyncio.run(resumed.ainvoke(None, config(checkpointer.latest_thread("query")), durability="sync"))
+    assert final["steps"] == ["plan", "left", "summarize"]
+    assert calls == {"plan": 1, "left": 1, "right": 1, "summarize": 2}
+    assert len(final["registry"].papers) == 3
+
+
+def test_writes_of_finished_tasks_are_not_repeated_on_resume(path):
+    checkpointer = SqliteCheckpointer(path, keep=2)
+    calls = {}
+    agent = build_graph(checkpointer, calls, {"right"})
+
+    with pytest.raises(RuntimeError, match="right failed"):
+        asyncio.run(agent.ainvoke({"query": "q", "steps": [], "registry": PaperRegistry()}, config("t1"), durability="sync"))
+    pending = checkpointer.get_tuple(config("t1")).pending_writes
+    assert any(task_channel[1] == "steps" for task_channel in pending)
+
+    final = asyncio.run(agent.ainvoke(None, config("t1"), durability="sync"))
+    assert final["steps"] == ["plan", "left", "summarize"]
+    # left finished before right failed, its saved writes are reused
+    assert calls == {"plan": 1, "left": 1, "right": 2, "summarize": 1}
+
+
+def test_retention_failures_and_run_deletion(path):
+    checkpointer = SqliteCheckpointer(path, keep=2, ttl=3600, max_threads=2)
+    agent = build_graph(checkpointer, {}, set())
+    for thread_id, run_key in [("a", "one"), ("b", "one"), ("c", "two")]:
+        asyncio.run(agent.ainvoke({"query": "q", "steps": [], "registry": PaperRegistry()}, config(thread_id, run_key), durability="sync"))
+
+    # the newest run of a key is resumed, and only max_threads runs stay on disk
+    assert checkpointer.latest_thread("one") == "b"
+    assert checkpointer.expire() == 1
+    assert checkpointer.info()["threads"] == 2 and checkpointer.latest_thread("one") == "b"
+
+    # runs past the TTL are neither resumed nor kept
+    checkpointer._conn.execute("UPDATE checkpoints SET created = ? WHERE thread_id = 'c'", (time.time() - 7200,))
+    assert checkpointer.latest_thread("two") is None
+    assert checkpointer.expire() == 1
+
+    assert [checkpointer.record_failure("b") for _ in range(3)] == [1, 2, 3]
+    assert checkpointer.delete_run("one") == 1
+    assert checkpointer.info() == {"threads": 0, "checkpoints": 0, "blobs": 0}
+    assert checkpointer._conn.execute("SELECT COUNT(*) FROM failures").fetchone()[0] == 0
@@ -0,0 +1,46 @@
+import numpy as np
+
+from utils.context import estimate_tokens, pack_papers, truncate_summary
+from utils.papers import Paper
+
+
+def paper(i: int, summary: str = "Agents call tools.") -> Paper:
+    return Paper(f"2401.{i:05d}", f"Paper {i}", "2024-01-01", summary, f"http://arxiv.org/abs/2401.{i:05d}v1")
+
+
+LONG = " ".join(f"Sentence number {i} about language model agents." for i in range(40))
+
+
+def test_short_papers_are_kept_whole():
+    text, cut = truncate_summary(paper(1), 400)
+    assert not cut and text.startswith("Title: Paper 1\nSummary:\nAgents call tools.")
+
+
+def test_long_summaries_are_cut_at_a_sentence_boundary():
+    text, cut = truncate_summary(paper(1, LONG), 100)
+    assert cut and estimate_tokens(text) <= 100
+    summary = text.split("Summary:\n")[1].split("\nLink:")[0]
+    assert summary.endswith("agents. […]") and summary.startswith("Sentence number 0 ")
+
+
+def test_packing_stays_within_the_budget_and_reports_what_did_not_fit():
+    papers = [paper(i, LONG) for i in range(6)]
+    scores = [0.9, 0.8, 0.7, 0.6, 0.5, 0.4]
+    packed, report = pack_papers(papers, scores, None, budget=500, max_paper_tokens=200, min_paper_tokens=60)
+
+    assert report["used_tokens"] <= 500 and report["packed"] == len(packed) == 3
+    # best first, the last one gets what is left of the budget
+    assert [text.split("\n")[0] for text in packed] == ["Title: Paper 0", "Title: Paper 1", "Title: Paper 2"]
+    assert [item["arxiv_id"] for item in report["truncated"]] == ["2401.00000", "2401.00001", "2401.00002"]
+    assert [item["arxiv_id"] for item in report["dropped"]] == ["2401.00003", "2401.00004", "2401.00005"]
+
+
+def test_near_duplicates_are_packed_after_more_diverse_papers():
+    papers = [paper(i) for i in range(3)]
+    embeddings = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+    packed, report = pack_papers(papers, [0.9, 0.85, 0.6], embeddings, budget=1000, mmr_lambda=0.5)
+    assert [text.split("\n")[0] for text in packed] == ["Title: Paper 0", "Title: Paper 2", "Title: Paper 1"]
+
+    # without embeddings only the scores count
+    packed, _ = pack_papers(papers, [0.9, 0.85, 0.6], None, budget=1000, mmr_lambda=0.5)
+    assert [text.split("\n")[0] for text in packed] == ["Title: Paper 0", "Title: Paper 1", "Title: Paper 2"]
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import tempfile
+import time
+
+import numpy as np
+import pytest
+
+from benchmarks.fakes import FakeEmbeddings
+from utils import embeddings as embedding_helpers
+from utils.cache import SqliteLRUCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = SqliteLRUCache(os.path.join(tempfile.mkdtemp(), "embeddings.sqlite"), table="embeddings")
+    monkeypatch.setattr(embedding_helpers, "_cache", cache)
+    return cache
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    """ Records the size of every embed_documents batch """
+
+    def __init__(self):
+        super().__init__(dim=16, latency=0)
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(len(texts))
+        return super().embed_documents(texts)
+
+
+def test_documents_are_embedded_once_in_batches(cache):
+    model = CountingEmbeddings()
+    texts = [f"abstract {i}" for i in range(7)] + ["abstract 0"]
+
+    vectors = asyncio.run(embedding_helpers.embed_documents(model, texts, batch_size=3, concurrency=2))
+    assert vectors.shape == (8, 16) and vectors.dtype == np.float32
+    assert sorted(model.batches) == [1, 3, 3] # the duplicate is embedded once
+    np.testing.assert_allclose(vectors[0], vectors[7])
+    np.testing.assert_allclose(vectors[3], model._embed("abstract 3"), rtol=1e-6)
+
+    # a later call only embeds what the cache does not have
+    again = asyncio.run(embedding_helpers.embed_documents(model, ["abstract 2", "abstract 9"], batch_size=3))
+    assert model.batches[3:] == [1] and len(cache) == 8
+    np.testing.assert_allclose(again[0], vectors[2])
+
+
+def test_query_and_document_vectors_are_cached_apart(cache):
+    model = CountingEmbeddings()
+    query = asyncio.run(embedding_helpers.embed_query(model, "llm agents"))
+    assert asyncio.run(embedding_helpers.embed_query(model, "llm agents")).tolist() == query.tolist()
+    assert model.calls == 1
+
+    asyncio.run(embedding_helpers.embed_documents(model, ["llm agents"]))
+    assert model.calls == 2 and len(cache) == 2
+
+    # another model never reads these vectors
+    asyncio.run(embedding_helpers.embed_query(FakeEmbeddings(dim=8, latency=0), "llm agents"))
+    assert len(cache) == 3
+
+
+def test_cache_evicts_the_least_recently_used_and_expired_entries():
+    path = os.path.join(tempfile.mkdtemp(), "cache.sqlite")
+    cache = SqliteLRUCache(path, max_entries=2)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.get("a")
+    cache.set("c", b"3")
+    assert cache.get_many(["a", "b", "c"]) == {"a": b"1", "c": b"3"}
+
+    expiring = SqliteLRUCache(path, table="expiring", ttl=60)
+    expiring.set("old", b"1")
+    expiring._conn.execute("UPDATE expiring SET created = ?", (time.time() - 120,))
+    assert expiring.get("old") is None
+    expiring.set("new", b"2")
+    assert len(expiring) == 1
@@ -0,0 +1,245 @@
+import asyncio
+from contextlib import aclosing
+
+from utils import sse
+from utils.jobs import Job, JobManager
+
+
+def content(i: int) -> dict:
+    return {"stage": "search", "message": f"content {i}", "meta": {}}
+
+
+def debug(i: int) -> dict:
+    return {"stage": "debug_planner", "message": f"token {i}", "meta": {}}
+
+
+async def read(job: Job, after: int = 0):
+    return [event async for event in job.events(after)]
+
+
+def test_events_resume_after_a_given_id():
+    async def run():
+        job = Job("q", buffer_size=10)
+        for i in range(1, 6):
+            await job.append(content(i))
+        await job.finish("done")
+
+        events = await read(job, after=2)
+        assert [event_id for event_id, _, _ in events] == [3, 4, 5, 6]
+        assert events[-1][1] == "end"
+        assert await read(job, after=6) == []
+    asyncio.run(run())
+
+
+def test_events_report_what_left_the_ring_buffer():
+    async def run():
+        job = Job("q", buffer_size=3)
+        for i in range(1, 7):
+            await job.append(content(i))
+        await job.finish("done") # ids 1..7, only 5, 6, 7 are buffered
+
+        events = await read(job)
+        assert events[0] == (None, "gap", {"missed": 4})
+        assert [event_id for event_id, _, _ in events[1:]] == [5, 6, 7]
+
+        # a reader that saw up to 2 missed 3 and 4, one past the buffer start missed nothing
+        assert (await read(job, after=2))[0] == (None, "gap", {"missed": 2})
+        assert [event_id for event_id, _, _ in await read(job, after=5)] == [6, 7]
+    asyncio.run(run())
+
+
+def test_live_reader_follows_the_job_until_it_ends():
+    async def run():
+        job = Job("q", buffer_size=2)
+        reader = asyncio.create_task(read(job))
+        await asyncio.sleep(0)
+        assert job.subscribers == 1
+        for i in range(1, 4):
+            await job.append(content(i))
+            await asyncio.sleep(0)
+        await job.finish("done")
+
+        events = await reader
+        assert [event_id for event_id, _, _ in events] == [1, 2, 3, 4]
+        assert job.subscribers == 0
+    asyncio.run(run())
+
+
+class FakeAgent:
+    """ Graph stand-in that runs until `release` is set """
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.calls = 0
+
+    async def ainvoke(self, state, config=None, durability=None):
+        self.calls += 1
+        await config["configurable"]["publish"]("search", "working")
+        await self.release.wait()
+        return {**state, "summary": "answer"}
+
+
+def test_kept_job_finishes_without_clients():
+    async def run():
+        agent = FakeAgent()
+        jobs = JobManager(agent)
+        job = await jobs.submit("agents", cache=False)
+        assert job.subscribers == 0
+
+        agent.release.set()
+        await job.task
+        assert job.status == "done" and job.result["summary"] == "answer"
+        assert [event for _, event, _ in await read(job)] == [None, None, "end"]
+        assert (await jobs.submit("agents", cache=False)) is not job
+    asyncio.run(run())
+
+
+def test_streaming_submit_is_released_when_the_client_leaves_before_the_stream_starts():
+    async def run():
+        agent = FakeAgent()
+        jobs = JobManager(agent)
+        job = await jobs.submit("agents", keep=False, cache=False)
+        assert job.subscribers == 1
+
+        async def event_stream():
+            async for _, event, payload in job.subscribe():
+                yield sse.encode(payload, event=event)
+
+        async def send(message):
+            raise OSError("client disconnected")
+
+        response = sse.EventStreamResponse(event_stream(), on_close=lambda: jobs.release(job))
+        scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+        try:
+            await response(scope, None, send)
+        except Exception:
+            pass # starlette reports the disconnect
+        await job.task
+        assert job.subscribers == 0 and job.status == "cancelled" and agent.calls == 1
+    asyncio.run(run())
+
+
+def test_debug_events_are_dropped_first():
+    async def run():
+        job = Job("q", buffer_size=4)
+        await job.append(content(1))
+        for i in range(2, 5):
+            await job.append(debug(i))
+        await job.append(content(5))
+        await job.append(content(6))
+        await job.finish("done") # 7 events, 3 dropped: the debug events 2, 3, 4
+
+        events = await read(job)
+        assert events[0] == (None, "gap", {"missed": 3})
+        assert [event_id for event_id, _, _ in events[1:]] == [1, 5, 6, 7]
+
+        # the gap between buffered events is counted for a reader resuming in it
+        events = await read(job, after=1)
+        assert events[0] == (None, "gap", {"missed": 3})
+        assert [event_id for event_id, _, _ in events[1:]] == [5, 6, 7]
+
+        # once no debug event is left, the oldest content goes
+        await job.append(content(8))
+        assert [event_id for event_id, _, _ in await read(job)][1:] == [5, 6, 7, 8]
+    asyncio.run(run())
+
+
+def test_live_subscriber_gets_the_replay_then_the_tail_in_order():
+    async def run():
+        job = Job("q", queue_size=2, policy="drop_debug")
+        await job.append(content(1))
+        async with aclosing(job.subscribe()) as events:
+            assert await events.__anext__() == (1, None, content(1)) # replayed
+
+            await job.append(debug(2))
+            await job.append(content(3))
+            await job.append(debug(4)) # dropped for this client, the run goes on
+            assert job._sinks[0].dropped == 1
+
+            await job.finish("done")
+            assert [event_id async for event_id, _, _ in events] == [2, 3, 5]
+    asyncio.run(run())
+
+
+def test_slow_subscriber_throttles_the_run_until_it_reads_or_leaves():
+    async def run():
+        job = Job("q", queue_size=2, policy="block")
+        events = job.subscribe()
+        reading = asyncio.create_task(events.__anext__())
+        await asyncio.sleep(0)
+        assert len(job._sinks) == 1
+
+        for i in range(1, 4):
+            await job.append(debug(i))
+        assert (await reading)[0] == 1
+        # 2 and 3 fill the channel, the run waits on the next event
+        blocked = asyncio.create_task(job.append(debug(4)))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        assert (await events.__anext__())[0] == 2
+        await asyncio.wait_for(blocked, 1)
+
+        # a client that leaves never keeps the run waiting
+        blocked = asyncio.create_task(job.append(debug(5)))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        await events.aclose()
+        assert job._sinks == []
+        await asyncio.wait_for(blocked, 1)
+    asyncio.run(run())
+
+
+def test_streaming_submits_share_one_run_until_the_last_client_leaves():
+    async def run():
+        agent = FakeAgent()
+        jobs = JobManager(agent, workers=1, max_queued=1)
+
+        first = await jobs.submit("What are LLM agents?", keep=False, cache=False)
+        second = await jobs.submit("what are  llm agents", keep=False, cache=False)
+        assert second is first and first.subscribers == 2
+
+        # counted on submit, so the first client leaving before the second reads does not stop the run
+        jobs.release(first)
+        await asyncio.sleep(0)
+        assert not first.task.done() and first.subscribers == 1
+
+        jobs.release(second)
+        await first.task
+        assert first.status == "cancelled" and not first.stopped and agent.calls == 1
+    asyncio.run(run())
+
+
+def test_failed_job_reports_the_error_inside_a_task_group():
+    class FailingAgent:
+        checkpointer = None
+
+        async def ainvoke(self, state, config=None, durability=None):
+            # the planner's llm call runs in the task group of its early searches
+            raise ExceptionGroup("unhandled errors in a TaskGroup", [RuntimeError("429 quota exceeded")])
+
+    async def run():
+        job = await JobManager(FailingAgent()).submit("agents", cache=False)
+        await job.task
+        assert job.status == "error" and job.error == "429 quota exceeded"
+    asyncio.run(run())
+
+
+def test_agent_factory_is_called_on_the_first_run_only():
+    agent = FakeAgent()
+    built = []
+
+    def build():
+        built.append(agent)
+        return agent
+
+    async def run():
+        jobs = JobManager(build)
+        assert built == [] and jobs.agent is None
+        agent.release.set()
+        for query in ("agents", "tools"):
+            job = await jobs.submit(query, cache=False)
+            await job.task
+            assert job.status == "done"
+        assert built == [agent] and agent.calls == 2
+    asyncio.run(run())
@@ -0,0 +1,48 @@
+import numpy as np
+
+from utils.lexical import bm25_scores, fuse_scores, score_cutoff, tokenize
+
+
+def test_tokenize_drops_case_punctuation_stopwords_and_single_characters():
+    assert tokenize("The LLM-based agents, using a tool (v2)!") == ["llm", "agents", "tool", "v2"]
+
+
+def test_bm25_ranks_by_matching_terms_and_rare_terms_weigh_more():
+    docs = [
+        "reinforcement learning for robot control",
+        "large language model agents that call tools",
+        "language model agents for planning",
+        "a survey of language models",
+    ]
+    scores = bm25_scores("language model agents tools", docs)
+    assert scores[0] == 0.0
+    assert list(np.argsort(-scores)) == [1, 2, 3, 0]
+    # "tools" only appears in one document, "language" in three
+    assert bm25_scores("tools", docs)[1] > bm25_scores("language", docs)[1]
+
+
+def test_bm25_of_no_documents_or_no_matching_terms():
+    assert bm25_scores("agents", []).shape == (0,)
+    assert not bm25_scores("the of and", ["agents and tools"]).any()
+
+
+def test_fusion_scales_bm25_to_the_best_document():
+    dense = np.array([0.9, 0.5, 0.1])
+    lexical = np.array([0.0, 4.0, 2.0])
+    np.testing.assert_allclose(fuse_scores(dense, lexical, 0.5), [0.45, 0.75, 0.3])
+    # without any lexical match only the dense scores count
+    np.testing.assert_allclose(fuse_scores(dense, np.zeros(3), 0.7), 0.7 * dense)
+
+
+def test_cutoff_keeps_the_top_k_best_first():
+    scores = np.array([0.5, 0.9, 0.7, 0.8, 0.6])
+    assert score_cutoff(scores, top_k=3) == [1, 3, 2]
+    assert score_cutoff(scores, top_k=10) == [1, 3, 2, 4, 0]
+
+
+def test_cutoff_stops_at_the_first_large_drop_after_min_k():
+    scores = np.array([0.90, 0.88, 0.60, 0.58, 0.30])
+    assert score_cutoff(scores, top_k=5, min_k=1, max_gap=0.1) == [0, 1]
+    # the drop is ignored while fewer than min_k papers are selected
+    assert score_cutoff(scores, top_k=5, min_k=3, max_gap=0.1) == [0, 1, 2, 3]
+    assert score_cutoff(scores, top_k=5, min_k=1, max_gap=0.0) == [0, 1, 2, 3, 4]
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import tempfile
+
+import pytest
+
+import setup
+from benchmarks.fakes import FakeEmbeddings, scripted_chat_model_factory
+from utils import llm_cache
+
+
+class Responder:
+    """ Answers every prompt with the next scripted response """
+
+    def __init__(self, *responses: str):
+        self.responses = list(responses)
+        self.prompts = []
+
+    def __call__(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return self.responses[min(len(self.prompts), len(self.responses)) - 1]
+
+
+@pytest.fixture
+def responder(monkeypatch):
+    responder = Responder()
+    monkeypatch.setattr(setup, "chat_model_factory", scripted_chat_model_factory(responder, 0, 10_000))
+    monkeypatch.setattr(setup, "_chat_models", {})
+    monkeypatch.setattr(setup, "embeddings", FakeEmbeddings(dim=16, latency=0))
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "CACHE_DIR", tempfile.mkdtemp())
+    monkeypatch.setattr(llm_cache, "_exact", None)
+    monkeypatch.setattr(llm_cache, "_semantic", None)
+    return responder
+
+
+def invoke(message: str, **kwargs):
+    events = []
+
+    async def publish(stage, text, meta=None):
+        if stage == "debug_planner_token":
+            events.append(text)
+
+    text = asyncio.run(llm_cache.cached_ainvoke(publish, "planner", message, **kwargs))
+    return text, "".join(events)
+
+
+def test_hits_are_replayed_as_token_events(responder):
+    responder.responses = ['{"plan": []}']
+    assert invoke("plan llm agents") == ('{"plan": []}', '{"plan": []}')
+    assert invoke("plan llm agents") == ('{"plan": []}', '{"plan": []}')
+    assert len(responder.prompts) == 1
+
+    invoke("plan graph neural networks")
+    assert len(responder.prompts) == 2
+
+
+def test_responses_the_caller_cannot_parse_are_not_cached(responder):
+    responder.responses = ["not json", '{"plan": []}']
+    assert invoke("plan llm agents", validate=json.loads)[0] == "not json"
+    assert invoke("plan llm agents", validate=json.loads)[0] == '{"plan": []}'
+    assert invoke("plan llm agents", validate=json.loads)[0] == '{"plan": []}'
+    assert len(responder.prompts) == 2
+
+
+def test_an_unusable_cached_response_is_dropped_and_asked_again(responder):
+    responder.responses = ['{"plan": []}']
+    invoke("plan llm agents") # cached without validation
+    # a caller that needs something else finds the entry unusable and reaches the model
+    assert invoke("plan llm agents", validate=lambda text: json.loads(text)["reflection"])[0] == '{"plan": []}'
+    assert len(responder.prompts) == 2 and len(llm_cache.get_exact_cache()) == 0
+
+
+def test_near_duplicate_queries_share_a_plan_in_the_semantic_tier(responder, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_SEMANTIC", True)
+    responder.responses = ['{"plan": [1]}', '{"plan": [2]}']
+    assert invoke("prompt for: llm agents using tools", semantic_query="llm agents using tools")[0] == '{"plan": [1]}'
+    assert invoke("prompt for: LLM agents using tools?", semantic_query="LLM agents using tools?")[0] == '{"plan": [1]}'
+    assert invoke("prompt for: protein folding", semantic_query="protein folding")[0] == '{"plan": [2]}'
+    assert len(responder.prompts) == 2
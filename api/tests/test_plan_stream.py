@@ -0,0 +1,51 @@
+import json
+
+from utils.plan_stream import PlanStream
+
+PLAN = {
+    "plan": [
+        {
+            "tool": "arxiv_search",
+            "purpose": 'Find "agents" {and} [tools]',
+            "query": {"search_terms": ["llm agents"], "additional_focus": ["tool use \\ planning"]},
+            "rationale": "First step.",
+        },
+        {"tool": "arxiv_search", "purpose": "Second", "query": {"search_terms": ["benchmarks"], "additional_focus": []}},
+    ],
+    "reflection": {"purpose": "Check coverage.", "analysis_focus": ["agents"], "plan": [{"not": "a step"}]},
+}
+
+
+def stream(text: str, size: int):
+    """ Feed `text` in chunks of `size` characters, return (chunk offset, item) for every item emitted """
+    parser = PlanStream()
+    return [(i, item) for i in range(0, len(text), size) for item in parser.feed(text[i:i + size])]
+
+
+def test_each_step_is_emitted_once_when_its_closing_brace_arrives():
+    text = json.dumps(PLAN)
+    emitted = stream(text, 1)
+
+    assert [item for _, item in emitted] == PLAN["plan"]
+    for position, item in emitted:
+        end = text.index(json.dumps(item)) + len(json.dumps(item)) - 1
+        assert position == end
+
+
+def test_chunking_does_not_change_the_result():
+    text = json.dumps(PLAN)
+    for size in (1, 2, 3, 7, 64, len(text)):
+        assert [item for _, item in stream(text, size)] == PLAN["plan"]
+
+
+def test_fence_and_other_keys_are_ignored():
+    text = "```json\n" + json.dumps({"reflection": {"plan": [{"a": 1}]}, "plan": [{"b": 2}], "notes": [{"c": 3}]}) + "\n```"
+    assert [item for _, item in stream(text, 5)] == [{"b": 2}]
+
+
+def test_truncated_response_emits_only_the_complete_steps():
+    text = json.dumps(PLAN)
+    cut = text.index('"Second"')
+    parser = PlanStream()
+    assert parser.feed(text[:cut]) == PLAN["plan"][:1]
+    assert parser.feed("") == []
@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+import numpy as np
+
+from utils.cache import SqliteLRUCache
+from utils.result_cache import ResultCache
+
+
+def store() -> SqliteLRUCache:
+    return SqliteLRUCache(os.path.join(tempfile.mkdtemp(), "results.sqlite"), table="results", max_entries=100)
+
+
+def test_queries_differing_in_case_whitespace_or_punctuation_share_a_result():
+    cache = ResultCache(store())
+    cache.put("What are LLM agents?", {"summary": "agents"})
+    entry, match, similarity = cache.lookup("  what are llm   agents")
+    assert (entry["final_state"], match, similarity) == ({"summary": "agents"}, "exact", 1.0)
+    assert cache.lookup("what are llm tools") is None
+
+
+def test_changing_the_model_of_one_stage_misses_the_cached_runs(monkeypatch):
+    results = store()
+    emb = np.array([1.0, 0.0], dtype=np.float32)
+    ResultCache(results, semantic=True, threshold=0.9).put("llm agents", {"summary": "flash"}, emb)
+
+    monkeypatch.setenv("RA_LLM_MODEL_SUMMARIZE", "gemini-2.5-pro")
+    cache = ResultCache(results, semantic=True, threshold=0.9)
+    assert cache.lookup("llm agents", emb) is None
+
+    cache.put("llm agents", {"summary": "pro"}, emb)
+    assert cache.lookup("llm agents", emb)[0]["final_state"] == {"summary": "pro"}
+
+    # the runs of the old model stay stored for a switch back
+    monkeypatch.delenv("RA_LLM_MODEL_SUMMARIZE")
+    cache = ResultCache(results, semantic=True, threshold=0.9)
+    assert cache.lookup("LLM agents?", emb)[0]["final_state"] == {"summary": "flash"}
+    assert cache.lookup("agents built on llms", emb)[0]["final_state"] == {"summary": "flash"}
+    assert len(cache.index) == 1
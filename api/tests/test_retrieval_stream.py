@@ -0,0 +1,56 @@
+import asyncio
+
+from benchmarks.fakes import FakeEmbeddings
+from utils import retrieval_stream
+from utils.papers import PaperRegistry
+from utils.retrieval_stream import RetrievalStream
+
+
+class FlakyEmbeddings(FakeEmbeddings):
+    """ The first document and query calls fail, like a transient 503 of the embedding service """
+
+    def __init__(self):
+        super().__init__(dim=16, latency=0)
+        self.failing = {"documents", "query"}
+
+    def embed_documents(self, texts):
+        if "documents" in self.failing:
+            self.failing.discard("documents")
+            raise RuntimeError("503 embedding service unavailable")
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        if "query" in self.failing:
+            self.failing.discard("query")
+            raise RuntimeError("503 embedding service unavailable")
+        return super().embed_query(text)
+
+
+def feed(start: int, n: int) -> list:
+    return [
+        {"arxiv_link": f"http://arxiv.org/abs/2401.{i:05d}v1", "title": f"LLM agents {i}", "summary": "Agents that plan with tools."}
+        for i in range(start, start + n)
+    ]
+
+
+def test_failed_speculative_embeddings_never_fail_the_node(monkeypatch):
+    embeddings = FlakyEmbeddings()
+    monkeypatch.setattr(retrieval_stream, "get_embeddings", lambda: embeddings)
+    monkeypatch.setattr(retrieval_stream, "LOCAL_INDEX_ENABLED", False)
+    registry = PaperRegistry()
+
+    async def run():
+        async with RetrievalStream(registry, "llm agents", top_n=10) as stream:
+            await stream.add(feed(0, 3))
+            stream.set_query("llm agents tools")
+            await asyncio.sleep(0.05) # both embeddings fail
+            assert stream.pending == set() and registry.embeddings == {}
+
+            # the papers of the failed batch are picked up again with the next feed
+            await stream.add(feed(3, 2))
+        return stream
+
+    stream = asyncio.run(run())
+    assert len(registry.embeddings) == 5
+    # without a query embedding nothing is scored yet, retrieve does it
+    assert stream.query_emb is None and registry.scores == {}
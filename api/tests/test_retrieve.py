@@ -0,0 +1,40 @@
+import asyncio
+import re
+
+from benchmarks.fakes import FakeEmbeddings
+from utils import nodes
+from utils.state import initial_state
+
+
+def paper(i: int, title: str) -> dict:
+    return {"arxiv_link": f"http://arxiv.org/abs/2401.{i:05d}v1", "title": title, "summary": "Agents that plan and call tools."}
+
+
+def selected(events) -> list:
+    return [int(re.search(r"\*\*Selected:\*\* (\d+)", message).group(1)) for stage, message in events if "Selected" in message]
+
+
+def test_papers_selected_by_an_earlier_iteration_are_not_counted_again(monkeypatch):
+    embeddings = FakeEmbeddings(dim=32, latency=0)
+    monkeypatch.setattr(nodes, "get_embeddings", lambda: embeddings)
+    monkeypatch.setattr(nodes, "LOCAL_INDEX_ENABLED", False)
+    monkeypatch.setattr(nodes, "RETRIEVAL_SCORE_GAP", 0.0)
+    events = []
+
+    async def publish(stage, message, meta=None):
+        events.append((stage, message))
+
+    state = initial_state("llm agents with tools")
+    state["original_plan"] = {"reflection": {"analysis_focus": ["tool use"]}}
+    registry = state["registry"]
+    config = {"configurable": {"publish": publish}}
+
+    state["results"]["arxiv"] = [registry.add(paper(i, f"LLM agents with tools {i}")) for i in range(3)]
+    state = asyncio.run(nodes.retrieve(state, config))
+    assert len(state["relevant_docs"]) == 3
+
+    # the next iteration finds one more paper, the three earlier ones rank again
+    state["results"]["arxiv"].append(registry.add(paper(3, "LLM agents with tools 3")))
+    state = asyncio.run(nodes.retrieve(state, config))
+    assert len(state["relevant_docs"]) == 4
+    assert selected(events) == [3, 1]
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from utils import nodes
+from utils.state import initial_state
+
+
+def paper(i: int) -> dict:
+    return {"arxiv_link": f"http://arxiv.org/abs/2401.{i:05d}v1", "title": f"Paper {i}", "published": "2024-01-01", "summary": "Abstract."}
+
+
+def step(purpose: str) -> dict:
+    return {"tool": "arxiv_search", "purpose": purpose, "query": {"search_terms": [purpose], "additional_focus": []}}
+
+
+async def search_step(publish, step: dict, on_feed=None):
+    """ plan steps named "broken" fail, the others return one paper each """
+    await asyncio.sleep(0.01)
+    if step["purpose"] == "broken":
+        raise RuntimeError("arxiv is down")
+    i = int(step["purpose"])
+    return [{"search_query": step["purpose"], "max_results": 5}], [paper(i)]
+
+
+def run_search(monkeypatch, purposes):
+    monkeypatch.setattr(nodes, "search_step", search_step)
+    monkeypatch.setattr(nodes, "RETRIEVAL_STREAMING", False)
+    events = []
+
+    async def publish(stage, message, meta=None):
+        events.append((stage, message))
+
+    state = initial_state("llm agents")
+    state["original_plan"] = {"plan": [step(purpose) for purpose in purposes], "reflection": {"analysis_focus": ["agents"]}}
+    state["plan"] = state["original_plan"]["plan"]
+    return asyncio.run(nodes.search_arxiv(state, {"configurable": {"publish": publish}})), events
+
+
+def test_a_failing_step_keeps_the_results_of_the_others(monkeypatch):
+    state, events = run_search(monkeypatch, ["1", "broken", "3"])
+    assert state["results"]["arxiv"] == ["2401.00001", "2401.00003"]
+    assert state["plan"] == []
+    assert len([stage for stage, _ in events if stage == "search_arxiv_token"]) == 2
+
+
+def test_the_run_fails_with_the_error_itself_when_every_step_fails(monkeypatch):
+    with pytest.raises(RuntimeError, match="arxiv is down"):
+        run_search(monkeypatch, ["broken", "broken"])
@@ -0,0 +1,72 @@
+import tempfile
+
+import numpy as np
+import pytest
+
+from utils.vector_index import VectorIndex
+
+
+def papers(*ids: int) -> list:
+    return [{"arxiv_id": f"2401.{i:05d}", "title": f"Paper {i}"} for i in ids]
+
+
+def vectors(*ids: int, dim: int = 8) -> np.ndarray:
+    # paper i points along axis i, scaled so the index has to normalize it
+    return np.stack([np.eye(dim, dtype=np.float32)[i] * (i + 2) for i in ids])
+
+
+def titles(results) -> list:
+    return [paper["title"] for _, paper, _ in results]
+
+
+@pytest.fixture
+def path():
+    return tempfile.mkdtemp()
+
+
+def test_add_skips_known_papers_and_search_ranks_by_cosine(path):
+    index = VectorIndex(path, "model-a")
+    assert index.add(papers(0, 1, 2), vectors(0, 1, 2)) == 3
+    assert index.add(papers(2, 3, 3), vectors(2, 3, 3)) == 1
+    assert len(index) == 4 and "2401.00003" in index
+
+    query = np.array([1.0, 0.5, 0, 0, 0, 0, 0, 0])
+    results = index.search(query, k=3)
+    assert len(results) == 3 and titles(results)[:2] == ["Paper 0", "Paper 1"]
+    assert results[0][0] == pytest.approx(1 / np.sqrt(1.25), rel=1e-5)
+    np.testing.assert_allclose(np.linalg.norm(results[0][2]), 1.0, rtol=1e-5)
+    assert titles(index.search(query, k=10, min_score=0.1)) == ["Paper 0", "Paper 1"]
+
+    # the index survives a restart
+    assert titles(VectorIndex(path, "model-a").search(query, k=2)) == ["Paper 0", "Paper 1"]
+
+
+def test_removed_papers_are_not_found_and_compaction_reclaims_their_rows(path):
+    index = VectorIndex(path)
+    index.add(papers(*range(6)), vectors(*range(6)))
+    index.remove(["2401.00001", "2401.00004"])
+    assert len(index) == 4 and "2401.00001" not in index
+    assert "Paper 1" not in titles(index.search(vectors(1)[0], k=10))
+
+    assert index.compact() == 2 and index.size == 4
+    assert index.compact() == 0
+    for i in (0, 2, 3, 5):
+        assert titles(index.search(vectors(i)[0], k=1)) == [f"Paper {i}"]
+
+    # the other processes reload after a compaction
+    assert VectorIndex(path).size == 4
+    assert index.add(papers(6), vectors(6)) == 1 and titles(index.search(vectors(6)[0], k=1)) == ["Paper 6"]
+
+
+def test_another_model_or_dimension_rebuilds_the_index(path):
+    VectorIndex(path, "model-a").add(papers(0, 1), vectors(0, 1))
+    assert len(VectorIndex(path, "model-a")) == 2
+
+    index = VectorIndex(path, "model-b")
+    assert len(index) == 0 and index.search(vectors(0)[0]) == []
+
+    index.add(papers(0), vectors(0))
+    assert index.add(papers(1), vectors(1, dim=4)) == 1
+    assert len(index) == 1 and index.dim == 4
+    # a query of the old dimension finds nothing instead of failing
+    assert index.search(vectors(0)[0]) == []
@@ -0,0 +1,163 @@
+"""
+Async arXiv API client.
+All requests share one keep-alive connection pool, run with bounded parallelism and go
+through a process wide token bucket, so concurrent /query requests together stay within
+arXiv's published rate limit (one request every three seconds by default).
+Responses are parsed by the streaming Atom parser in atom.py and cached on disk, and in replay
+only mode the cache is the only source.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List
+from urllib.parse import quote
+
+import anyio
+import httpx
+
+from utils.atom import parse_feed
+from utils.cache import SqliteLRUCache
+from utils.metrics import ARXIV_FETCH_SECONDS, ARXIV_RATE_WAIT_SECONDS, ARXIV_BYTES, ARXIV_REQUESTS
+from utils.config import (
+    CACHE_DIR, ARXIV_BASE_URL, ARXIV_RATE, ARXIV_BURST, ARXIV_MAX_PARALLEL, ARXIV_MAX_CONNECTIONS, ARXIV_TIMEOUT,
+    ARXIV_CACHE_TTL, ARXIV_CACHE_MAX_ENTRIES, ARXIV_REPLAY_ONLY,
+)
+
+
+class TokenBucket:
+    """ Async token bucket: refills `rate` tokens per second up to `capacity` """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # the lock makes waiters queue up in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# process wide limiter shared by every request
+rate_limiter = TokenBucket(ARXIV_RATE, ARXIV_BURST)
+
+# pooled client and parallelism limit, bound to the event loop that created them
+_client: httpx.AsyncClient | None = None
+_semaphore: asyncio.Semaphore | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+_cache: SqliteLRUCache | None = None
+
+
+def get_response_cache() -> SqliteLRUCache:
+    """ Process wide cache of parsed arxiv responses, created on first use """
+    global _cache
+    if _cache is None:
+        _cache = SqliteLRUCache(
+            os.path.join(CACHE_DIR, "arxiv.sqlite"),
+            table="responses",
+            max_entries=ARXIV_CACHE_MAX_ENTRIES,
+            # a recorded corpus replays forever, expiring it would turn replays into empty results
+            ttl=None if ARXIV_REPLAY_ONLY else ARXIV_CACHE_TTL,
+        )
+    return _cache
+
+
+def cache_key(search_query: str, max_results: int, sort_by: str, sort_order: str) -> str:
+    """ Key a search by its normalized query and the parameters that change the response """
+    normalized = " ".join(search_query.lower().split())
+    return hashlib.sha256(f"{normalized}\x00{max_results}\x00{sort_by}\x00{sort_order}".encode("utf-8")).hexdigest()
+
+
+def get_client() -> httpx.AsyncClient:
+    """ Return the shared keep-alive client for the running event loop """
+    global _client, _semaphore, _loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=ARXIV_TIMEOUT,
+            limits=httpx.Limits(max_connections=ARXIV_MAX_CONNECTIONS, max_keepalive_connections=ARXIV_MAX_CONNECTIONS),
+            follow_redirects=True,
+        )
+        _semaphore = asyncio.Semaphore(ARXIV_MAX_PARALLEL)
+        _loop = loop
+    return _client
+
+
+async def close_client():
+    """ Close the shared client (called on server shutdown) """
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def build_url(search_query: str, max_results: int, sort_by: str = "submittedDate", sort_order: str = "descending") -> str:
+    """ Construct a valid arxiv API url for a search query """
+    return ARXIV_BASE_URL + f"search_query={quote(search_query)}&max_results={max_results}&sortBy={sort_by}&sortOrder={sort_order}"
+
+
+async def fetch_papers(search_query: str, max_results: int = 5, sort_by: str = "submittedDate", sort_order: str = "descending") -> List[Dict]:
+    """ Search arxiv for a single query and return the matching papers """
+    url = build_url(search_query, max_results, sort_by, sort_order)
+    cache = get_response_cache()
+    key = cache_key(search_query, max_results, sort_by, sort_order)
+
+    cached = await anyio.to_thread.run_sync(cache.get, key)
+    if cached is not None:
+        print(f"url (cached): {url}")
+        ARXIV_REQUESTS.inc(result="hit")
+        return json.loads(cached)
+
+    if ARXIV_REPLAY_ONLY:
+        # never touch the network in replay mode, a miss is an empty result
+        print(f"url (replay miss): {url}")
+        ARXIV_REQUESTS.inc(result="replay_miss")
+        return []
+
+    client = get_client()
+    ARXIV_REQUESTS.inc(result="miss")
+
+    async with _semaphore:
+        start = time.perf_counter()
+        await rate_limiter.acquire()
+        ARXIV_RATE_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        print(f"url: {url}")
+        response = await client.get(url)
+        response.raise_for_status()
+        ARXIV_FETCH_SECONDS.observe(time.perf_counter() - start)
+        ARXIV_BYTES.inc(len(response.content))
+
+    # parsing is CPU bound → run in thread
+    papers = await anyio.to_thread.run_sync(parse_feed, response.content)
+    await anyio.to_thread.run_sync(cache.set, key, json.dumps(papers).encode("utf-8"))
+
+    return papers
+
+
+async def fetch_many(search_queries: List[str], max_results: int = 5, on_feed=None, **kwargs) -> List[List[Dict]]:
+    """
+    Run several searches concurrently, results are returned in query order.
+    on_feed: awaited with the papers of each search as soon as it completes, in completion order
+    """
+    async def fetch(search_query: str) -> List[Dict]:
+        papers = await fetch_papers(search_query, max_results, **kwargs)
+        if on_feed is not None:
+            await on_feed(papers)
+        return papers
+
+    return await asyncio.gather(*(fetch(q) for q in search_queries))
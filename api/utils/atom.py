@@ -0,0 +1,84 @@
+"""
+Streaming parser for arXiv API responses (Atom).
+Bytes go through expat's pull parser and every <entry> becomes a compact paper dict as soon
+as its end tag is read, with only the fields the agent uses; the entry element is then
+cleared, so memory stays flat however large max_results is. Unlike a general feed parser
+there is no encoding sniffing, date parsing or HTML sanitizing: arXiv always sends UTF-8
+Atom with plain text titles and abstracts.
+"""
+
+from typing import Dict, List
+from xml.etree.ElementTree import XMLPullParser
+
+from utils.papers import arxiv_id
+
+_ATOM = "{http://www.w3.org/2005/Atom}"
+_ENTRY = _ATOM + "entry"
+_ID = _ATOM + "id"
+_TITLE = _ATOM + "title"
+_PUBLISHED = _ATOM + "published"
+_SUMMARY = _ATOM + "summary"
+_LINK = _ATOM + "link"
+
+
+def entry_record(entry) -> Dict:
+    """ Compact paper dict of an <entry> element """
+    fields = {}
+    link = pdf_link = ""
+    for child in entry:
+        tag = child.tag
+        if tag == _LINK:
+            attrib = child.attrib
+            if attrib.get("type") == "application/pdf":
+                pdf_link = pdf_link or attrib.get("href", "")
+            elif attrib.get("rel", "alternate") == "alternate":
+                link = link or attrib.get("href", "")
+        elif tag in (_ID, _TITLE, _PUBLISHED, _SUMMARY):
+            fields[tag] = (child.text or "").strip()
+
+    # the abs page is the alternate link, the entry id is the same url
+    link = link or fields.get(_ID, "")
+    title = fields.get(_TITLE, "")
+    return {
+        "arxiv_id": arxiv_id({"arxiv_link": link, "title": title}),
+        "title": title,
+        "published": fields.get(_PUBLISHED, ""),
+        "summary": fields.get(_SUMMARY, ""),
+        "arxiv_link": link,
+        "pdf_link": pdf_link,
+    }
+
+
+class AtomParser:
+    """ Incremental parser: feed response bytes as they arrive, completed entries come out as paper dicts """
+
+    def __init__(self):
+        self._parser = XMLPullParser(events=("end",))
+
+    def feed(self, data: bytes) -> List[Dict]:
+        self._parser.feed(data)
+        return self._read()
+
+    def close(self) -> List[Dict]:
+        """ Finish the document, raises xml.etree.ElementTree.ParseError on malformed or truncated XML """
+        self._parser.close()
+        return self._read()
+
+    def _read(self) -> List[Dict]:
+        papers = []
+        for _, elem in self._parser.read_events():
+            if elem.tag == _ENTRY:
+                paper = entry_record(elem)
+                elem.clear()
+                if "/api/errors" in paper["arxiv_link"]:
+                    # arxiv reports a bad query as an entry, it is not a paper
+                    print(f">> ARXIV ERROR: {paper['summary']}")
+                else:
+                    papers.append(paper)
+        return papers
+
+
+def parse_feed(content: bytes) -> List[Dict]:
+    """ Parse an Atom response into compact paper dicts """
+    parser = AtomParser()
+    return parser.feed(content) + parser.close()
@@ -0,0 +1,188 @@
+"""
+Small persistent key -> bytes cache backed by SQLite.
+Used by the embedding cache (and any other cache that needs to survive restarts).
+Entries are evicted least-recently-used once the cache grows past max_entries,
+and optionally expire after a TTL.
+SemanticIndex keeps the embeddings of a cache's keys in memory for nearest-key lookups
+(semantic LLM and result cache tiers), pruned whenever the cache evicts a key.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+
+class SqliteLRUCache:
+    """ Thread safe, size bounded, optionally expiring key/value store """
+
+    def __init__(self, path: str, table: str = "cache", max_entries: int = 100_000, ttl: float | None = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict: Callable[[List[str]], None] | None = None # called with the keys set_many evicted
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed)")
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """ Return the cached values for the keys that are present (and not expired) """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+
+        now = time.time()
+        found = {}
+        with self._lock:
+            # sqlite limits the number of bound parameters, query in chunks
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created FROM {self.table} WHERE key IN ({marks})", chunk
+                ).fetchall()
+                for key, value, created in rows:
+                    if self.ttl is not None and now - created > self.ttl:
+                        continue
+                    found[key] = value
+
+            if found:
+                self._conn.executemany(
+                    f"UPDATE {self.table} SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+        return found
+
+    def get(self, key: str) -> bytes | None:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: Dict[str, bytes]):
+        """ Insert / overwrite entries and evict the least recently used ones past max_entries """
+        if not items:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                [(key, value, now, now) for key, value in items.items()],
+            )
+            self._evict()
+            self._conn.execute("COMMIT")
+
+    def set(self, key: str, value: bytes):
+        self.set_many({key: value})
+
+    def items(self) -> List[Tuple[str, bytes]]:
+        """ Every live (key, value) pair, oldest first """
+        cutoff = time.time() - self.ttl if self.ttl is not None else float("-inf")
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT key, value FROM {self.table} WHERE created >= ? ORDER BY created", (cutoff,)
+            ).fetchall()
+
+    def delete(self, keys: List[str]):
+        with self._lock:
+            self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _evict(self):
+        # drop expired entries first, then the least recently used ones over the bound
+        evicted = []
+        if self.ttl is not None:
+            evicted += [row[0] for row in self._conn.execute(
+                f"DELETE FROM {self.table} WHERE created < ? RETURNING key", (time.time() - self.ttl,)
+            ).fetchall()]
+
+        count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if count > self.max_entries:
+            evicted += [row[0] for row in self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed ASC LIMIT ?) RETURNING key",
+                (count - self.max_entries,),
+            ).fetchall()]
+
+        if evicted and self.on_evict is not None:
+            self.on_evict(evicted)
+
+
+class SemanticIndex:
+    """ Normalized embeddings by key in a preallocated matrix that doubles when full, thread safe """
+
+    def __init__(self, capacity: int = 64):
+        self.keys: List[str] = [] # row -> key
+        self._rows: Dict[str, int] = {}
+        self._matrix: np.ndarray | None = None
+        self._capacity = max(1, capacity)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str, vector: np.ndarray) -> bool:
+        """ Index (or re-index) a key, False when the vector has another dimension than the indexed ones """
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / np.linalg.norm(vector)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.empty((self._capacity, vector.shape[0]), dtype=np.float32)
+            elif vector.shape[0] != self._matrix.shape[1]:
+                return False # embedded with a different model
+            row = self._rows.get(key)
+            if row is None:
+                row = len(self.keys)
+                if row == self._matrix.shape[0]:
+                    grown = np.empty((2 * row, self._matrix.shape[1]), dtype=np.float32)
+                    grown[:row] = self._matrix
+                    self._matrix = grown
+                self.keys.append(key)
+                self._rows[key] = row
+            self._matrix[row] = vector
+            return True
+
+    def remove(self, keys: Iterable[str]):
+        """ Forget keys, the last row moves into each freed one """
+        with self._lock:
+            for key in keys:
+                row = self._rows.pop(key, None)
+                if row is None:
+                    continue
+                last = len(self.keys) - 1
+                if row != last:
+                    self.keys[row] = self.keys[last]
+                    self._rows[self.keys[row]] = row
+                    self._matrix[row] = self._matrix[last]
+                self.keys.pop()
+
+    def clear(self):
+        with self._lock:
+            self.keys, self._rows, self._matrix = [], {}, None
+
+    def nearest(self, vector: np.ndarray) -> Tuple[str, float] | None:
+        """ The key most similar to the vector and its cosine similarity """
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if not self.keys or vector.shape[0] != self._matrix.shape[1]:
+                return None
+            scores = self._matrix[:len(self.keys)] @ (vector / np.linalg.norm(vector))
+            best = int(np.argmax(scores))
+            return self.keys[best], float(scores[best])
@@ -0,0 +1,72 @@
+"""
+Bounded event channel between an agent run and the SSE writer of one client.
+The agent blocks on publish while the channel is full (backpressure), except that with the
+"drop_debug" policy debug_* events are dropped first so a slow client never stalls the run on
+token noise. close() appends an end sentinel, so the reader stops as soon as the run finishes.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any
+
+_END = object()
+
+
+class EventChannel:
+    """ Bounded, sentinel-terminated async event queue """
+
+    def __init__(self, maxsize: int = 256, policy: str = "drop_debug"):
+        if policy not in ("block", "drop_debug"):
+            raise ValueError(f"unknown slow consumer policy: {policy}")
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self._buffer = deque() # (event, debug)
+        self._cond = asyncio.Condition()
+
+    def _drop_oldest_debug(self) -> bool:
+        for i, (_, debug) in enumerate(self._buffer):
+            if debug:
+                del self._buffer[i]
+                self.dropped += 1
+                return True
+        return False
+
+    async def publish(self, event: Any, debug: bool = False):
+        """ Queue an event, waiting for room while the reader is behind """
+        async with self._cond:
+            while len(self._buffer) >= self.maxsize and not self.closed:
+                if self.policy == "drop_debug":
+                    if debug:
+                        self.dropped += 1
+                        return
+                    if self._drop_oldest_debug():
+                        break
+                await self._cond.wait()
+
+            if self.closed:
+                return
+            self._buffer.append((event, debug))
+            self._cond.notify_all()
+
+    async def close(self):
+        """ Mark the end of the stream, never waits for room """
+        async with self._cond:
+            if not self.closed:
+                self.closed = True
+                self._buffer.append((_END, False))
+                self._cond.notify_all()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        async with self._cond:
+            while not self._buffer:
+                await self._cond.wait()
+            event, _ = self._buffer.popleft()
+            self._cond.notify_all()
+        if event is _END:
+            raise StopAsyncIteration
+        return event
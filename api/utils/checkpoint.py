@@ -0,0 +1,363 @@
+"""
+Durable graph checkpoints backed by SQLite.
+The compiled agent saves its state after every node, so a run that dies mid-loop (worker
+restart, --reload, an exception in a node) resumes from the last completed node instead of
+paying for every planner, search and reflection call again.
+
+Only the latest CHECKPOINT_KEEP checkpoints of a run are kept, runs that completed, were
+stopped by the user or failed again after CHECKPOINT_MAX_RESUMES resumes are deleted by the
+job manager, and unfinished runs expire after CHECKPOINT_TTL seconds or once more than
+CHECKPOINT_MAX_THREADS of them are on disk.
+The event publisher is passed through the run config, never through the state, so nothing
+that cannot be serialized ends up in a checkpoint.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Sequence, Tuple
+
+import anyio
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP, BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple,
+    get_checkpoint_id, get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from utils.config import CACHE_DIR, CHECKPOINT_KEEP, CHECKPOINT_TTL, CHECKPOINT_MAX_THREADS
+from utils.papers import PaperRegistry
+
+
+class StateSerializer(JsonPlusSerializer):
+    """ msgpack serializer that also knows the paper registry, alone (a channel value) or inside a whole state (the graph input) """
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        if isinstance(obj, PaperRegistry):
+            return "registry", super().dumps_typed(obj.to_dict())[1]
+        if isinstance(obj, dict) and any(isinstance(value, PaperRegistry) for value in obj.values()):
+            registries = [key for key, value in obj.items() if isinstance(value, PaperRegistry)]
+            state = {key: value.to_dict() if key in registries else value for key, value in obj.items()}
+            return "state", super().dumps_typed({"registries": registries, "state": state})[1]
+        return super().dumps_typed(obj)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        if data[0] == "registry":
+            return PaperRegistry.from_dict(super().loads_typed(("msgpack", data[1])))
+        if data[0] == "state":
+            data = super().loads_typed(("msgpack", data[1]))
+            return {key: PaperRegistry.from_dict(value) if key in data["registries"] else value for key, value in data["state"].items()}
+        return super().loads_typed(data)
+
+
+class SqliteCheckpointer(BaseCheckpointSaver[int]):
+    """ Thread safe checkpoint store, channel values are stored once per version like InMemorySaver """
+
+    def __init__(self, path: str, keep: int = 2, ttl: float | None = None, max_threads: int = 200):
+        super().__init__(serde=StateSerializer())
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.keep = max(1, keep)
+        self.ttl = ttl
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        self._last_expire = 0.0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "thread_id TEXT, ns TEXT, checkpoint_id TEXT, parent_id TEXT, run_key TEXT, created REAL NOT NULL, "
+            "type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, "
+            "PRIMARY KEY (thread_id, ns, checkpoint_id));"
+            "CREATE INDEX IF NOT EXISTS checkpoints_run_key ON checkpoints(run_key, created);"
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "thread_id TEXT, ns TEXT, channel TEXT, version TEXT, type TEXT, value BLOB, "
+            "PRIMARY KEY (thread_id, ns, channel, version));"
+            "CREATE TABLE IF NOT EXISTS writes ("
+            "thread_id TEXT, ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER, channel TEXT, type TEXT, value BLOB, task_path TEXT, "
+            "PRIMARY KEY (thread_id, ns, checkpoint_id, task_id, idx));"
+            "CREATE TABLE IF NOT EXISTS failures (thread_id TEXT PRIMARY KEY, count INTEGER NOT NULL);"
+        )
+        self.expire()
+
+    # reading
+
+    def _tuple(self, thread_id: str, ns: str, row: Tuple) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint))
+
+        values = {}
+        for channel, version in checkpoint["channel_versions"].items():
+            blob = self._conn.execute(
+                "SELECT type, value FROM blobs WHERE thread_id = ? AND ns = ? AND channel = ? AND version = ?",
+                (thread_id, ns, channel, str(version)),
+            ).fetchone()
+            if blob is not None and blob[0] != "empty":
+                values[channel] = self.serde.loads_typed(blob)
+
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, ns, checkpoint_id),
+        ).fetchall()
+
+        def config(cid: str) -> RunnableConfig:
+            return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": cid}}
+
+        return CheckpointTuple(
+            config=config(checkpoint_id),
+            checkpoint={**checkpoint, "channel_values": values},
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=config(parent_id) if parent_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        """ The checkpoint named in the config, or the latest checkpoint of its thread """
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND ns = ? AND checkpoint_id = ?",
+                    (thread_id, ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, ns),
+                ).fetchone()
+            return self._tuple(thread_id, ns, row) if row else None
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: Dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        """ Checkpoints newest first, optionally of one thread, before a checkpoint or matching metadata """
+        query = "SELECT thread_id, ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints WHERE 1 = 1"
+        params: List[Any] = []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if (ns := config["configurable"].get("checkpoint_ns")) is not None:
+                query += " AND ns = ?"
+                params.append(ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_id)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            tuples = []
+            for thread_id, ns, *row in self._conn.execute(query, params).fetchall():
+                if limit is not None and len(tuples) >= limit:
+                    break
+                item = self._tuple(thread_id, ns, tuple(row))
+                if filter and any(item.metadata.get(key) != value for key, value in filter.items()):
+                    continue
+                tuples.append(item)
+        yield from tuples
+
+    def latest_thread(self, run_key: str) -> str | None:
+        """ Thread of the most recent unfinished run saved under run_key, if it has not expired """
+        cutoff = time.time() - self.ttl if self.ttl is not None else float("-inf")
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT thread_id FROM checkpoints WHERE run_key = ? AND created >= ? ORDER BY created DESC LIMIT 1",
+                (run_key, cutoff),
+            ).fetchone()
+        return row[0] if row else None
+
+    # writing
+
+    def put(
+        self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """ Save a checkpoint and the channel values that changed since the previous one """
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        run_key = config["configurable"].get("run_key")
+
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+        blobs = [
+            (thread_id, ns, channel, str(version), *(self.serde.dumps_typed(values[channel]) if channel in values else ("empty", b"")))
+            for channel, version in new_versions.items()
+        ]
+        type_, data = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_data = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blobs)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, ns, checkpoint["id"], parent_id, run_key, time.time(), type_, data, metadata_type, metadata_data),
+            )
+            self._prune(thread_id, ns)
+            self._conn.execute("COMMIT")
+
+        if time.time() - self._last_expire > 60:
+            self.expire()
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = ""):
+        """ Save the writes of a finished task, so a resumed run does not execute that task again """
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            rows.append((thread_id, ns, checkpoint_id, task_id, idx, channel, *self.serde.dumps_typed(value), task_path))
+
+        with self._lock:
+            # special writes (errors, interrupts) replace earlier ones, regular writes are kept once
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [row for row in rows if row[4] < 0]
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [row for row in rows if row[4] >= 0]
+            )
+
+    def record_failure(self, thread_id: str) -> int:
+        """ Count a failed resume of a thread, returns its failures so far """
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO failures VALUES (?, 1) ON CONFLICT(thread_id) DO UPDATE SET count = count + 1", (thread_id,)
+            )
+            return self._conn.execute("SELECT count FROM failures WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._delete_threads([thread_id])
+            self._conn.execute("COMMIT")
+
+    def delete_run(self, run_key: str) -> int:
+        """ Delete every unfinished run saved under run_key, returns how many were deleted """
+        with self._lock:
+            threads = [row[0] for row in self._conn.execute("SELECT DISTINCT thread_id FROM checkpoints WHERE run_key = ?", (run_key,))]
+            self._conn.execute("BEGIN")
+            self._delete_threads(threads)
+            self._conn.execute("COMMIT")
+        return len(threads)
+
+    # retention
+
+    def _delete_threads(self, thread_ids: List[str]):
+        for table in ("checkpoints", "blobs", "writes", "failures"):
+            self._conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", [(thread_id,) for thread_id in thread_ids])
+
+    def _prune(self, thread_id: str, ns: str):
+        # a run resumes from its latest checkpoint, older ones (and values only they point to) can go
+        old = [
+            row[0] for row in self._conn.execute(
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND ns = ? ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+                (thread_id, ns, self.keep),
+            ).fetchall()
+        ]
+        if not old:
+            return
+
+        for table in ("checkpoints", "writes"):
+            self._conn.executemany(
+                f"DELETE FROM {table} WHERE thread_id = ? AND ns = ? AND checkpoint_id = ?", [(thread_id, ns, cid) for cid in old]
+            )
+
+        referenced = set()
+        for type_, data in self._conn.execute(
+            "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND ns = ?", (thread_id, ns)
+        ).fetchall():
+            referenced.update((channel, str(version)) for channel, version in self.serde.loads_typed((type_, data))["channel_versions"].items())
+        stale = [
+            (thread_id, ns, channel, version)
+            for channel, version in self._conn.execute("SELECT channel, version FROM blobs WHERE thread_id = ? AND ns = ?", (thread_id, ns)).fetchall()
+            if (channel, version) not in referenced
+        ]
+        self._conn.executemany("DELETE FROM blobs WHERE thread_id = ? AND ns = ? AND channel = ? AND version = ?", stale)
+
+    def expire(self) -> int:
+        """ Drop unfinished runs older than the TTL, then the oldest ones past max_threads; returns how many were dropped """
+        with self._lock:
+            self._last_expire = time.time()
+            threads = self._conn.execute(
+                "SELECT thread_id, MAX(created) AS last FROM checkpoints GROUP BY thread_id ORDER BY last DESC"
+            ).fetchall()
+            cutoff = time.time() - self.ttl if self.ttl is not None else float("-inf")
+            drop = [thread_id for n, (thread_id, last) in enumerate(threads) if last < cutoff or n >= self.max_threads]
+            if drop:
+                self._conn.execute("BEGIN")
+                self._delete_threads(drop)
+                self._conn.execute("COMMIT")
+        if drop:
+            print(f">> EXPIRED {len(drop)} CHECKPOINTED RUNS")
+        return len(drop)
+
+    def info(self) -> Dict:
+        with self._lock:
+            threads, checkpoints = self._conn.execute("SELECT COUNT(DISTINCT thread_id), COUNT(*) FROM checkpoints").fetchone()
+            blobs = self._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        return {"threads": threads, "checkpoints": checkpoints, "blobs": blobs}
+
+    # the graph runs async, sqlite calls go to worker threads
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await anyio.to_thread.run_sync(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: Dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        tuples = await anyio.to_thread.run_sync(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in tuples:
+            yield item
+
+    async def aput(
+        self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await anyio.to_thread.run_sync(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = ""):
+        await anyio.to_thread.run_sync(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str):
+        await anyio.to_thread.run_sync(self.delete_thread, thread_id)
+
+    async def alatest_thread(self, run_key: str) -> str | None:
+        return await anyio.to_thread.run_sync(self.latest_thread, run_key)
+
+    async def arecord_failure(self, thread_id: str) -> int:
+        return await anyio.to_thread.run_sync(self.record_failure, thread_id)
+
+    async def adelete_run(self, run_key: str) -> int:
+        return await anyio.to_thread.run_sync(self.delete_run, run_key)
+
+
+_checkpointer: SqliteCheckpointer | None = None
+
+
+def get_checkpointer() -> SqliteCheckpointer:
+    """ Process wide checkpoint store, opened on first use """
+    global _checkpointer
+    if _checkpointer is None:
+        _checkpointer = SqliteCheckpointer(
+            os.path.join(CACHE_DIR, "checkpoints.sqlite"), CHECKPOINT_KEEP, CHECKPOINT_TTL, CHECKPOINT_MAX_THREADS,
+        )
+    return _checkpointer
@@ -0,0 +1,144 @@
+"""
+Runtime configuration for the Research Agent.
+Every setting can be overridden through an environment variable (or the .env file).
+"""
+
+import os
+from typing import Tuple
+
+from dotenv import load_dotenv
+
+# load api keys and overrides before reading any setting
+load_dotenv()
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def _bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# directory for every on-disk cache / index
+CACHE_DIR = os.getenv("RA_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), ".cache"))
+
+# embeddings
+EMBEDDING_MODEL = os.getenv("RA_EMBEDDING_MODEL", "text-embedding-004")
+EMBED_BATCH_SIZE = _int("RA_EMBED_BATCH_SIZE", 64) # texts per embed_documents call
+EMBED_CONCURRENCY = _int("RA_EMBED_CONCURRENCY", 2) # batches in flight at once
+EMBED_CACHE_MAX_ENTRIES = _int("RA_EMBED_CACHE_MAX_ENTRIES", 200_000) # LRU bound of the embedding cache
+
+# arxiv api
+ARXIV_BASE_URL = os.getenv("RA_ARXIV_BASE_URL", "http://export.arxiv.org/api/query?")
+ARXIV_RATE = _float("RA_ARXIV_RATE", 1 / 3) # requests per second shared by the whole process
+ARXIV_BURST = _int("RA_ARXIV_BURST", 1) # requests allowed back to back before the rate applies
+ARXIV_MAX_PARALLEL = _int("RA_ARXIV_MAX_PARALLEL", 4) # fetches in flight at once
+ARXIV_MAX_CONNECTIONS = _int("RA_ARXIV_MAX_CONNECTIONS", 8) # keep-alive pool size
+ARXIV_TIMEOUT = _float("RA_ARXIV_TIMEOUT", 30.0) # seconds
+
+# arxiv response cache
+ARXIV_CACHE_TTL = _float("RA_ARXIV_CACHE_TTL", 24 * 3600) # seconds a cached response stays valid
+ARXIV_CACHE_MAX_ENTRIES = _int("RA_ARXIV_CACHE_MAX_ENTRIES", 20_000) # LRU bound of the response cache
+ARXIV_REPLAY_ONLY = _bool("RA_ARXIV_REPLAY_ONLY", False) # serve exclusively from the cache (no network)
+
+# startup
+WARMUP = _bool("RA_WARMUP", True) # create the models in the background at startup instead of on the first request
+
+# llm
+LLM_MODEL = os.getenv("RA_LLM_MODEL", "gemini-2.5-flash") # chat model used by every stage unless overridden
+LLM_TEMPERATURE = _float("RA_LLM_TEMPERATURE", 0)
+
+
+# stages that call the llm, each can use its own model
+LLM_STAGES = ("planner", "search_arxiv", "reflection", "summarize")
+
+
+def stage_llm(stage: str) -> Tuple[str, float]:
+    """ (model, temperature) of a stage, RA_LLM_MODEL_<STAGE> / RA_LLM_TEMPERATURE_<STAGE> override the defaults """
+    return os.getenv(f"RA_LLM_MODEL_{stage.upper()}", LLM_MODEL), _float(f"RA_LLM_TEMPERATURE_{stage.upper()}", LLM_TEMPERATURE)
+
+
+# graph
+SEARCH_MAX_PARALLEL = _int("RA_SEARCH_MAX_PARALLEL", 5) # plan steps searched at once
+PLANNER_EARLY_SEARCH = _bool("RA_PLANNER_EARLY_SEARCH", True) # search each plan step as soon as the planner has streamed it
+
+# hybrid retrieval
+RETRIEVAL_STREAMING = _bool("RA_RETRIEVAL_STREAMING", True) # embed and score papers as each arxiv feed arrives
+RETRIEVAL_LEXICAL_TOP_N = _int("RA_RETRIEVAL_LEXICAL_TOP_N", 30) # BM25 candidates embedded per retrieval
+RETRIEVAL_DENSE_WEIGHT = _float("RA_RETRIEVAL_DENSE_WEIGHT", 0.7) # weight of cosine similarity vs scaled BM25 in the fused score
+RETRIEVAL_TOP_K = _int("RA_RETRIEVAL_TOP_K", 10) # papers selected per retrieval at most
+RETRIEVAL_MIN_K = _int("RA_RETRIEVAL_MIN_K", 3) # papers selected before the score gap cutoff applies
+RETRIEVAL_SCORE_GAP = _float("RA_RETRIEVAL_SCORE_GAP", 0.08) # stop at the first fused score drop larger than this (0 = off)
+
+# local long-term vector index
+LOCAL_INDEX_ENABLED = _bool("RA_LOCAL_INDEX_ENABLED", True)
+LOCAL_INDEX_TOP_K = _int("RA_LOCAL_INDEX_TOP_K", 10) # local papers considered per search
+LOCAL_INDEX_MIN_SCORE = _float("RA_LOCAL_INDEX_MIN_SCORE", 0.6) # similarity for a local paper to join retrieval
+LOCAL_COVERAGE_THRESHOLD = _float("RA_LOCAL_COVERAGE_THRESHOLD", 0.8) # similarity that counts as "covered"
+LOCAL_COVERAGE_MIN_HITS = _int("RA_LOCAL_COVERAGE_MIN_HITS", 5) # covered papers needed to skip arxiv for a plan step
+
+# context packing for the reflection and summarize prompts
+CONTEXT_BUDGET_REFLECTION = _int("RA_CONTEXT_BUDGET_REFLECTION", 6_000) # tokens of paper text in the reflection prompt
+CONTEXT_BUDGET_SUMMARIZE = _int("RA_CONTEXT_BUDGET_SUMMARIZE", 12_000) # tokens of paper text in the summarize prompt
+CONTEXT_MMR_LAMBDA = _float("RA_CONTEXT_MMR_LAMBDA", 0.7) # 1 = rank by relevance only, lower favours diverse papers
+CONTEXT_MAX_PAPER_TOKENS = _int("RA_CONTEXT_MAX_PAPER_TOKENS", 400) # longer abstracts are cut at a sentence boundary
+CONTEXT_MIN_PAPER_TOKENS = _int("RA_CONTEXT_MIN_PAPER_TOKENS", 60) # papers are dropped rather than cut below this
+
+# llm response cache
+LLM_CACHE_ENABLED = _bool("RA_LLM_CACHE_ENABLED", True)
+LLM_CACHE_TTL = _float("RA_LLM_CACHE_TTL", 7 * 24 * 3600) # seconds a cached response stays valid
+LLM_CACHE_MAX_ENTRIES = _int("RA_LLM_CACHE_MAX_ENTRIES", 10_000) # LRU bound of the exact prompt cache
+LLM_CACHE_SEMANTIC = _bool("RA_LLM_CACHE_SEMANTIC", False) # reuse plans of near-duplicate user queries
+LLM_CACHE_SEMANTIC_THRESHOLD = _float("RA_LLM_CACHE_SEMANTIC_THRESHOLD", 0.95) # query similarity that counts as a duplicate
+LLM_CACHE_SEMANTIC_MAX_ENTRIES = _int("RA_LLM_CACHE_SEMANTIC_MAX_ENTRIES", 2_000)
+
+# streaming
+STREAM_COALESCE_MS = _float("RA_STREAM_COALESCE_MS", 50) # flush buffered llm tokens at most this often (0 = every token)
+STREAM_COALESCE_BYTES = _int("RA_STREAM_COALESCE_BYTES", 512) # ... or once this many characters are buffered
+EVENT_QUEUE_SIZE = _int("RA_EVENT_QUEUE_SIZE", 256) # events buffered per streaming client before the agent is throttled
+EVENT_SLOW_CONSUMER_POLICY = os.getenv("RA_EVENT_SLOW_CONSUMER_POLICY", "drop_debug") # "drop_debug" or "block"
+
+# jobs
+JOB_WORKERS = _int("RA_JOB_WORKERS", 4) # agent runs executing at once
+JOB_MAX_QUEUED = _int("RA_JOB_MAX_QUEUED", 16) # jobs waiting for a worker before new ones are rejected with 429
+JOB_EVENT_BUFFER = _int("RA_JOB_EVENT_BUFFER", 4096) # events kept per job for clients that attach late or resume
+JOB_TTL = _float("RA_JOB_TTL", 3600) # seconds a finished job stays retrievable
+
+# final result cache
+RESULT_CACHE_ENABLED = _bool("RA_RESULT_CACHE_ENABLED", True)
+RESULT_CACHE_TTL = _float("RA_RESULT_CACHE_TTL", 24 * 3600) # seconds a cached final state is served
+RESULT_CACHE_MAX_ENTRIES = _int("RA_RESULT_CACHE_MAX_ENTRIES", 1_000)
+RESULT_CACHE_SEMANTIC = _bool("RA_RESULT_CACHE_SEMANTIC", False) # also answer near-duplicate queries from the cache
+RESULT_CACHE_SEMANTIC_THRESHOLD = _float("RA_RESULT_CACHE_SEMANTIC_THRESHOLD", 0.95) # query similarity that counts as a duplicate
+RESULT_CACHE_REFRESH_AFTER = _float("RA_RESULT_CACHE_REFRESH_AFTER", 0) # serve older hits but re-run them in the background (0 = never)
+ADMIN_TOKEN = os.getenv("RA_ADMIN_TOKEN", "") # required in X-Admin-Token by the /admin endpoints, unset: they are disabled
+
+# graph checkpoints
+CHECKPOINT_ENABLED = _bool("RA_CHECKPOINT_ENABLED", True) # persist the graph state after every node so failed runs resume
+CHECKPOINT_KEEP = _int("RA_CHECKPOINT_KEEP", 2) # checkpoints kept per run, older ones are pruned
+CHECKPOINT_TTL = _float("RA_CHECKPOINT_TTL", 24 * 3600) # seconds an unfinished run can still be resumed
+CHECKPOINT_MAX_THREADS = _int("RA_CHECKPOINT_MAX_THREADS", 200) # unfinished runs kept on disk, oldest are dropped first
+CHECKPOINT_MAX_RESUMES = _int("RA_CHECKPOINT_MAX_RESUMES", 2) # failed resumes after which a run starts over
+
+# full-text mode
+FULLTEXT_ENABLED = _bool("RA_FULLTEXT_ENABLED", False) # rank papers by their best matching PDF chunk and pass excerpts to the LLM
+FULLTEXT_MAX_PAPERS = _int("RA_FULLTEXT_MAX_PAPERS", 8) # best ranked papers whose PDFs are read per retrieval
+FULLTEXT_MAX_PARALLEL = _int("RA_FULLTEXT_MAX_PARALLEL", 4) # PDF downloads in flight
+FULLTEXT_RATE = _float("RA_FULLTEXT_RATE", ARXIV_RATE) # PDF downloads per second, shared by all runs (arxiv.org limits them too)
+FULLTEXT_BURST = _int("RA_FULLTEXT_BURST", ARXIV_BURST)
+FULLTEXT_WORKERS = _int("RA_FULLTEXT_WORKERS", min(4, os.cpu_count() or 1)) # text extraction processes
+FULLTEXT_TIMEOUT = _float("RA_FULLTEXT_TIMEOUT", 60)
+FULLTEXT_MAX_PDF_MB = _float("RA_FULLTEXT_MAX_PDF_MB", 20) # larger PDFs are skipped
+FULLTEXT_MAX_PAGES = _int("RA_FULLTEXT_MAX_PAGES", 30) # pages read per PDF
+FULLTEXT_CHUNK_WORDS = _int("RA_FULLTEXT_CHUNK_WORDS", 200)
+FULLTEXT_CHUNK_OVERLAP = _int("RA_FULLTEXT_CHUNK_OVERLAP", 40) # words shared by consecutive chunks
+FULLTEXT_MAX_CHUNKS = _int("RA_FULLTEXT_MAX_CHUNKS", 80) # chunks kept per paper, extraction stops there
+FULLTEXT_PASSAGES = _int("RA_FULLTEXT_PASSAGES", 3) # best chunks per paper passed to reflection and summarize
+FULLTEXT_MAX_PAPER_TOKENS = _int("RA_FULLTEXT_MAX_PAPER_TOKENS", 1000) # per-paper context budget when excerpts are attached
+FULLTEXT_PDF_CACHE_MB = _float("RA_FULLTEXT_PDF_CACHE_MB", 500) # downloaded PDFs kept on disk, least recently used are removed
+FULLTEXT_CHUNK_CACHE_MAX_ENTRIES = _int("RA_FULLTEXT_CHUNK_CACHE_MAX_ENTRIES", 10_000) # papers whose extracted chunks are cached
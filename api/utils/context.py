@@ -0,0 +1,95 @@
+"""
+Token-budgeted context packing for the reflection and summarize prompts.
+Papers are picked by maximal marginal relevance (similarity to the query, penalized by
+similarity to papers already picked), abstracts are cut at sentence boundaries, and papers
+stop being added once the budget is spent, so the prompt stays bounded however many papers
+were retrieved. The report lists what was truncated and what was dropped.
+"""
+
+import math
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from utils.papers import Paper, paper_content
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """ Rough token count, ~4 characters per token """
+    return math.ceil(len(text) / 4)
+
+
+def truncate_summary(paper: Paper, max_tokens: int) -> Tuple[str, bool]:
+    """ paper_content with the summary cut to whole sentences so it fits max_tokens, and whether it was cut """
+    full = paper_content(paper)
+    if estimate_tokens(full) <= max_tokens:
+        return full, False
+
+    summary = " ".join(paper.summary.split())
+    overhead = estimate_tokens(paper_content(paper, "")) + 1
+    room = max(0, (max_tokens - overhead) * 4 - 4) # leave space for the truncation marker
+
+    kept = ""
+    for sentence in _SENTENCE_END.split(summary):
+        candidate = f"{kept} {sentence}".strip()
+        if len(candidate) > room:
+            break
+        kept = candidate
+    if not kept:
+        # first sentence alone is too long, cut at a word boundary
+        kept = summary[:room].rsplit(" ", 1)[0]
+    return paper_content(paper, kept + " […]"), True
+
+
+def pack_papers(
+    papers: List[Paper],
+    scores: List[float],
+    embeddings: np.ndarray | None,
+    budget: int,
+    mmr_lambda: float = 0.7,
+    max_paper_tokens: int = 400,
+    min_paper_tokens: int = 60,
+) -> Tuple[List[str], Dict]:
+    """
+    Select and truncate papers to fit `budget` tokens, best first.
+    embeddings: normalized paper embeddings (one row per paper) for the diversity term, None to rank by score only
+    Returns the packed paper texts and a report of what was kept, truncated and dropped.
+    """
+    remaining = list(range(len(papers)))
+    max_sim = np.zeros(len(papers))
+    packed, truncated, dropped = [], [], []
+    used = 0
+
+    while remaining:
+        # maximal marginal relevance: relevant, but not a near copy of what is already packed
+        mmr = [mmr_lambda * scores[i] - (1 - mmr_lambda) * max_sim[i] for i in remaining]
+        i = remaining.pop(int(np.argmax(mmr)))
+
+        room = min(max_paper_tokens, budget - used)
+        if room < min_paper_tokens:
+            dropped.append(i)
+            continue
+
+        text, cut = truncate_summary(papers[i], room)
+        packed.append(text)
+        used += estimate_tokens(text) + 1
+        if cut:
+            truncated.append(i)
+        if embeddings is not None:
+            max_sim = np.maximum(max_sim, embeddings @ embeddings[i])
+
+    def describe(i: int) -> Dict:
+        return {"arxiv_id": papers[i].arxiv_id, "title": papers[i].title, "score": round(float(scores[i]), 4)}
+
+    report = {
+        "budget_tokens": budget,
+        "used_tokens": used,
+        "papers": len(papers),
+        "packed": len(packed),
+        "truncated": [describe(i) for i in truncated],
+        "dropped": [describe(i) for i in dropped],
+    }
+    return packed, report
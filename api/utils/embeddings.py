@@ -0,0 +1,97 @@
+"""
+Batched, cached embedding helpers.
+Texts are embedded with embed_documents in batches (a bounded number of batches in flight),
+and every vector is cached on disk keyed by a hash of its content so abstracts seen in
+previous loop iterations or previous requests are never embedded twice.
+"""
+
+import hashlib
+import os
+from typing import List
+
+import anyio
+import numpy as np
+
+from utils.cache import SqliteLRUCache
+from utils.config import CACHE_DIR, EMBEDDING_MODEL, EMBED_BATCH_SIZE, EMBED_CONCURRENCY, EMBED_CACHE_MAX_ENTRIES
+from utils.metrics import EMBEDDING_CALLS, EMBEDDING_TEXTS
+
+_cache: SqliteLRUCache | None = None
+
+
+def get_embedding_cache() -> SqliteLRUCache:
+    """ Process wide embedding cache, created on first use """
+    global _cache
+    if _cache is None:
+        _cache = SqliteLRUCache(
+            os.path.join(CACHE_DIR, "embeddings.sqlite"),
+            table="embeddings",
+            max_entries=EMBED_CACHE_MAX_ENTRIES,
+        )
+    return _cache
+
+
+def _key(embeddings, kind: str, text: str) -> str:
+    # the model and the task type (query / document) change the vector, so both are part of the key
+    model = getattr(embeddings, "model", EMBEDDING_MODEL)
+    return hashlib.sha256(f"{model}\x00{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+
+async def embed_documents(embeddings, texts: List[str], batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY) -> np.ndarray:
+    """ Return a (len(texts), dim) float32 matrix, embedding only the texts missing from the cache """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    cache = get_embedding_cache()
+    keys = [_key(embeddings, "document", text) for text in texts]
+    cached = await anyio.to_thread.run_sync(cache.get_many, keys)
+
+    # unique texts that still need an embedding call
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+
+    print(f">> EMBEDDINGS: {len(texts) - len(missing)} CACHED, {len(missing)} TO EMBED")
+    EMBEDDING_TEXTS.inc(len(texts) - len(missing), result="hit")
+    EMBEDDING_TEXTS.inc(len(missing), result="miss")
+
+    if missing:
+        missing_keys = list(missing)
+        batches = [missing_keys[i:i + batch_size] for i in range(0, len(missing_keys), batch_size)]
+        limiter = anyio.CapacityLimiter(max(1, concurrency))
+        fresh = {}
+
+        async def run_batch(batch: List[str]):
+            EMBEDDING_CALLS.inc(kind="document")
+            # embed_documents is blocking → run in thread, bounded by the limiter
+            vectors = await anyio.to_thread.run_sync(
+                embeddings.embed_documents, [missing[key] for key in batch], limiter=limiter
+            )
+            for key, vector in zip(batch, vectors):
+                fresh[key] = np.asarray(vector, dtype=np.float32).tobytes()
+
+        async with anyio.create_task_group() as tg:
+            for batch in batches:
+                tg.start_soon(run_batch, batch)
+
+        await anyio.to_thread.run_sync(cache.set_many, fresh)
+        cached.update(fresh)
+
+    return np.stack([np.frombuffer(cached[key], dtype=np.float32) for key in keys])
+
+
+async def embed_query(embeddings, text: str) -> np.ndarray:
+    """ Return the float32 query embedding for text, served from the cache when possible """
+    cache = get_embedding_cache()
+    key = _key(embeddings, "query", text)
+
+    value = await anyio.to_thread.run_sync(cache.get, key)
+    EMBEDDING_TEXTS.inc(result="hit" if value is not None else "miss")
+    if value is None:
+        EMBEDDING_CALLS.inc(kind="query")
+        vector = await anyio.to_thread.run_sync(embeddings.embed_query, text)
+        value = np.asarray(vector, dtype=np.float32).tobytes()
+        await anyio.to_thread.run_sync(cache.set, key, value)
+
+    return np.frombuffer(value, dtype=np.float32)
@@ -64,15 +64,41 @@ def format_search_queries(queries_dict: List[Dict[str, Any]], results: int) -> s
     return text
 
 
-def format_retrieval_stats(total_docs: int, selected_docs: int, threshold: float) -> str:
+def format_retrieval_stats(total_docs: int, selected_docs: int, threshold: float, embedded_docs: int | None = None) -> str:
     """Return Markdown summarizing retrieval stats."""
-    return (
+    text = (
         "\n#### 📄 Relevance Filtering\n"
         f"- **Total retrieved:** {total_docs}\n"
-        f"- **Selected (above threshold):** {selected_docs}\n"
-        f"- **Threshold:** {threshold:.4f}\n"
     )
+    if embedded_docs is not None:
+        text += f"- **Ranked (lexical prefilter):** {embedded_docs}\n"
+    return text + (
+        f"- **Selected:** {selected_docs}\n"
+        f"- **Cutoff score:** {threshold:.4f}\n"
+    )
+
 
+def format_fulltext_stats(requested: int, read: int, chunks: int) -> str:
+    """Return Markdown summarizing the full-text reading of the best papers."""
+    return (
+        "\n#### 📑 Full Text\n"
+        f"- **PDFs read:** {read} / {requested}\n"
+        f"- **Chunks ranked:** {chunks}\n"
+    )
+
+
+def format_context_report(report: Dict[str, Any]) -> str:
+    """Return Markdown listing the papers left out of (or shortened in) a token-budgeted prompt."""
+    text = (
+        "\n#### ✂️ Context Packing\n"
+        f"- **Papers used:** {report['packed']} / {report['papers']} "
+        f"(~{report['used_tokens']} of {report['budget_tokens']} tokens)\n"
+    )
+    if report["truncated"]:
+        text += f"- **Shortened:** {', '.join(paper['title'] for paper in report['truncated'])}\n"
+    if report["dropped"]:
+        text += f"- **Dropped:** {', '.join(paper['title'] for paper in report['dropped'])}\n"
+    return text
 
 # reflection
 def format_reflection(reflection_json: Dict[str, Any]) -> str:
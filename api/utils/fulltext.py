@@ -0,0 +1,226 @@
+"""
+Full-text mode (RA_FULLTEXT_ENABLED).
+The best ranked papers of a retrieval are read in full: PDFs are downloaded through one pooled
+client, behind a process wide token bucket like the API requests (RA_FULLTEXT_RATE), and kept
+in an on-disk cache bounded by size, text extraction and chunking run in a
+process pool (see pdf_text.py), and the chunks are embedded in batches through the cached
+embedding helpers. Papers are then ranked by their best matching chunk, and the best chunks
+are kept as passages for reflection and summarize.
+Extracted chunks are cached too, so a paper is downloaded and parsed at most once.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Dict, List, Tuple
+
+import anyio
+import httpx
+import numpy as np
+
+from setup import get_embeddings
+from utils.arxiv import TokenBucket
+from utils.cache import SqliteLRUCache
+from utils.config import (
+    CACHE_DIR, FULLTEXT_MAX_PARALLEL, FULLTEXT_RATE, FULLTEXT_BURST, FULLTEXT_WORKERS, FULLTEXT_TIMEOUT, FULLTEXT_MAX_PDF_MB, FULLTEXT_MAX_PAGES,
+    FULLTEXT_CHUNK_WORDS, FULLTEXT_CHUNK_OVERLAP, FULLTEXT_MAX_CHUNKS, FULLTEXT_PDF_CACHE_MB, FULLTEXT_CHUNK_CACHE_MAX_ENTRIES,
+)
+from utils.embeddings import embed_documents
+from utils.metrics import FULLTEXT_PAPERS, FULLTEXT_BYTES, FULLTEXT_EXTRACT_SECONDS
+from utils.papers import Paper
+from utils.pdf_text import extract_chunks
+
+PDF_DIR = os.path.join(CACHE_DIR, "pdfs")
+
+# process wide limiter for arxiv.org PDF downloads, cache hits do not use it
+rate_limiter = TokenBucket(FULLTEXT_RATE, FULLTEXT_BURST)
+
+# pooled client and download limit, bound to the event loop that created them
+_client: httpx.AsyncClient | None = None
+_semaphore: asyncio.Semaphore | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+_pool: ProcessPoolExecutor | None = None
+_cache: SqliteLRUCache | None = None
+
+
+def get_pdf_client() -> httpx.AsyncClient:
+    """ Return the shared keep-alive client for PDF downloads on the running event loop """
+    global _client, _semaphore, _loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=FULLTEXT_TIMEOUT,
+            limits=httpx.Limits(max_connections=FULLTEXT_MAX_PARALLEL, max_keepalive_connections=FULLTEXT_MAX_PARALLEL),
+            follow_redirects=True,
+        )
+        _semaphore = asyncio.Semaphore(max(1, FULLTEXT_MAX_PARALLEL))
+        _loop = loop
+    return _client
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """ Extraction workers, started on first use """
+    global _pool
+    if _pool is None:
+        # spawned, not forked: the server process runs threads
+        _pool = ProcessPoolExecutor(max_workers=max(1, FULLTEXT_WORKERS), mp_context=get_context("spawn"))
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+def get_chunk_cache() -> SqliteLRUCache:
+    global _cache
+    if _cache is None:
+        _cache = SqliteLRUCache(os.path.join(CACHE_DIR, "fulltext.sqlite"), table="chunks", max_entries=FULLTEXT_CHUNK_CACHE_MAX_ENTRIES)
+    return _cache
+
+
+async def close_fulltext():
+    """ Close the PDF client and stop the workers (called on server shutdown) """
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _reset_pool()
+
+
+def pdf_path(paper: Paper) -> str:
+    return os.path.join(PDF_DIR, hashlib.sha256(paper.arxiv_id.encode("utf-8")).hexdigest()[:32] + ".pdf")
+
+
+def evict_pdfs(max_bytes: float = FULLTEXT_PDF_CACHE_MB * 1024 * 1024):
+    """ Remove the least recently used PDFs until the cache fits max_bytes """
+    files = []
+    for entry in os.scandir(PDF_DIR):
+        if entry.name.endswith(".pdf"):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+
+async def download(paper: Paper) -> str:
+    """ Path of the paper's PDF, downloaded (streamed to disk, never held in memory) unless cached """
+    path = pdf_path(paper)
+    if os.path.exists(path):
+        os.utime(path) # mark as recently used
+        return path
+
+    os.makedirs(PDF_DIR, exist_ok=True)
+    partial = f"{path}.{uuid.uuid4().hex}.part"
+    max_bytes = FULLTEXT_MAX_PDF_MB * 1024 * 1024
+    try:
+        await rate_limiter.acquire()
+        async with get_pdf_client().stream("GET", paper.pdf_link) as response:
+            response.raise_for_status()
+            size = 0
+            async with await anyio.open_file(partial, "wb") as f:
+                async for data in response.aiter_bytes():
+                    size += len(data)
+                    if size > max_bytes:
+                        raise ValueError(f"PDF larger than {FULLTEXT_MAX_PDF_MB:g}MB")
+                    await f.write(data)
+        FULLTEXT_BYTES.inc(size)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    await anyio.to_thread.run_sync(evict_pdfs)
+    return path
+
+
+def _chunk_key(paper: Paper) -> str:
+    # the chunking settings change the chunks, so they are part of the key
+    settings = f"{FULLTEXT_MAX_PAGES}\x00{FULLTEXT_CHUNK_WORDS}\x00{FULLTEXT_CHUNK_OVERLAP}\x00{FULLTEXT_MAX_CHUNKS}"
+    return hashlib.sha256(f"{paper.arxiv_id}\x00{settings}".encode("utf-8")).hexdigest()
+
+
+async def paper_chunks(paper: Paper) -> List[str]:
+    """ Text chunks of a paper's PDF, from the chunk cache or downloaded and extracted """
+    cache = get_chunk_cache()
+    key = _chunk_key(paper)
+    cached = await anyio.to_thread.run_sync(cache.get, key)
+    if cached is not None:
+        FULLTEXT_PAPERS.inc(result="cached")
+        return json.loads(cached)
+
+    get_pdf_client()
+    async with _semaphore:
+        path = await download(paper)
+
+    start = time.perf_counter()
+    try:
+        chunks = await asyncio.get_running_loop().run_in_executor(
+            get_pool(), extract_chunks, path, FULLTEXT_MAX_PAGES, FULLTEXT_CHUNK_WORDS, FULLTEXT_CHUNK_OVERLAP, FULLTEXT_MAX_CHUNKS,
+        )
+    except BrokenProcessPool:
+        # a worker died (e.g. killed on a pathological PDF), the next call starts a fresh pool
+        _reset_pool()
+        raise
+    FULLTEXT_EXTRACT_SECONDS.observe(time.perf_counter() - start)
+    FULLTEXT_PAPERS.inc(result="extracted")
+
+    await anyio.to_thread.run_sync(cache.set, key, json.dumps(chunks).encode("utf-8"))
+    return chunks
+
+
+async def fetch_chunks(papers: List[Paper]) -> Dict[str, List[str]]:
+    """ Chunks of every paper whose PDF could be read, papers that fail are skipped """
+    results = await asyncio.gather(*(paper_chunks(paper) for paper in papers), return_exceptions=True)
+    chunks = {}
+    for paper, result in zip(papers, results):
+        if isinstance(result, BaseException):
+            FULLTEXT_PAPERS.inc(result="failed")
+            print(f">> COULD NOT READ THE PDF OF {paper.arxiv_id}: {result!r}")
+        elif result:
+            chunks[paper.arxiv_id] = result
+    return chunks
+
+
+async def rank_chunks(chunks: Dict[str, List[str]], query_emb: np.ndarray, passages: int) -> Dict[str, Tuple[float, List[str]]]:
+    """ Best chunk similarity to the (normalized) query and the best `passages` chunks of each paper """
+    flat = [(pid, text) for pid, texts in chunks.items() for text in texts]
+    if not flat:
+        return {}
+
+    vectors = await embed_documents(get_embeddings(), [text for _, text in flat])
+    scores = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)) @ query_emb
+
+    ranked: Dict[str, List[Tuple[float, str]]] = {}
+    for (pid, text), score in zip(flat, scores.tolist()):
+        ranked.setdefault(pid, []).append((score, text))
+
+    best = {}
+    for pid, items in ranked.items():
+        items.sort(key=lambda item: -item[0])
+        best[pid] = (items[0][0], [text for _, text in items[:passages]])
+    return best
+
+
+def with_passages(paper: Paper, passages: List[str] | None) -> Paper:
+    """ The paper with its best full-text passages appended to the abstract (the abstract is kept first when truncated) """
+    if not passages:
+        return paper
+    summary = paper.summary.strip() + "\nRelevant passages from the full text:\n" + "\n".join(f"[…] {text} […]" for text in passages)
+    return Paper(paper.arxiv_id, paper.title, paper.published, summary, paper.arxiv_link, paper.pdf_link)
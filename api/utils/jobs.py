@@ -0,0 +1,438 @@
+"""
+Job based agent runs.
+A submitted query becomes a job that runs in a bounded worker pool, independent of any HTTP
+connection. Every event of the run is appended to a per-job ring buffer with a sequential id,
+so clients can attach, detach and resume from `Last-Event-ID` without restarting the run.
+When the buffer is full the oldest debug_* (token) events are dropped first, so a late client
+only loses planner, search and reflection content once no debug events are left to drop.
+Finished jobs (and their final state) stay retrievable for JOB_TTL seconds.
+
+Clients that stream a run live (/query) read its tail through their own bounded EventChannel:
+the run waits while one of them is behind, except that debug events are dropped first under
+the default EVENT_SLOW_CONSUMER_POLICY. Resumable /jobs streams read the ring buffer and never
+hold the run back.
+
+Identical in-flight queries are coalesced (single flight): a query whose normalized text
+matches a running job subscribes to that job instead of starting a new run, and gets the
+buffered events replayed before the live tail. Queries answered by the result cache become
+jobs that are finished as soon as they are created.
+
+With checkpoints enabled every run is a graph thread saved after each node. A run that failed,
+lost its clients or was lost to a restart is resumed by the next job for the same normalized
+query, from its last completed node. A thread is deleted once its run completes, when the user
+stops the job, or when its resumes failed CHECKPOINT_MAX_RESUMES times; a job submitted with
+resume=False (or cache=False) deletes the older threads of its query and starts over.
+"""
+
+import asyncio
+import heapq
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Dict, List, Tuple
+
+import anyio
+
+from utils import metrics as metrics_registry
+from utils import result_cache
+from utils.channel import EventChannel
+from utils.metrics import QUERIES
+from utils.config import (
+    JOB_WORKERS, JOB_MAX_QUEUED, JOB_EVENT_BUFFER, JOB_TTL, RESULT_CACHE_ENABLED, RESULT_CACHE_REFRESH_AFTER, CHECKPOINT_MAX_RESUMES,
+    EVENT_QUEUE_SIZE, EVENT_SLOW_CONSUMER_POLICY,
+)
+from utils.result_cache import normalize_query
+from utils.state import initial_state, public_state
+
+
+class JobQueueFull(Exception):
+    """ Raised by submit when every worker is busy and the queue is full """
+
+
+def _error_message(error: BaseException) -> str:
+    """ Message of the exception that failed a run, without the exception groups of the nodes' task groups """
+    while isinstance(error, BaseExceptionGroup) and len(error.exceptions) == 1:
+        error = error.exceptions[0]
+    return str(error)
+
+
+def _is_debug(event: str | None, payload: Dict) -> bool:
+    """ Streamed llm tokens, the first events to drop for a slow or late client """
+    return event is None and str(payload.get("stage", "")).startswith("debug_")
+
+
+class Job:
+    """ One agent run and the events it produced """
+
+    def __init__(
+        self, query: str, metrics: bool = False, keep: bool = True, resume: bool = True, buffer_size: int = JOB_EVENT_BUFFER,
+        queue_size: int = EVENT_QUEUE_SIZE, policy: str = EVENT_SLOW_CONSUMER_POLICY,
+    ):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.key = normalize_query(query)
+        self.metrics = metrics
+        self.keep = keep # keep running while no client is attached
+        self.subscribers = 0
+        self.status = "queued" # queued -> running -> done | error | cancelled
+        self.created = time.time()
+        self.started: float | None = None
+        self.finished: float | None = None
+        self.result: Dict | None = None
+        self.error: str | None = None
+        self.cached: Dict | None = None # how the result cache answered this query, if it did
+        self.task: asyncio.Task | None = None
+        self.thread_id = self.id # graph thread, a resumed run continues an older job's thread
+        self.resume = resume # continue an unfinished run of the same query, if there is one
+        self.resumed = False
+        self.stopped = False # cancelled by the user, its thread is not resumed
+        self.last_id = 0
+        # (id, event name, payload) in id order, debug events apart so they can be dropped first
+        self.buffer_size = max(1, buffer_size)
+        self._debug: deque = deque()
+        self._content: deque = deque()
+        self._cond = asyncio.Condition()
+        # channels of the clients streaming the live tail, events are handed to them one at a time in id order
+        self.queue_size = queue_size
+        self.policy = policy
+        self._sinks: List[EventChannel] = []
+        self._publishing = asyncio.Lock()
+        self._offered = 0 # last event handed to every sink, the ones a sink dropped are not sent again
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def _buffer(self, event: str | None, payload: Dict):
+        self.last_id += 1
+        (self._debug if _is_debug(event, payload) else self._content).append((self.last_id, event, payload))
+        if len(self._debug) + len(self._content) > self.buffer_size:
+            (self._debug or self._content).popleft()
+
+    def _after(self, after: int) -> List[Tuple[int, str | None, Dict]]:
+        """ Buffered events with an id above `after`, in id order """
+        tails = []
+        for events in (self._debug, self._content):
+            tail = []
+            # readers mostly follow the live tail, so walk back from the newest event
+            for item in reversed(events):
+                if item[0] <= after:
+                    break
+                tail.append(item)
+            tails.append(tail[::-1])
+        return list(heapq.merge(*tails, key=lambda item: item[0]))
+
+    async def append(self, payload: Dict, event: str | None = None):
+        """ Record an event and hand it to the live subscribers, waits while one of them is behind (see EventChannel) """
+        async with self._publishing:
+            async with self._cond:
+                self._buffer(event, payload)
+                item = (self.last_id, event, payload)
+                sinks = list(self._sinks)
+                self._cond.notify_all()
+            for sink in sinks:
+                await sink.publish(item, debug=_is_debug(event, payload))
+            self._offered = item[0]
+
+    async def publish(self, stage: str, message: str, meta: Dict | None = None):
+        """ Publisher handed to the graph """
+        await self.append({"stage": stage, "message": message, "meta": meta or {}})
+
+    async def finish(self, status: str):
+        """ Record the end event and wake every reader """
+        async with self._publishing, self._cond:
+            self.status = status
+            self.finished = time.time()
+            self._buffer("end", {})
+            self._cond.notify_all()
+            # the end event is not queued behind a slow client, subscribe() reads it from the ring buffer
+            sinks, self._sinks = self._sinks, []
+            for sink in sinks:
+                await sink.close()
+
+    async def events(self, after: int = 0, subscribed: bool = False) -> AsyncIterator[Tuple[int | None, str | None, Dict]]:
+        """
+        Yield (id, event, payload) for every event after `after`, following the job until it finishes.
+        subscribed: the caller was already counted as a subscriber by JobManager.submit (and releases itself)
+        """
+        if not subscribed:
+            self.subscribers += 1
+        try:
+            while True:
+                async with self._cond:
+                    await self._cond.wait_for(lambda: self.last_id > after or self.done)
+                    batch = self._after(after)
+                    last = self.last_id
+                    done = self.done
+
+                # events after `after` that have already left the ring buffer (before or between the buffered ones)
+                missed = max(0, last - max(0, after) - len(batch))
+                if missed:
+                    yield None, "gap", {"missed": missed}
+                for item in batch:
+                    yield item
+                # every event up to `last` was either sent or reported missing
+                after = max(after, last)
+                if done and after >= last:
+                    return
+        finally:
+            if not subscribed:
+                self.subscribers -= 1
+
+    async def subscribe(self, after: int = 0) -> AsyncIterator[Tuple[int | None, str | None, Dict]]:
+        """
+        Like events(), for a client streaming the run live (/query) and counted as a subscriber by JobManager.submit:
+        the buffered events are replayed, then the live tail goes through a bounded channel that throttles the run.
+        """
+        channel = EventChannel(self.queue_size, self.policy)
+        async with self._cond:
+            start = self.last_id
+            batch = [item for item in self._after(after) if item[0] <= start]
+            live = not self.done
+            if live:
+                self._sinks.append(channel)
+
+        try:
+            missed = max(0, start - max(0, after) - len(batch))
+            if missed:
+                yield None, "gap", {"missed": missed}
+            for item in batch:
+                yield item
+            after = max(after, start)
+
+            if live:
+                async for item in channel:
+                    after = item[0]
+                    yield item
+                if channel.dropped:
+                    print(f">> DROPPED {channel.dropped} DEBUG EVENTS FOR A SLOW CLIENT OF JOB {self.id}")
+
+            # the end event (with a gap if the ring buffer lost events this client never got)
+            async for item in self.events(max(after, self._offered), subscribed=True):
+                yield item
+        finally:
+            # a client that leaves must not keep the run waiting
+            if channel in self._sinks:
+                self._sinks.remove(channel)
+            await channel.close()
+
+    def info(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "query": self.query,
+            "status": self.status,
+            "subscribers": self.subscribers,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "last_event_id": self.last_id,
+            "error": self.error,
+            "cached": self.cached,
+            "resumed": self.resumed,
+            "final_state": self.result,
+        }
+
+
+class JobManager:
+    """ Runs jobs on at most `workers` concurrent agent runs, with a bounded queue in front """
+
+    def __init__(self, agent, workers: int = JOB_WORKERS, max_queued: int = JOB_MAX_QUEUED, ttl: float = JOB_TTL):
+        # the compiled graph, or a function that builds it on the first run (see agent.get_agent)
+        self._agent = agent
+        self.agent = None
+        self.checkpointer = None # None when checkpoints are disabled
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.jobs: Dict[str, Job] = {}
+        self._inflight: Dict[str, Job] = {} # normalized query -> unfinished job
+        self._slots: asyncio.Semaphore | None = None
+
+    def active(self) -> int:
+        return sum(1 for job in self.jobs.values() if not job.done)
+
+    async def submit(self, query: str, metrics: bool = False, keep: bool = True, cache: bool = True, resume: bool = True) -> Job:
+        """
+        Return the in-flight job for the same normalized query, a finished job answered by the
+        result cache, or a newly admitted run (cache=False skips the result cache and, like
+        resume=False, starts over instead of resuming an unfinished run of the query).
+        Raises JobQueueFull when a new run would exceed the worker pool and queue.
+        keep=False: the caller streams the job and counts as its subscriber from now on, until it calls release()
+        """
+        self.expire()
+
+        # cached results win over joining a run, so stale hits stay fast while they are refreshed
+        job = None
+        if RESULT_CACHE_ENABLED and cache:
+            hit = await result_cache.lookup(query)
+            if hit is not None:
+                job = await self._from_cache(query, *hit)
+
+        job = job or self._join(query, metrics, keep)
+        if job is None:
+            job = self._start(query, metrics, keep, resume=cache and resume)
+            # let the run enter its try block first, a cancel before its first step would skip the job's cleanup
+            await asyncio.sleep(0)
+        if not keep:
+            # counted before the caller starts reading, so a release() by another client cannot cancel the run meanwhile
+            job.subscribers += 1
+        return job
+
+    def _join(self, query: str, metrics: bool, keep: bool) -> Job | None:
+        job = self._inflight.get(normalize_query(query))
+        if job is None or job.done:
+            return None
+        job.metrics = job.metrics or metrics
+        job.keep = job.keep or keep
+        QUERIES.inc(result="joined")
+        print(f">> JOINED IN-FLIGHT JOB {job.id} ({job.subscribers} subscribers)")
+        return job
+
+    def _start(self, query: str, metrics: bool = False, keep: bool = True, resume: bool = True) -> Job:
+        if self.active() >= self.workers + self.max_queued:
+            raise JobQueueFull(f"{self.active()} jobs in flight")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        job = Job(query, metrics, keep, resume)
+        self.jobs[job.id] = job
+        self._inflight[job.key] = job
+        job.task = asyncio.create_task(self._run(job))
+        QUERIES.inc(result="started")
+        return job
+
+    async def _from_cache(self, query: str, entry: Dict, match: str, similarity: float) -> Job:
+        """ A finished job holding a cached final state, optionally re-running the query in the background """
+        age = time.time() - entry["created"]
+        refresh = 0 < RESULT_CACHE_REFRESH_AFTER <= age and normalize_query(query) not in self._inflight
+        if refresh:
+            try:
+                self._start(query)
+                print(f">> REFRESHING CACHED RESULT FOR '{query}' IN THE BACKGROUND")
+            except JobQueueFull:
+                refresh = False
+
+        job = Job(query)
+        job.started = job.created
+        job.cached = {"match": match, "query": entry["query"], "similarity": round(similarity, 4), "age_seconds": round(age, 1), "refreshing": refresh}
+        job.result = entry["final_state"]
+        self.jobs[job.id] = job
+
+        await job.append(job.cached, event="cached")
+        await job.append({"final_state": job.result})
+        await job.finish("done")
+        QUERIES.inc(result="cached")
+        print(f">> RESULT CACHE HIT ({match}) FOR '{query}'")
+        return job
+
+    async def _load_agent(self):
+        """ Resolve the agent on the first run, a factory runs in a worker thread since it opens the checkpoint store """
+        if self.agent is None:
+            agent = await anyio.to_thread.run_sync(self._agent) if callable(self._agent) else self._agent
+            self.agent, self.checkpointer = agent, getattr(agent, "checkpointer", None)
+
+    async def _retire_thread(self, job: Job):
+        """ Delete the thread of a finished job unless the next job for its query should resume it """
+        # completed runs never need to be resumed, runs stopped by the user are not wanted anymore
+        drop = job.status == "done" or (job.status == "cancelled" and job.stopped)
+        if job.status == "error" and job.resumed:
+            # a run that fails the same way on every resume would otherwise be retried until it expires
+            failures = await self.checkpointer.arecord_failure(job.thread_id)
+            drop = failures >= CHECKPOINT_MAX_RESUMES
+            if drop:
+                print(f">> RUN {job.thread_id} FAILED {failures} RESUMES, THE NEXT QUERY STARTS OVER")
+        if drop:
+            await self.checkpointer.adelete_thread(job.thread_id)
+
+    def get(self, job_id: str) -> Job | None:
+        self.expire()
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Job | None:
+        job = self.get(job_id)
+        if job is not None and not job.done:
+            job.stopped = True
+            job.task.cancel()
+        return job
+
+    def release(self, job: Job):
+        """ Drop the subscription of a keep=False submit, and cancel the job if nobody is waiting for it anymore """
+        job.subscribers -= 1
+        if not job.done and not job.keep and job.subscribers == 0:
+            print(f">> NO CLIENTS LEFT FOR JOB {job.id}, CANCELLING AGENT RUN")
+            job.task.cancel()
+
+    def expire(self):
+        """ Forget finished jobs older than the TTL """
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.done and job.finished < cutoff]:
+            del self.jobs[job_id]
+
+    async def shutdown(self):
+        tasks = [job.task for job in self.jobs.values() if not job.done]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, job: Job):
+        # every observation made by this run is collected for the job
+        request_metrics = metrics_registry.RequestMetrics()
+        metrics_registry.current_request.set(request_metrics)
+
+        try:
+            async with self._slots:
+                await self._load_agent()
+                job.status = "running"
+                job.started = time.time()
+                print(f">> JOB {job.id} STARTED")
+
+                state = initial_state(job.query)
+                if self.checkpointer is not None and not job.resume:
+                    # a fresh run replaces the unfinished ones, so none of them is resumed later
+                    await self.checkpointer.adelete_run(job.key)
+                elif self.checkpointer is not None:
+                    thread_id = await self.checkpointer.alatest_thread(job.key)
+                    if thread_id is not None:
+                        # continue the unfinished run from its last checkpoint instead of starting over
+                        job.thread_id, job.resumed, state = thread_id, True, None
+                        await job.append({"thread_id": thread_id}, event="resumed")
+                        print(f">> JOB {job.id} RESUMES RUN {thread_id}")
+
+                config = {
+                    "recursion_limit": 200,
+                    "configurable": {"thread_id": job.thread_id, "run_key": job.key, "publish": job.publish},
+                }
+                # sync durability: the registry is mutated in place, so each checkpoint is written before the next node runs
+                final_state = await self.agent.ainvoke(state, config=config, durability="sync")
+
+            if job.metrics:
+                await job.append({"metrics": request_metrics.summary()}, event="metrics")
+            job.result = public_state(final_state)
+            await job.append({"final_state": job.result})
+            await job.finish("done")
+        except asyncio.CancelledError:
+            job.error = "cancelled"
+            await job.append({"error": job.error})
+            await job.finish("cancelled")
+        except Exception as e:
+            job.error = _error_message(e)
+            await job.append({"error": job.error})
+            await job.finish("error")
+        finally:
+            if self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+        print(f">> JOB {job.id} {job.status.upper()}")
+
+        if self.checkpointer is not None:
+            try:
+                await self._retire_thread(job)
+            except Exception as e:
+                print(f">> COULD NOT UPDATE THE CHECKPOINTS OF JOB {job.id}: {e}")
+
+        # keep the completed run for identical (or near-duplicate) queries
+        if job.status == "done" and RESULT_CACHE_ENABLED:
+            try:
+                await result_cache.store(job.query, job.result)
+            except Exception as e:
+                print(f">> COULD NOT CACHE THE RESULT OF JOB {job.id}: {e}")
@@ -0,0 +1,64 @@
+"""
+Hybrid ranking helpers for retrieve.
+In-process BM25 over paper titles and abstracts is a cheap prefilter, so only the lexically
+strongest candidates are embedded. The final ranking fuses the lexical and embedding scores and
+keeps the top k, stopping early at the first large drop in score.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import List
+
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or that the their this to was we were which with "
+    "our these those using use used based via can also than such paper study propose proposed show results".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+def bm25_scores(query: str, documents: List[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """ BM25 score of every document for the query, the documents are the corpus for the IDF """
+    docs = [Counter(tokenize(doc)) for doc in documents]
+    if not docs:
+        return np.zeros(0)
+
+    lengths = np.array([sum(doc.values()) for doc in docs], dtype=np.float64)
+    avg_length = lengths.mean() or 1.0
+    n = len(docs)
+
+    scores = np.zeros(n)
+    for term in set(tokenize(query)):
+        tf = np.array([doc.get(term, 0) for doc in docs], dtype=np.float64)
+        df = np.count_nonzero(tf)
+        if df == 0:
+            continue
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        scores += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths / avg_length))
+    return scores
+
+
+def fuse_scores(dense: np.ndarray, lexical: np.ndarray, dense_weight: float = 0.7) -> np.ndarray:
+    """ Weighted sum of cosine similarities and BM25 scores scaled to [0, 1] """
+    top = lexical.max() if len(lexical) else 0.0
+    scaled = lexical / top if top > 0 else np.zeros_like(lexical)
+    return dense_weight * dense + (1 - dense_weight) * scaled
+
+
+def score_cutoff(scores: np.ndarray, top_k: int, min_k: int = 1, max_gap: float = 0.0) -> List[int]:
+    """
+    Indices of the best scores, best first: at most top_k, and after min_k stop at the first
+    drop between consecutive scores larger than max_gap (0 disables the gap cutoff)
+    """
+    order = [int(i) for i in np.argsort(-scores, kind="stable")[:top_k]]
+    for n in range(max(1, min_k), len(order)):
+        if max_gap > 0 and scores[order[n - 1]] - scores[order[n]] > max_gap:
+            return order[:n]
+    return order
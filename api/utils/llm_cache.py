@@ -0,0 +1,153 @@
+"""
+Response cache for the deterministic (temperature=0) LLM calls.
+Exact tier: responses keyed by a hash of the stage model, temperature and full prompt, with TTL and LRU eviction.
+Semantic tier (optional): planner responses keyed by the user query embedding, so a
+near-duplicate query reuses the plan of an earlier one.
+Cache hits are replayed through the same StreamingCallback token events as a live call.
+"""
+
+import hashlib
+import json
+import os
+
+import anyio
+import numpy as np
+
+from setup import get_embeddings, get_streaming_llm
+from utils.cache import SemanticIndex, SqliteLRUCache
+from utils.config import (
+    CACHE_DIR, stage_llm, LLM_CACHE_ENABLED, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_SEMANTIC,
+    LLM_CACHE_SEMANTIC_THRESHOLD, LLM_CACHE_SEMANTIC_MAX_ENTRIES,
+)
+from utils.embeddings import embed_query
+from utils.metrics import LLM_CALLS
+from utils.streaming_callback import StreamingCallback
+
+# characters per replayed token event, roughly the size of a streamed gemini chunk
+REPLAY_CHUNK = 64
+
+_exact: SqliteLRUCache | None = None
+_semantic: "SemanticCache | None" = None
+
+
+def get_exact_cache() -> SqliteLRUCache:
+    global _exact
+    if _exact is None:
+        _exact = SqliteLRUCache(
+            os.path.join(CACHE_DIR, "llm.sqlite"), table="responses", max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL,
+        )
+    return _exact
+
+
+class SemanticCache:
+    """ Responses keyed by the embedding of the text that determines them (the user query) """
+
+    def __init__(self, store: SqliteLRUCache, threshold: float):
+        self.store = store
+        self.threshold = threshold
+        # only the embeddings stay in memory, responses are read from the store on a hit
+        self.index = SemanticIndex()
+        store.on_evict = self.index.remove
+
+        for key, value in store.items():
+            self.index.add(key, np.asarray(json.loads(value)["embedding"], dtype=np.float32))
+
+    def lookup(self, vector: np.ndarray) -> str | None:
+        match = self.index.nearest(vector)
+        if match is None or match[1] < self.threshold:
+            return None
+        key, score = match
+        value = self.store.get(key)
+        # the entry may have expired since it was indexed
+        if value is None:
+            self.index.remove([key])
+            return None
+        print(f">> SEMANTIC CACHE HIT (similarity {score:.3f})")
+        return json.loads(value)["response"]
+
+    def add(self, key: str, vector: np.ndarray, response: str):
+        self.store.set(key, json.dumps({"embedding": vector.tolist(), "response": response}).encode("utf-8"))
+        self.index.add(key, vector)
+
+
+def get_semantic_cache() -> SemanticCache:
+    global _semantic
+    if _semantic is None:
+        store = SqliteLRUCache(
+            os.path.join(CACHE_DIR, "llm.sqlite"), table="semantic", max_entries=LLM_CACHE_SEMANTIC_MAX_ENTRIES, ttl=LLM_CACHE_TTL,
+        )
+        _semantic = SemanticCache(store, LLM_CACHE_SEMANTIC_THRESHOLD)
+    return _semantic
+
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+async def replay(publish, stage: str, text: str, on_token=None):
+    """ Emit a cached response through the same token events a live streaming call produces """
+    handler = StreamingCallback(publish, stage, on_token=on_token)
+    for i in range(0, len(text), REPLAY_CHUNK):
+        await handler.on_llm_new_token(text[i:i + REPLAY_CHUNK])
+    await handler.on_llm_end(None)
+
+
+def _usable(validate, text: str) -> bool:
+    if validate is None:
+        return True
+    try:
+        validate(text)
+        return True
+    except Exception:
+        return False
+
+
+async def cached_ainvoke(publish, stage: str, message: str, semantic_query: str | None = None, on_token=None, validate=None) -> str:
+    """
+    Invoke the streaming LLM for a stage and return the response text, serving it from the cache when possible.
+    semantic_query: the text that fully determines the prompt (e.g. the user query), enables the semantic tier
+    on_token: called with every token of the response, live or replayed from the cache
+    validate: raises if the caller cannot use a response (e.g. json.loads), such responses are never cached
+    and are dropped from the cache when found there, so a retry reaches the model again
+    """
+    if not LLM_CACHE_ENABLED:
+        llm = get_streaming_llm(publish, stage, on_token)
+        return (await llm.ainvoke(message)).content
+
+    # the stage's model and temperature change the response, so both are part of the key
+    model, temperature = stage_llm(stage)
+    cache = get_exact_cache()
+    key = _hash(model, str(temperature), message)
+
+    cached = await anyio.to_thread.run_sync(cache.get, key)
+    if cached is not None and not _usable(validate, cached.decode("utf-8")):
+        await anyio.to_thread.run_sync(cache.delete, [key])
+        cached = None
+    if cached is not None:
+        print(f">> LLM CACHE HIT ({stage})")
+        LLM_CALLS.inc(stage=stage, cached="true")
+        text = cached.decode("utf-8")
+        await replay(publish, stage, text, on_token)
+        return text
+
+    use_semantic = LLM_CACHE_SEMANTIC and semantic_query is not None
+    if use_semantic:
+        query_emb = await embed_query(get_embeddings(), semantic_query)
+        semantic = await anyio.to_thread.run_sync(get_semantic_cache)
+        text = semantic.lookup(query_emb)
+        if text is not None and _usable(validate, text):
+            LLM_CALLS.inc(stage=stage, cached="true")
+            await replay(publish, stage, text, on_token)
+            return text
+
+    llm = get_streaming_llm(publish, stage, on_token)
+    text = (await llm.ainvoke(message)).content
+    if not _usable(validate, text):
+        print(f">> UNUSABLE {stage.upper()} RESPONSE, NOT CACHED")
+        return text
+
+    await anyio.to_thread.run_sync(cache.set, key, text.encode("utf-8"))
+    if use_semantic:
+        await anyio.to_thread.run_sync(semantic.add, _hash(model, str(temperature), stage, semantic_query), query_emb, text)
+
+    return text
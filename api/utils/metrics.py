@@ -0,0 +1,167 @@
+"""
+Lightweight Prometheus-style instrumentation.
+Counters and histograms are process wide and rendered by GET /metrics in the text exposition
+format. Every observation is also added to the metrics of the current request (a context
+variable set by /query), which can be streamed to the client as a `metrics` event.
+"""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Tuple
+
+_registry: List["Metric"] = []
+
+
+class RequestMetrics:
+    """ Summary of every observation made while serving one request """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.values: Dict[str, Dict] = {}
+
+    def add(self, name: str, labels: Tuple, value: float, kind: str):
+        key = name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+        entry = self.values.setdefault(key, {"count": 0, "sum": 0.0} if kind == "histogram" else {"total": 0.0})
+        if kind == "histogram":
+            entry["count"] += 1
+            entry["sum"] = round(entry["sum"] + value, 6)
+            entry["max"] = round(max(entry.get("max", value), value), 6)
+        else:
+            entry["total"] = round(entry["total"] + value, 6)
+
+    def summary(self) -> Dict:
+        return {"elapsed_seconds": round(time.perf_counter() - self.started, 3), **self.values}
+
+
+current_request: ContextVar[RequestMetrics | None] = ContextVar("current_request", default=None)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _record(self, labels: Dict, value: float):
+        collector = current_request.get()
+        if collector is not None:
+            collector.add(self.name, tuple(sorted(labels.items())), value, self.kind)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + value
+        self._record(labels, value)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(key)} {value:g}" for key, value in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Tuple, List] = {} # labels -> [bucket counts..., count, sum]
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self.values.setdefault(key, [0] * len(self.buckets) + [0, 0.0])
+            i = bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                entry[i] += 1
+            entry[-2] += 1
+            entry[-1] += value
+        self._record(labels, value)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, entry in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {entry[-2]}")
+            lines.append(f"{self.name}_count{_labels(key)} {entry[-2]}")
+            lines.append(f"{self.name}_sum{_labels(key)} {entry[-1]:g}")
+        return lines
+
+
+def _labels(key: Tuple) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+
+def render() -> str:
+    """ Every metric in the Prometheus text exposition format """
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        with metric._lock:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# graph nodes
+NODE_SECONDS = Histogram("ra_node_seconds", "Wall time of each graph node", LATENCY_BUCKETS)
+
+# queries
+QUERIES = Counter("ra_queries_total", "Submitted queries, result=started|joined (coalesced into an in-flight run)|cached (answered by the result cache)")
+
+RESULT_CACHE_LOOKUPS = Counter("ra_result_cache_lookups_total", "Final result cache lookups, result=exact_hit|semantic_hit|miss")
+
+# llm calls
+LLM_CALLS = Counter("ra_llm_calls_total", "LLM calls per stage, cached=true when replayed from the response cache")
+LLM_TTFT_SECONDS = Histogram("ra_llm_time_to_first_token_seconds", "Time from LLM call start to the first streamed token", LATENCY_BUCKETS)
+LLM_SECONDS = Histogram("ra_llm_seconds", "Duration of each live LLM call", LATENCY_BUCKETS)
+LLM_TOKENS_PER_SECOND = Histogram("ra_llm_tokens_per_second", "Completion tokens per second after the first token", (10, 25, 50, 100, 200, 400, 800, 1600))
+LLM_PROMPT_CHARS = Counter("ra_llm_prompt_chars_total", "Characters sent to the LLM")
+LLM_COMPLETION_CHARS = Counter("ra_llm_completion_chars_total", "Characters generated by the LLM")
+LLM_TOKENS = Counter("ra_llm_tokens_total", "Tokens reported by the LLM, kind=prompt|completion")
+
+# arxiv
+ARXIV_FETCH_SECONDS = Histogram("ra_arxiv_fetch_seconds", "Latency of arxiv API requests", LATENCY_BUCKETS)
+ARXIV_RATE_WAIT_SECONDS = Histogram("ra_arxiv_rate_wait_seconds", "Time an arxiv request waited for the rate limiter", LATENCY_BUCKETS)
+ARXIV_BYTES = Counter("ra_arxiv_bytes_total", "Bytes received from the arxiv API")
+ARXIV_REQUESTS = Counter("ra_arxiv_requests_total", "arxiv searches, result=hit|miss|replay_miss against the response cache")
+
+# embeddings
+EMBEDDING_CALLS = Counter("ra_embedding_calls_total", "Calls to the embedding model, kind=query|document")
+EMBEDDING_TEXTS = Counter("ra_embedding_texts_total", "Texts looked up in the embedding cache, result=hit|miss")
+
+
+def instrument(name: str, node):
+    """ Wrap a graph node so its wall time is recorded under `name` """
+    @functools.wraps(node)
+    async def wrapper(state, config):
+        start = time.perf_counter()
+        try:
+            return await node(state, config)
+        finally:
+            NODE_SECONDS.observe(time.perf_counter() - start, node=name)
+    return wrapper
+
+# full-text mode
+FULLTEXT_PAPERS = Counter("ra_fulltext_papers_total", "Papers read in full-text mode, result=cached|extracted|failed")
+FULLTEXT_BYTES = Counter("ra_fulltext_pdf_bytes_total", "PDF bytes downloaded")
+FULLTEXT_EXTRACT_SECONDS = Histogram("ra_fulltext_extract_seconds", "Time to extract and chunk one PDF in the worker pool", LATENCY_BUCKETS)
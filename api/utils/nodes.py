@@ -1,30 +1,67 @@
 from utils.state import AgentState
 from utils.prompts import *
-from setup import embeddings, get_streaming_llm
+from setup import get_embeddings, get_streaming_llm
 import json
-import feedparser
-from urllib.parse import quote
 import numpy as np
-from langchain.docstore.document import Document
 import anyio
 from utils.formatting import *
+from utils.embeddings import embed_documents, embed_query
+from utils.arxiv import fetch_many
+from utils.papers import paper_content
+from utils.llm_cache import cached_ainvoke
+from utils.context import pack_papers
+from utils.lexical import bm25_scores, fuse_scores, score_cutoff
+from utils.plan_stream import PlanStream
+from utils.retrieval_stream import RetrievalStream
+from utils.fulltext import fetch_chunks, rank_chunks, with_passages
+from utils.config import (
+    CONTEXT_BUDGET_REFLECTION, CONTEXT_BUDGET_SUMMARIZE, CONTEXT_MMR_LAMBDA, CONTEXT_MAX_PAPER_TOKENS, CONTEXT_MIN_PAPER_TOKENS,
+    RETRIEVAL_STREAMING, RETRIEVAL_LEXICAL_TOP_N, RETRIEVAL_DENSE_WEIGHT, RETRIEVAL_TOP_K, RETRIEVAL_MIN_K, RETRIEVAL_SCORE_GAP,
+    SEARCH_MAX_PARALLEL, PLANNER_EARLY_SEARCH, LOCAL_INDEX_ENABLED, LOCAL_INDEX_TOP_K, LOCAL_INDEX_MIN_SCORE,
+    LOCAL_COVERAGE_THRESHOLD, LOCAL_COVERAGE_MIN_HITS,
+    FULLTEXT_ENABLED, FULLTEXT_MAX_PAPERS, FULLTEXT_PASSAGES, FULLTEXT_MAX_PAPER_TOKENS,
+)
+from utils.vector_index import get_vector_index
+from langchain_core.runnables import RunnableConfig
+from typing import Dict, List, Tuple
 
 # all node functions
 
-async def planner(state: AgentState) -> AgentState:
+
+async def _discard(stage: str, message: str, meta: Dict | None = None):
+    pass
+
+
+def publisher(config: RunnableConfig):
+    """ event publisher of the run, passed in the config so it never ends up in a checkpoint """
+    return config.get("configurable", {}).get("publish") or _discard
+
+
+def retrieval_query(query: str, plan: Dict) -> str:
+    """ text the papers are ranked against: the user query plus the planned analysis focus """
+    return f"{query}. {' '.join(plan["reflection"]["analysis_focus"])}"
+
+
+def parse_json(text: str):
+    """ Parse an llm json response, with or without a ```json fence """
+    if text.startswith("```json"):
+        text = text[7:-3]
+    return json.loads(text)
+
+
+async def planner(state: AgentState, config: RunnableConfig) -> AgentState:
     """ Generate a detailed execution plan for the user query """
 
     state["count"] += 1
-    print(f"State:\n{state}\n")
+    print(f"\n>> PLANNER ITERATION {state["count"]}")
 
-    # publisher queue provided by /query
-    publish = state.get("publish")
-    
-    # llm with token by token streaming
-    llm = get_streaming_llm(publish, "planner")
+    # publisher of the job running this graph
+    publish = publisher(config)
 
     # complete message to pass to the LLM
     message = ""
+    # the initial plan depends only on the user query, near-duplicate queries can share it
+    semantic_query = None
 
     # First check if there are any previous reflections in reflection_notes
     # If yes, generate a new plan/ or additional search parameters
@@ -42,14 +79,50 @@ async def planner(state: AgentState) -> AgentState:
         await publish("planner_token", "\n### Generating Initial Plan\n")
 
         message = system_prompt + f"\nUser query:\n{state["query"]}"
+        semantic_query = state["query"]
+
+    # plan steps are searched as soon as the planner has streamed them, overlapping planning and arxiv I/O,
+    # and the papers of every feed are embedded while the other searches are still running
+    stream = PlanStream()
+    papers_stream = RetrievalStream(state["registry"], state["query"], RETRIEVAL_LEXICAL_TOP_N)
+    early_steps = []
+    early_results = []
+    limiter = anyio.CapacityLimiter(max(1, SEARCH_MAX_PARALLEL))
+
+    async def run_step(i: int, step: Dict):
+        async with limiter:
+            try:
+                early_results[i] = await search_step(publish, step, papers_stream.add if RETRIEVAL_STREAMING else None)
+            except Exception as e:
+                # the step stays in the plan and is searched again by search_arxiv
+                print(f">> EARLY SEARCH OF PLAN STEP {i} FAILED: {e}")
+
+    async with papers_stream, anyio.create_task_group() as tg:
+
+        def on_token(token: str):
+            for step in stream.feed(token):
+                print(f">> PLAN STEP {len(early_steps)} STREAMED, SEARCHING WHILE PLANNING...")
+                early_steps.append(step)
+                early_results.append(None)
+                tg.start_soon(run_step, len(early_steps) - 1, step)
+
+        # llm with token by token streaming, served from the response cache when possible
+        response_json = await cached_ainvoke(
+            publish, "planner", message, semantic_query, on_token if PLANNER_EARLY_SEARCH else None, validate=parse_json,
+        )
+
+        try:
+            response_dict = parse_json(response_json)
+            if RETRIEVAL_STREAMING:
+                papers_stream.set_query(retrieval_query(state["query"], response_dict))
+        except Exception:
+            # no usable plan, stop the early searches and report the parse error below
+            tg.cancel_scope.cancel()
+            response_dict = None
 
-    response = await llm.ainvoke(message)
-    response_json = response.content
-    if response_json.startswith("```json"):
-        response_json = response_json[7:-3]
-    
     try:
-        response_dict = json.loads(response_json)
+        if response_dict is None:
+            response_dict = parse_json(response_json) # raises the parse error
 
         # Load plan JSON as python dictionary
         state["original_plan"] = response_dict
@@ -61,10 +134,18 @@ async def planner(state: AgentState) -> AgentState:
 
         await publish("planner_token", format_plan_for_display(response_dict))
 
+        # steps searched while planning are merged here, anything the stream missed is left for search_arxiv
+        searched = 0
+        while searched < len(early_steps) and early_results[searched] is not None and response_dict["plan"][searched:searched + 1] == early_steps[searched:searched + 1]:
+            searched += 1
+        if searched:
+            print(f">> {searched} / {len(state["plan"])} PLAN STEPS SEARCHED WHILE PLANNING")
+            await merge_search_results(state, publish, early_results[:searched])
+
         return {
             **state,
             "original_plan": response_dict,
-            "plan": response_dict["plan"]
+            "plan": response_dict["plan"][searched:]
         }
     
     except Exception as e:
@@ -76,75 +157,109 @@ async def planner(state: AgentState) -> AgentState:
         print(e)
 
 
-async def search_arxiv(state: AgentState) -> AgentState:
-    """ given the current Agent State, search arxiv and return appropriate papers. """
-
-    publish = state["publish"]
-
-    llm = get_streaming_llm(publish, "search_arxiv")
-
-    print("\n>> SEARCHING ARXIV ...")
+async def search_step(publish, step: Dict, on_feed=None) -> Tuple[List[Dict], List[Dict]]:
+    """ run a single plan step: expand it into arxiv queries and fetch the papers for each of them (see fetch_many for on_feed) """
 
     # pass the search_terms and additional_terms to the llm
-    search_terms = state["plan"][0]["query"]["search_terms"]
-    additional_focus = state["plan"][0]["query"]["additional_focus"]
+    search_terms = step["query"]["search_terms"]
+    additional_focus = step["query"]["additional_focus"]
+
+    # skip arxiv entirely when the local index already covers this step well
+    if LOCAL_INDEX_ENABLED:
+        step_query = " ".join(search_terms + additional_focus)
+        step_emb = await embed_query(get_embeddings(), step_query)
+        hits = await anyio.to_thread.run_sync(
+            lambda: get_vector_index().search(step_emb, LOCAL_INDEX_TOP_K, LOCAL_COVERAGE_THRESHOLD)
+        )
+        if len(hits) >= LOCAL_COVERAGE_MIN_HITS:
+            print(f">> LOCAL INDEX COVERS '{step_query}' ({len(hits)} papers), SKIPPING ARXIV")
+            return [{"search_query": f"local index: {step_query}", "max_results": len(hits)}], [paper for _, paper, _ in hits]
 
     # make the llm generate appropriate arxiv search queries
     message = query_expansion_prompt + f"\nSearch terms:{search_terms}\nAdditional focus:{additional_focus}"
 
-    queries = await llm.ainvoke(message)
-    queries_json = queries.content
-    if queries_json.startswith("```json"):
-        queries_json = queries_json[7:-3]
+    queries_json = await cached_ainvoke(publish, "search_arxiv", message, validate=parse_json)
 
     try:
-        queries_dict = json.loads(queries_json)
+        queries_dict = parse_json(queries_json)
 
-        base_url = 'http://export.arxiv.org/api/query?'
-        results = []
         max_results = 5
 
-        # construct valid arxiv url for each search query returned by the LLM and get appropriate papers
-        for query in queries_dict:
-            # URL-encode
-            search_query = quote(query["search_query"])
+        # fetch every search query returned by the LLM concurrently over the shared arxiv client
+        results = await fetch_many([query["search_query"] for query in queries_dict], max_results, on_feed)
 
-            url = base_url + f"search_query={search_query}&max_results={max_results}&sortBy=submittedDate&sortOrder=descending"
-            
-            print(f"url: {url}")
+        return queries_dict, [paper for papers in results for paper in papers]
 
-            # feedparser is blocking → run in thread
-            feed = await anyio.to_thread.run_sync(feedparser.parse, url)
+    except Exception as e:
+        await publish("search_arxiv", "error", {"raw": queries_json, "error": str(e)})
+        print(queries_json)
+        print(e)
+        raise
 
-            results.append(feed.entries)
 
-        count = 0
-        for i in range(len(results)):
-            for result in results[i]:
-                result_dict = {
-                    "title": result['title'],
-                    "published": result['published'],
-                    "summary": result['summary'],
-                    "arxiv_link": result['link']
-                }
-                # not storing for now, will store later
-                # "pdf_link": result['links'][2]['href'] # or just /pdf instead of /obs in the arxiv link
-                count += 1
-                state["results"]["arxiv"].append(result_dict)
+async def search_arxiv(state: AgentState, config: RunnableConfig) -> AgentState:
+    """ given the current Agent State, search arxiv for every step in the plan and return appropriate papers. """
 
-        # finally, pop the current tool from plan (pop(0))
-        state["plan"].pop(0)
-        print(f">> {len(state["plan"])} SEARCHES LEFT...")
+    publish = publisher(config)
 
-        await publish("search_arxiv_token", format_search_queries(queries_dict, count))
+    print(f"\n>> SEARCHING ARXIV FOR {len(state["plan"])} STEPS...")
 
-        return {**state}
+    # all plan steps run concurrently, at most SEARCH_MAX_PARALLEL at a time
+    limiter = anyio.CapacityLimiter(max(1, SEARCH_MAX_PARALLEL))
+    step_results = [None] * len(state["plan"])
 
-    except Exception as e:
-        await publish("search_arxiv", "error", {"raw": queries_json, "error": str(e)})
-        print(queries_json)
-        print(e)
-        raise
+    # papers are embedded and scored as each feed lands, hiding embedding latency behind the searches
+    query = retrieval_query(state["query"], state["original_plan"])
+    papers_stream = RetrievalStream(state["registry"], query, RETRIEVAL_LEXICAL_TOP_N)
+
+    errors = []
+
+    async def run_step(i: int, step: Dict):
+        async with limiter:
+            try:
+                step_results[i] = await search_step(publish, step, papers_stream.add if RETRIEVAL_STREAMING else None)
+            except Exception as e:
+                # one failing step must not cancel the others, only its papers are missing
+                print(f">> SEARCH OF PLAN STEP {i} FAILED: {e}")
+                errors.append(e)
+
+    async with papers_stream, anyio.create_task_group() as tg:
+        if RETRIEVAL_STREAMING:
+            papers_stream.set_query(query)
+        for i, step in enumerate(state["plan"]):
+            tg.start_soon(run_step, i, step)
+
+    if errors and len(errors) == len(step_results):
+        # nothing could be searched, fail the run with the error itself
+        raise errors[0]
+
+    await merge_search_results(state, publish, [result for result in step_results if result is not None])
+
+    # every step has been searched, clear the plan
+    state["plan"] = []
+    print(f">> {len(state["results"]["arxiv"])} PAPERS RETRIEVED...")
+
+    return {**state}
+
+
+async def merge_search_results(state: AgentState, publish, step_results: List[Tuple[List[Dict], List[Dict]]]):
+    """ add the papers of searched plan steps to the registry and this iteration's results """
+
+    # merge in plan order so the results do not depend on which step finished first
+    # papers returned by several queries (or earlier iterations) collapse into one registry record
+    registry = state["registry"]
+    seen = set(state["results"]["arxiv"])
+
+    for queries_dict, papers in step_results:
+        count = 0
+        for paper in papers:
+            pid = registry.add(paper)
+            if pid in seen:
+                continue
+            seen.add(pid)
+            state["results"]["arxiv"].append(pid)
+            count += 1
+        await publish("search_arxiv_token", format_search_queries(queries_dict, count))
     
 
 async def router(state: AgentState) -> str:
@@ -156,78 +271,141 @@ async def router(state: AgentState) -> str:
     else:
         return "tool call"
     
-async def retrieve(state: AgentState) -> AgentState:
+async def retrieve(state: AgentState, config: RunnableConfig) -> AgentState:
     """ retrieve the top relevant papers from all papers retrieved from arxiv search """
 
-    publish = state["publish"]
+    publish = publisher(config)
 
     print("\n>> RETRIEVING RELEVANT PAPERS...")
-    docs = []
 
-    for paper in state["results"]["arxiv"]:
-        content = f"Title: {paper["title"]}\nSummary:\n{paper["summary"]}\nLink: {paper["arxiv_link"]}"
-        docs.append(Document(page_content=content))
+    registry = state["registry"]
+    ids = list(state["results"]["arxiv"])
 
-    print(f">> LOADED {len(docs)} PAPERS")
+    print(f">> LOADED {len(ids)} PAPERS")
 
-    if len(docs) == 0:
-        await publish("search_arxiv_token", format_retrieval_stats(len(docs), 0, 0.0))
+    if len(ids) == 0:
+        await publish("search_arxiv_token", format_retrieval_stats(len(ids), 0, 0.0))
 
         return state
 
     # Define a query (combine user query + analysis focus)
     user_query = state["query"]
 
-    combined_query = f"{user_query}. {' '.join(state["original_plan"]["reflection"]["analysis_focus"])}"
-
-    # compute query embeddings, document embeddings and similarity scores
-    # embeddings are blocking → run in thread
-    query_emb = await anyio.to_thread.run_sync(embeddings.embed_query, combined_query)
-    doc_embs = await anyio.to_thread.run_sync(
-        lambda: [embeddings.embed_query(d.page_content) for d in docs]
-    )
-
-    query_emb = np.array(query_emb) / np.linalg.norm(query_emb)
-    doc_embs = np.array(doc_embs)
-    doc_embs = doc_embs / np.linalg.norm(doc_embs, axis=1, keepdims=True)
-
-    similarities = np.dot(doc_embs, query_emb)
-    threshold = np.mean(similarities) + 0.005
+    combined_query = retrieval_query(user_query, state["original_plan"])
+
+    query_emb = await embed_query(get_embeddings(), combined_query)
+    query_emb = query_emb / np.linalg.norm(query_emb)
+
+    # search the local index alongside the fresh arxiv results (its papers come with vectors)
+    if LOCAL_INDEX_ENABLED:
+        hits = await anyio.to_thread.run_sync(
+            lambda: get_vector_index().search(query_emb, LOCAL_INDEX_TOP_K, LOCAL_INDEX_MIN_SCORE)
+        )
+        local = []
+        for _, paper, vector in hits:
+            pid = registry.add(paper)
+            if pid not in ids:
+                ids.append(pid)
+                local.append(pid)
+                if pid not in registry.embeddings:
+                    registry.set_embeddings([pid], vector[None, :])
+        print(f">> ADDED {len(local)} PAPERS FROM THE LOCAL INDEX")
+
+    # lexical prefilter: only the BM25 top-N (plus papers that already have a vector) get embedded
+    lexical = bm25_scores(combined_query, [f"{registry.papers[pid].title} {registry.papers[pid].summary}" for pid in ids])
+    top_lexical = {ids[i] for i in np.argsort(-lexical, kind="stable")[:max(1, RETRIEVAL_LEXICAL_TOP_N)]}
+    candidates = [i for i, pid in enumerate(ids) if pid in top_lexical or pid in registry.embeddings]
+    candidate_ids = [ids[i] for i in candidates]
+
+    # papers already embedded earlier in this run (most of them while the searches were running)
+    # are reused from the registry, the rest are embedded in batches and cached on disk by content hash
+    missing = registry.missing_embeddings(candidate_ids)
+    if missing:
+        doc_embs = await embed_documents(get_embeddings(), [paper_content(registry.papers[pid]) for pid in missing])
+        registry.set_embeddings(missing, doc_embs)
+
+        # remember every freshly embedded paper in the local long-term index
+        if LOCAL_INDEX_ENABLED:
+            await anyio.to_thread.run_sync(
+                get_vector_index().add, [registry.papers[pid].to_dict() for pid in missing], registry.embeddings_for(missing)
+            )
+
+    similarities = registry.similarities(candidate_ids, combined_query, query_emb)
+    fused = fuse_scores(similarities, lexical[candidates], RETRIEVAL_DENSE_WEIGHT)
+
+    # full-text mode: the best papers are read in full and ranked by their best matching chunk
+    if FULLTEXT_ENABLED:
+        best = [candidate_ids[i] for i in np.argsort(-fused, kind="stable")[:FULLTEXT_MAX_PAPERS]]
+        chunks = await fetch_chunks([registry.papers[pid] for pid in best])
+        ranked = await rank_chunks(chunks, query_emb, FULLTEXT_PASSAGES)
+
+        dense = similarities.copy()
+        for i, pid in enumerate(candidate_ids):
+            if pid in ranked:
+                dense[i] = max(dense[i], ranked[pid][0])
+                registry.passages[pid] = ranked[pid][1]
+        fused = fuse_scores(dense, lexical[candidates], RETRIEVAL_DENSE_WEIGHT)
+
+        print(f">> READ THE FULL TEXT OF {len(chunks)} / {len(best)} PAPERS ({sum(map(len, chunks.values()))} CHUNKS)")
+        await publish("search_arxiv_token", format_fulltext_stats(len(best), len(chunks), sum(map(len, chunks.values()))))
 
     print("MIN, MAX, MEAN\n")
-    print(np.min(similarities), np.max(similarities), np.mean(similarities), "\n")
+    print(np.min(fused), np.max(fused), np.mean(fused), "\n")
 
-    threshold = np.mean(similarities) + 0.005
+    # keep the top k by fused score, stopping early at a large drop in score
+    top = score_cutoff(fused, RETRIEVAL_TOP_K, RETRIEVAL_MIN_K, RETRIEVAL_SCORE_GAP)
+    threshold = fused[top[-1]] if top else 0.0
 
-    # Retrieve top-k relevant documents
-    # Select docs above threshold
+    # each paper enters relevant_docs only once per run, papers selected by an earlier iteration are not counted again
     count = 0
-    for doc, score in zip(docs, similarities):
-        if score >= threshold:
+    for i in top:
+        pid = candidate_ids[i]
+        if registry.select(pid, float(fused[i])):
+            state["relevant_docs"].append(pid)
             count += 1
-            state["relevant_docs"].append(doc.page_content)
 
-    await publish("search_arxiv_token", format_retrieval_stats(len(docs), count, float(threshold)))
+    await publish("search_arxiv_token", format_retrieval_stats(len(ids), count, float(threshold), len(candidate_ids)))
 
-    print(f">> USING {count} / {len(docs)} PAPERS FOR REFLECTION...")
+    print(f">> USING {count} / {len(ids)} PAPERS FOR REFLECTION...")
 
     return {
         **state
     }
 
 
-async def reflection(state: AgentState) -> AgentState:
-    """ reflect on the current findings """
+async def packed_papers(state: AgentState, publish, stage: str, budget: int) -> str:
+    """ the relevant papers that fit the stage's token budget, most relevant and diverse first """
+
+    registry = state["registry"]
+
+    ids = list(registry.selected)
+    if not ids:
+        return ""
 
-    publish = state["publish"]
+    embeddings = registry.embeddings_for(ids) if not registry.missing_embeddings(ids) else None
+    # in full-text mode papers carry their best passages, and get more room for them
+    packed, report = pack_papers(
+        [with_passages(registry.papers[pid], registry.passages.get(pid)) for pid in ids], [registry.selected[pid] for pid in ids], embeddings,
+        budget, CONTEXT_MMR_LAMBDA, FULLTEXT_MAX_PAPER_TOKENS if FULLTEXT_ENABLED else CONTEXT_MAX_PAPER_TOKENS, CONTEXT_MIN_PAPER_TOKENS,
+    )
+
+    print(f">> PACKED {report['packed']} / {report['papers']} PAPERS INTO ~{report['used_tokens']} TOKENS FOR {stage.upper()}")
+    if report["truncated"] or report["dropped"]:
+        await publish(f"{stage}_token", format_context_report(report), report)
 
-    llm = get_streaming_llm(publish, "reflection")
+    return '\n'.join(packed)
+
+
+async def reflection(state: AgentState, config: RunnableConfig) -> AgentState:
+    """ reflect on the current findings """
+
+    publish = publisher(config)
 
     # await publish("reflection", "starting_reflection", {"count": state["count"]})
 
     original_reflection = json.dumps(state["original_plan"]["reflection"])
     # papers_json = json.dumps(state["results"]["arxiv"])
-    papers_json = '\n'.join(state["relevant_docs"])
+    papers_json = await packed_papers(state, publish, "reflection", CONTEXT_BUDGET_REFLECTION)
 
     message = reflection_prompt + "\nplanned reflection:\n" + original_reflection + "\nTop relevant papers retrieved from arxiv search:\n"+papers_json
 
@@ -235,13 +413,10 @@ async def reflection(state: AgentState) -> AgentState:
     if len(state["relevant_docs"]) == 0:
         message = reflection_prompt + "\nplanned reflection:\n" + original_reflection + "\nTop relevant papers retrieved from arxiv search: No relevant papers retrieved, search with different search terms and additional terms compared to the previous search parameters."
     
-    response = await llm.ainvoke(message)
-    response_json = response.content
-    if response_json.startswith("```json"):
-        response_json = response_json[7:-3]
+    response_json = await cached_ainvoke(publish, "reflection", message, validate=parse_json)
 
     try:
-        response_dict = json.loads(response_json)
+        response_dict = parse_json(response_json)
 
         if not response_dict["sufficient"]:
             print(">> CURRENT PAPERS ARE NOT SUFFICIENT...")
@@ -290,16 +465,16 @@ async def passthrough(state: AgentState) -> AgentState:
     return state
 
 
-async def summarize(state: AgentState) -> AgentState:
+async def summarize(state: AgentState, config: RunnableConfig) -> AgentState:
     """ summarize the findings """
 
-    publish = state["publish"]
+    publish = publisher(config)
 
-    llm = get_streaming_llm(publish, "search_arxiv")
+    llm = get_streaming_llm(publish, "summarize")
 
     # Summarize the findings and store them in the state["summary"]
 
-    papers = '\n'.join(state["relevant_docs"])
+    papers = await packed_papers(state, publish, "summarize", CONTEXT_BUDGET_SUMMARIZE)
 
     message = summarize_prompt + f"\nUser query:\n{state["query"]}\nPapers:\n{papers}"
 
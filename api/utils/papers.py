@@ -0,0 +1,127 @@
+"""
+Per run paper registry.
+Every paper returned by arxiv is registered once under its arxiv ID, so duplicates returned
+by overlapping queries or later planner -> reflection iterations collapse into one compact
+record, and its embedding / similarity score are computed at most once per run.
+The graph state only holds arxiv IDs that point into the registry.
+"""
+
+import re
+from typing import Dict, List
+
+import numpy as np
+
+# http://arxiv.org/abs/2401.01234v2 -> 2401.01234, http://arxiv.org/abs/cs/0112017v1 -> cs/0112017
+_ARXIV_ID = re.compile(r"arxiv\.org/(?:abs|pdf)/(.+?)(?:v\d+)?(?:\.pdf)?$")
+
+
+def arxiv_id(paper: Dict) -> str:
+    """ Return the version-less arxiv ID of a paper dict """
+    if paper.get("arxiv_id"):
+        return paper["arxiv_id"]
+    match = _ARXIV_ID.search(paper.get("arxiv_link", ""))
+    return match.group(1) if match else paper.get("arxiv_link") or paper["title"]
+
+
+class Paper:
+    """ Compact paper record """
+
+    __slots__ = ("arxiv_id", "title", "published", "summary", "arxiv_link", "pdf_link")
+
+    def __init__(self, arxiv_id: str, title: str, published: str, summary: str, arxiv_link: str, pdf_link: str = ""):
+        self.arxiv_id = arxiv_id
+        self.title = title
+        self.published = published
+        self.summary = summary
+        self.arxiv_link = arxiv_link
+        self.pdf_link = pdf_link
+
+    @classmethod
+    def from_dict(cls, paper: Dict) -> "Paper":
+        # papers stored before pdf links were kept get the link derived from the abstract page
+        pdf_link = paper.get("pdf_link") or paper["arxiv_link"].replace("/abs/", "/pdf/")
+        return cls(arxiv_id(paper), paper["title"], paper.get("published", ""), paper["summary"], paper["arxiv_link"], pdf_link)
+
+    def to_dict(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+def paper_content(paper: Paper, summary: str | None = None) -> str:
+    """ Text used both for embedding a paper and for passing it to the LLM (optionally with a shortened summary) """
+    return f"Title: {paper.title}\nSummary:\n{paper.summary if summary is None else summary}\nLink: {paper.arxiv_link}"
+
+
+class PaperRegistry:
+    """ Every paper seen during one run, with its cached embedding and similarity score """
+
+    def __init__(self):
+        self.papers: Dict[str, Paper] = {} # arxiv id -> paper record
+        self.embeddings: Dict[str, np.ndarray] = {} # arxiv id -> normalized embedding
+        self.scores: Dict[str, float] = {} # arxiv id -> similarity to score_query
+        self.score_query: str | None = None # query the cached scores were computed against
+        self.selected: Dict[str, float] = {} # ids already added to relevant_docs -> similarity when selected
+        self.passages: Dict[str, List[str]] = {} # arxiv id -> best matching full-text chunks (full-text mode)
+
+    def add(self, paper: Dict) -> str:
+        """ Register a paper dict (first occurrence wins) and return its arxiv ID """
+        pid = arxiv_id(paper)
+        if pid not in self.papers:
+            self.papers[pid] = Paper.from_dict(paper)
+        return pid
+
+    def missing_embeddings(self, ids: List[str]) -> List[str]:
+        return [pid for pid in ids if pid not in self.embeddings]
+
+    def set_embeddings(self, ids: List[str], vectors: np.ndarray):
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        for pid, vector in zip(ids, vectors):
+            self.embeddings[pid] = vector
+
+    def embeddings_for(self, ids: List[str]) -> np.ndarray:
+        return np.stack([self.embeddings[pid] for pid in ids])
+
+    def similarities(self, ids: List[str], query: str, query_emb: np.ndarray) -> np.ndarray:
+        """ Cosine similarity of each paper to the (normalized) query embedding, reusing cached scores """
+        if query != self.score_query:
+            # the analysis focus changed on replan, old scores are stale
+            self.scores = {}
+            self.score_query = query
+
+        todo = [pid for pid in ids if pid not in self.scores]
+        if todo:
+            scores = np.stack([self.embeddings[pid] for pid in todo]) @ query_emb
+            self.scores.update(zip(todo, scores.tolist()))
+
+        return np.array([self.scores[pid] for pid in ids])
+
+    def select(self, pid: str, score: float = 0.0) -> bool:
+        """ Mark a paper as relevant, returns False if it was already selected in an earlier iteration """
+        if pid in self.selected:
+            return False
+        self.selected[pid] = score
+        return True
+
+    def to_dict(self) -> Dict:
+        """ Plain dicts and one embedding matrix, for the checkpoint store """
+        ids = list(self.embeddings)
+        return {
+            "papers": [paper.to_dict() for paper in self.papers.values()],
+            "embedding_ids": ids,
+            "embeddings": np.stack([self.embeddings[pid] for pid in ids]) if ids else None,
+            "scores": self.scores,
+            "score_query": self.score_query,
+            "selected": self.selected,
+            "passages": self.passages,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PaperRegistry":
+        registry = cls()
+        registry.papers = {paper["arxiv_id"]: Paper.from_dict(paper) for paper in data["papers"]}
+        if data["embedding_ids"]:
+            registry.embeddings = dict(zip(data["embedding_ids"], data["embeddings"]))
+        registry.scores = data["scores"]
+        registry.score_query = data["score_query"]
+        registry.selected = data["selected"]
+        registry.passages = data.get("passages", {})
+        return registry
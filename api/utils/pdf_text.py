@@ -0,0 +1,45 @@
+"""
+PDF text extraction and chunking for the full-text mode, run in worker processes.
+The module only imports the standard library (pypdf on first use), so workers start fast.
+Pages are read one at a time and cut into overlapping word chunks as they are read, and
+reading stops once enough chunks were produced, so memory stays bounded by one page plus
+the chunks kept, however large the PDF is.
+"""
+
+import re
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+# "retrie-\nval" -> "retrieval"
+_HYPHENATED = re.compile(r"(\w)-\s*\n\s*(\w)")
+
+
+def page_texts(path: str, max_pages: int) -> Iterator[str]:
+    """ Text of the first max_pages pages, one page at a time """
+    # optional dependency, only needed in full-text mode
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    for page in islice(reader.pages, max_pages):
+        yield page.extract_text() or ""
+
+
+def chunk_words(pages: Iterable[str], size: int, overlap: int) -> Iterator[str]:
+    """ Chunks of `size` words, consecutive chunks share `overlap` words """
+    step = max(1, size - overlap)
+    words: List[str] = []
+    emitted = False
+    for text in pages:
+        words.extend(_HYPHENATED.sub(r"\1\2", text).split())
+        while len(words) >= size:
+            yield " ".join(words[:size])
+            emitted = True
+            words = words[step:]
+    # the tail, unless it is only the overlap of the last chunk
+    if words and (not emitted or len(words) > overlap):
+        yield " ".join(words)
+
+
+def extract_chunks(path: str, max_pages: int, size: int, overlap: int, max_chunks: int) -> List[str]:
+    """ Chunk the text of a PDF file, reading pages only until max_chunks chunks exist """
+    return list(islice(chunk_words(page_texts(path, max_pages), size, overlap), max_chunks))
@@ -0,0 +1,69 @@
+"""
+Incremental parser for the planner's streamed JSON.
+The planner answers with {"plan": [step, step, ...], "reflection": {...}}. Fed the response
+token by token, PlanStream returns every `plan[i]` object the moment its closing brace
+arrives, so its search can start while the planner is still generating the later steps
+and the reflection block. Anything before the first brace (e.g. a ```json fence) is ignored.
+"""
+
+import json
+from typing import Dict, List
+
+
+class PlanStream:
+    """ Scans the response once, tracking string / nesting state across tokens """
+
+    def __init__(self, key: str = "plan"):
+        self.key = key
+        self.buffer = ""
+        self.pos = 0 # next character to scan
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.last_string = "" # raw text of the last string closed, a key when a colon follows
+        self.current_key = None # key of the top level value being scanned
+        self.in_list = False # inside the top level list under `key`
+        self.item_start = None # start of the list item being scanned
+
+    def feed(self, text: str) -> List[Dict]:
+        """ Scan more of the response, return the list items completed by it """
+        self.buffer += text
+        items = []
+
+        buffer = self.buffer
+        for pos in range(self.pos, len(buffer)):
+            char = buffer[pos]
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    self.last_string = buffer[self.string_start:pos + 1]
+            elif char == '"':
+                self.in_string = True
+                self.string_start = pos
+            elif char == ":" and self.depth == 1:
+                self.current_key = json.loads(self.last_string)
+            elif char in "{[":
+                self.depth += 1
+                if self.depth == 2 and char == "[" and self.current_key == self.key:
+                    self.in_list = True
+                elif self.depth == 3 and char == "{" and self.in_list:
+                    self.item_start = pos
+            elif char in "}]":
+                if self.depth == 3 and char == "}" and self.item_start is not None:
+                    try:
+                        items.append(json.loads(buffer[self.item_start:pos + 1]))
+                    except json.JSONDecodeError:
+                        pass # left for the full parse once the response is complete
+                    self.item_start = None
+                elif self.depth == 2 and self.in_list:
+                    self.in_list = False
+                self.depth -= 1
+
+        self.pos = len(buffer)
+        return items
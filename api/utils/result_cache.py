@@ -0,0 +1,152 @@
+"""
+Cache of completed agent runs.
+Final states are stored on disk keyed by the normalized query and the model of every stage, with
+TTL and LRU eviction.
+With the semantic tier enabled, a query whose embedding is close enough to a cached one is
+answered with that run's final state as well, so near-duplicate queries return in milliseconds.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+import anyio
+import numpy as np
+
+from setup import get_embeddings
+from utils.cache import SemanticIndex, SqliteLRUCache
+from utils.config import (
+    CACHE_DIR, RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_SEMANTIC, RESULT_CACHE_SEMANTIC_THRESHOLD, LLM_STAGES, stage_llm,
+)
+from utils.embeddings import embed_query
+from utils.metrics import RESULT_CACHE_LOOKUPS
+
+
+def normalize_query(query: str) -> str:
+    """ Case, whitespace and trailing punctuation do not change the run """
+    return " ".join(query.lower().split()).strip(" ?!.")
+
+
+class ResultCache:
+    """ Final states by normalized query, plus an in-memory embedding index for near-duplicate lookups """
+
+    def __init__(self, store: SqliteLRUCache, semantic: bool = False, threshold: float = 0.95):
+        self.store = store
+        self.semantic = semantic
+        self.threshold = threshold
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+        self.index = SemanticIndex() # normalized query embeddings, pruned when the store evicts
+        store.on_evict = self.index.remove
+        self._lock = threading.Lock() # lookups and stores run in worker threads
+        # a run depends on the model and temperature of every stage, changing one of them starts a new cache
+        self.models = ",".join("{}={}@{}".format(stage, *stage_llm(stage)) for stage in LLM_STAGES)
+
+        for key, value in store.items():
+            entry = json.loads(value)
+            # runs of other models are never served, not even to near-duplicate queries
+            if entry.get("embedding") is not None and entry.get("models") == self.models:
+                self.index.add(key, np.asarray(entry["embedding"], dtype=np.float32))
+
+    def key(self, query: str) -> str:
+        return hashlib.sha256(f"{self.models}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def lookup(self, query: str, query_emb: np.ndarray | None = None) -> Tuple[Dict, str, float] | None:
+        """ Return (entry, "exact" | "semantic", similarity) for a cached run answering the query """
+        value = self.store.get(self.key(query))
+        if value is not None:
+            self.stats["exact_hits"] += 1
+            RESULT_CACHE_LOOKUPS.inc(result="exact_hit")
+            return json.loads(value), "exact", 1.0
+
+        with self._lock:
+            best, score = None, 0.0
+            match = self.index.nearest(query_emb) if query_emb is not None else None
+            if match is not None and match[1] >= self.threshold:
+                best, score = match
+
+            if best is not None:
+                value = self.store.get(best)
+                # the entry may have expired since it was indexed
+                if value is None:
+                    self.index.remove([best])
+                else:
+                    self.stats["semantic_hits"] += 1
+                    RESULT_CACHE_LOOKUPS.inc(result="semantic_hit")
+                    return json.loads(value), "semantic", score
+
+        self.stats["misses"] += 1
+        RESULT_CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    def put(self, query: str, final_state: Dict, query_emb: np.ndarray | None = None):
+        key = self.key(query)
+        entry = {"query": query, "created": time.time(), "models": self.models, "final_state": final_state}
+        if query_emb is not None:
+            entry["embedding"] = query_emb.tolist()
+        self.store.set(key, json.dumps(entry, default=str).encode("utf-8"))
+        with self._lock:
+            if query_emb is not None:
+                self.index.add(key, query_emb)
+            self.stats["stores"] += 1
+
+    def invalidate(self, query: str | None = None) -> int:
+        """ Drop the cached run of one query, or every cached run when query is None """
+        with self._lock:
+            if query is None:
+                count = len(self.store)
+                self.store.clear()
+                self.index.clear()
+            else:
+                key = self.key(query)
+                count = int(self.store.get(key) is not None)
+                self.store.delete([key])
+                self.index.remove([key])
+            self.stats["invalidations"] += count
+        return count
+
+    def info(self) -> Dict:
+        lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        return {
+            **self.stats,
+            "entries": len(self.store),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "semantic": self.semantic,
+            "threshold": self.threshold,
+        }
+
+
+_cache: ResultCache | None = None
+
+
+def get_result_cache() -> ResultCache:
+    """ Process wide result cache, loaded on first use """
+    global _cache
+    if _cache is None:
+        store = SqliteLRUCache(
+            os.path.join(CACHE_DIR, "results.sqlite"), table="results", max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL,
+        )
+        _cache = ResultCache(store, RESULT_CACHE_SEMANTIC, RESULT_CACHE_SEMANTIC_THRESHOLD)
+    return _cache
+
+
+async def query_embedding(query: str) -> np.ndarray | None:
+    """ Embedding used by the semantic tier, None when it is disabled """
+    if not RESULT_CACHE_SEMANTIC:
+        return None
+    return await embed_query(get_embeddings(), normalize_query(query))
+
+
+async def lookup(query: str) -> Tuple[Dict, str, float] | None:
+    cache = await anyio.to_thread.run_sync(get_result_cache)
+    query_emb = await query_embedding(query)
+    return await anyio.to_thread.run_sync(cache.lookup, query, query_emb)
+
+
+async def store(query: str, final_state: Dict):
+    cache = await anyio.to_thread.run_sync(get_result_cache)
+    query_emb = await query_embedding(query)
+    await anyio.to_thread.run_sync(cache.put, query, final_state, query_emb)
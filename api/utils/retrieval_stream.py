@@ -0,0 +1,102 @@
+"""
+Streaming retrieval: papers are embedded and scored while the arxiv searches are still running.
+Every feed that lands is registered, ranked with BM25 against the papers seen so far, and its
+papers that make the running lexical top-N are embedded in the background. Once the retrieval
+query is known its embedding is computed and every embedded paper is scored, later batches are
+scored as they are embedded. The vectors and scores are kept in the paper registry, so by the
+time the last fetch lands `retrieve` finds nearly every candidate already embedded and scored.
+
+The stream is an async context manager: leaving it waits for the pending embeddings, so the
+registry is never changed after the node that owns the stream has returned. This work is only
+speculative: a failed embedding is logged and never fails the node, `retrieve` embeds whatever
+is missing on its normal path.
+"""
+
+from typing import Dict, List, Set
+
+import anyio
+import numpy as np
+
+from setup import get_embeddings
+from utils.config import LOCAL_INDEX_ENABLED
+from utils.embeddings import embed_documents, embed_query
+from utils.lexical import bm25_scores
+from utils.papers import PaperRegistry, paper_content
+from utils.vector_index import get_vector_index
+
+
+class RetrievalStream:
+    """ Embeds and scores the papers of each arxiv feed as it arrives """
+
+    def __init__(self, registry: PaperRegistry, lexical_query: str, top_n: int):
+        self.registry = registry
+        self.lexical_query = lexical_query # ranks arriving papers, the user query until the plan is known
+        self.top_n = max(1, top_n)
+        self.ids: List[str] = [] # every paper seen by the stream, in arrival order
+        self.pending: Set[str] = set() # papers being embedded
+        self.query: str | None = None
+        self.query_emb: np.ndarray | None = None
+        self._tg = None
+
+    async def __aenter__(self) -> "RetrievalStream":
+        self._tg = anyio.create_task_group()
+        await self._tg.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc) -> bool | None:
+        return await self._tg.__aexit__(*exc)
+
+    async def add(self, papers: List[Dict]):
+        """ Register a feed's papers and start embedding the lexically promising ones """
+        registry = self.registry
+        seen = set(self.ids)
+        for paper in papers:
+            pid = registry.add(paper)
+            if pid not in seen:
+                seen.add(pid)
+                self.ids.append(pid)
+
+        lexical = bm25_scores(self.lexical_query, [f"{registry.papers[pid].title} {registry.papers[pid].summary}" for pid in self.ids])
+        top = {self.ids[i] for i in np.argsort(-lexical, kind="stable")[:self.top_n]}
+        todo = [pid for pid in top if pid not in registry.embeddings and pid not in self.pending]
+        if todo:
+            self.pending.update(todo)
+            self._tg.start_soon(self._embed, todo)
+
+    def set_query(self, query: str):
+        """ The retrieval query is known, embed it and score everything embedded so far """
+        self.query = query
+        self._tg.start_soon(self._embed_query, query)
+
+    async def _embed(self, ids: List[str]):
+        registry = self.registry
+        try:
+            vectors = await embed_documents(get_embeddings(), [paper_content(registry.papers[pid]) for pid in ids])
+        except Exception as e:
+            print(f">> STREAMED EMBEDDING OF {len(ids)} PAPERS FAILED, LEFT FOR RETRIEVE: {e}")
+            return
+        finally:
+            self.pending.difference_update(ids)
+        registry.set_embeddings(ids, vectors)
+
+        # remember every freshly embedded paper in the local long-term index
+        if LOCAL_INDEX_ENABLED:
+            try:
+                await anyio.to_thread.run_sync(get_vector_index().add, [registry.papers[pid].to_dict() for pid in ids], registry.embeddings_for(ids))
+            except Exception as e:
+                print(f">> COULD NOT ADD {len(ids)} PAPERS TO THE LOCAL INDEX: {e}")
+
+        if self.query_emb is not None:
+            registry.similarities(ids, self.query, self.query_emb)
+
+    async def _embed_query(self, query: str):
+        try:
+            query_emb = await embed_query(get_embeddings(), query)
+        except Exception as e:
+            # papers are scored by retrieve instead
+            print(f">> STREAMED QUERY EMBEDDING FAILED: {e}")
+            return
+        self.query_emb = query_emb / np.linalg.norm(query_emb)
+        embedded = [pid for pid in self.ids if pid in self.registry.embeddings]
+        if embedded:
+            self.registry.similarities(embedded, self.query, self.query_emb)
@@ -0,0 +1,39 @@
+"""
+Server-sent event encoding.
+Frames are built as bytes with orjson, skipping pydantic models and json.dumps on the per-token path.
+"""
+
+from typing import AsyncGenerator, Callable
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+
+def encode(payload: dict, event: str | None = None, id: int | None = None) -> bytes:
+    """ Encode a payload as a single SSE frame, `id` lets clients resume with Last-Event-ID """
+    data = orjson.dumps(payload, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+    frame = b""
+    if id is not None:
+        frame += b"id: " + str(id).encode("ascii") + b"\n"
+    if event is not None:
+        frame += b"event: " + event.encode("utf-8") + b"\n"
+    return frame + b"data: " + data + b"\n\n"
+
+
+class EventStreamResponse(StreamingResponse):
+    """ text/event-stream response that closes its stream and calls `on_close` when it ends, even if the client left before the first frame """
+
+    def __init__(self, content: AsyncGenerator[bytes, None], on_close: Callable[[], None] | None = None):
+        super().__init__(content, media_type="text/event-stream")
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                # a disconnect leaves the generator suspended (or never started), its cleanup must not wait for garbage collection
+                await self.body_iterator.aclose()
+            finally:
+                if self.on_close is not None:
+                    self.on_close()
@@ -1,4 +1,5 @@
-from typing import TypedDict, Dict, List, Callable, Awaitable
+from typing import TypedDict, Dict, List
+from utils.papers import PaperRegistry
 
 # Agent state
 
@@ -13,10 +14,49 @@ class AgentState(TypedDict):
     query: str # The user query
     original_plan: Dict[str, str] # Entire plan returned by the planner, with rationale and reflection
     plan: List[Dict] # List of plan dicts with tool name, search parameters and reasoning
-    results: Dict[str, List] # Result of each search tool
+    results: Dict[str, List[str]] # arxiv IDs found by each search tool in the current iteration
     reflection: bool | None # To determine whether the findings are enough to summarize
     reflection_notes: str # LLM's reasoning notes for the reflection
     summary: str # Final summary
-    relevant_docs: List[str] # Documents relevant to the user query and analysis focus
+    relevant_docs: List[str] # arxiv IDs of the papers relevant to the user query and analysis focus
     count: int # Number of iterations of the planner -> reflection loop
-    publish: Callable[[str, str, Dict | None], Awaitable[None]] # Function to put events into an async queue
\ No newline at end of file
+    registry: PaperRegistry # Every paper seen in this run keyed by arxiv ID, with cached embeddings and scores
+
+
+def initial_state(query: str) -> AgentState:
+    """ Fresh graph state for a user query, the event publisher is passed in the run config (see publisher) """
+    return {
+        "query": query,
+        "original_plan": {},
+        "plan": [],
+        "results": {"arxiv": []},
+        "reflection": None,
+        "reflection_notes": "",
+        "summary": "",
+        "relevant_docs": [],
+        "count": 0,
+        "registry": PaperRegistry(),
+    }
+
+
+def public_state(state: AgentState) -> Dict:
+    """ Slim final state sent to clients: the answer, the plan and the relevant papers, no internal bookkeeping """
+    registry = state["registry"]
+    return {
+        "query": state["query"],
+        "summary": state["summary"],
+        "original_plan": state["original_plan"],
+        "reflection_notes": state["reflection_notes"],
+        "count": state["count"],
+        "papers": [
+            {
+                "arxiv_id": pid,
+                "title": registry.papers[pid].title,
+                "published": registry.papers[pid].published,
+                "arxiv_link": registry.papers[pid].arxiv_link,
+                "pdf_link": registry.papers[pid].pdf_link,
+                "score": round(registry.selected.get(pid, 0.0), 4),
+            }
+            for pid in state["relevant_docs"]
+        ],
+    }
@@ -1,15 +1,90 @@
+import time
+
 from langchain_core.callbacks.base import AsyncCallbackHandler
 
+from utils.config import STREAM_COALESCE_MS, STREAM_COALESCE_BYTES
+from utils.metrics import (
+    LLM_CALLS, LLM_TTFT_SECONDS, LLM_SECONDS, LLM_TOKENS_PER_SECOND, LLM_PROMPT_CHARS, LLM_COMPLETION_CHARS, LLM_TOKENS,
+)
+
 class StreamingCallback(AsyncCallbackHandler):
     """
-    Callback handler to handle token by token streaming
+    Callback handler to handle token by token streaming.
+    Tokens are coalesced and published together once STREAM_COALESCE_MS have passed since the
+    last flush or STREAM_COALESCE_BYTES have accumulated (setting either to 0 publishes every token).
+    Also records time to first token, tokens per second and prompt / completion sizes per stage.
+    on_token: optional function called with every raw token, e.g. to parse the response while it streams
     """
-    def __init__(self, publish, stage: str):
+    def __init__(self, publish, stage: str, window_ms: float = STREAM_COALESCE_MS, max_bytes: int = STREAM_COALESCE_BYTES, on_token=None):
         self.publish = publish
         self.stage = stage
+        self.on_token = on_token
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.last_flush = time.monotonic()
+
+        # timing of the live call (stays None when a cached response is replayed)
+        self.started = None
+        self.first_token = None
+        self.chunks = 0
+        self.completion_chars = 0
+
+    async def flush(self):
+        if self.buffer:
+            text = "".join(self.buffer)
+            self.buffer = []
+            self.buffered_bytes = 0
+            await self.publish(f"debug_{self.stage}_token", text)
+        self.last_flush = time.monotonic()
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.started = time.perf_counter()
+        LLM_CALLS.inc(stage=self.stage, cached="false")
+        LLM_PROMPT_CHARS.inc(sum(len(str(m.content)) for batch in messages for m in batch), stage=self.stage)
 
     async def on_llm_new_token(self, token: str, **kwargs):
-        await self.publish(f"debug_{self.stage}_token", token)
+        if self.started is not None and self.first_token is None:
+            self.first_token = time.perf_counter()
+            LLM_TTFT_SECONDS.observe(self.first_token - self.started, stage=self.stage)
+        self.chunks += 1
+        self.completion_chars += len(token)
+        if self.on_token is not None:
+            self.on_token(token)
+
+        self.buffer.append(token)
+        self.buffered_bytes += len(token)
+        if (
+            self.buffered_bytes >= self.max_bytes
+            or time.monotonic() - self.last_flush >= self.window
+        ):
+            await self.flush()
 
     async def on_llm_end(self, response, **kwargs):
+        await self.flush()
+        if self.started is not None:
+            self._record(response)
         await self.publish(f"debug_{self.stage}_end", "stream_completed")
+
+    async def on_llm_error(self, error, **kwargs):
+        await self.flush()
+
+    def _record(self, response):
+        end = time.perf_counter()
+        LLM_SECONDS.observe(end - self.started, stage=self.stage)
+        LLM_COMPLETION_CHARS.inc(self.completion_chars, stage=self.stage)
+
+        # exact token counts when the model reports them, otherwise ~4 characters per token
+        usage = None
+        try:
+            usage = response.generations[0][0].message.usage_metadata
+        except (AttributeError, IndexError, TypeError):
+            pass
+        completion_tokens = usage["output_tokens"] if usage else self.completion_chars / 4
+        if usage:
+            LLM_TOKENS.inc(usage["input_tokens"], stage=self.stage, kind="prompt")
+            LLM_TOKENS.inc(usage["output_tokens"], stage=self.stage, kind="completion")
+
+        if self.first_token is not None and end > self.first_token:
+            LLM_TOKENS_PER_SECOND.observe(completion_tokens / (end - self.first_token), stage=self.stage)
@@ -0,0 +1,284 @@
+"""
+Persistent local vector index used as long-term research memory.
+Every paper (and its embedding) the service has ever retrieved is kept on disk:
+vectors live in a memory-mapped float32 matrix, paper metadata in SQLite.
+Search is an exact cosine similarity scan over the memory-mapped rows, which stays
+in the tens of milliseconds for 100k+ papers (see benchmarks/bench_vector_index.py).
+
+The index records the embedding model and dimension it was built with, and is rebuilt
+(emptied) when opened with another model, so vectors of different spaces never mix.
+Several processes (uvicorn workers) can share one index: rows are allocated inside a SQLite
+write transaction, every process picks up the rows the others appended before it searches,
+and removals, compaction or a rebuild bump a generation counter that makes the other
+processes reload the index.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from utils.config import CACHE_DIR, EMBEDDING_MODEL
+
+# rows allocated when the vector file is created, it doubles every time it fills up
+INITIAL_CAPACITY = 1024
+
+
+class VectorIndex:
+    """ Append-only memory-mapped vector store with tombstones and compaction """
+
+    def __init__(self, path: str, model: str | None = None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.model = model # None: accept whatever model the index was built with
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self._lock = threading.RLock()
+
+        self._db = sqlite3.connect(os.path.join(path, "meta.sqlite"), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=30000") # wait for the write transactions of other processes
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS papers ("
+            "row INTEGER PRIMARY KEY, arxiv_id TEXT NOT NULL, paper TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS papers_arxiv_id ON papers(arxiv_id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+        if model is not None:
+            with self._write():
+                stored = self._info("model")
+                if stored is not None and stored != model:
+                    self._reset(f"it was built with {stored}")
+                # indexes written before the model was recorded are assumed to use this one, add() still checks the dimension
+                self._set_info("model", model)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, arxiv_id: str) -> bool:
+        return arxiv_id in self._ids
+
+    # shared state
+
+    def _info(self, key: str) -> str | None:
+        row = self._db.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_info(self, key: str, value: str):
+        self._db.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, value))
+
+    @contextmanager
+    def _write(self):
+        """ Write transaction, only one process at a time holds it """
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            self.generation = None # the in-memory view may be ahead of the rolled back state, reload it
+            raise
+        self._db.execute("COMMIT")
+
+    def _bump(self):
+        """ Tell the other processes that existing rows changed (inside a write transaction) """
+        self._set_info("generation", str(int(self._info("generation") or 0) + 1))
+
+    def _reset(self, reason: str):
+        """ Empty the index (inside a write transaction) """
+        print(f">> REBUILDING THE LOCAL INDEX, {reason}")
+        self._db.execute("DELETE FROM papers")
+        self._db.execute("DELETE FROM info WHERE key = 'dim'")
+        self._bump()
+        # processes that still map the old file keep it alive until they reload
+        if os.path.exists(self.vectors_path):
+            os.remove(self.vectors_path)
+        self.dim = None
+        self._vectors = None
+
+    def _load(self):
+        """ Read the whole index state from disk """
+        self.generation = self._info("generation")
+        dim = self._info("dim")
+        self.dim = int(dim) if dim else None
+
+        # in memory view of the metadata: row -> arxiv id, live ids and the tombstone mask
+        rows = self._db.execute("SELECT row, arxiv_id, deleted FROM papers ORDER BY row").fetchall()
+        self.size = 0
+        self._row_ids: List[str | None] = []
+        self._ids: Dict[str, int] = {}
+        self._deleted = np.ones(0, dtype=bool)
+        self._vectors = None
+        self._append_rows(rows)
+        if self.dim is not None:
+            self._open_vectors()
+
+    def _append_rows(self, rows: List[Tuple[int, str, int]]):
+        if not rows:
+            return
+        size = rows[-1][0] + 1
+        deleted = np.ones(size - self.size, dtype=bool)
+        self._row_ids.extend([None] * (size - self.size))
+        for row, arxiv_id, dead in rows:
+            deleted[row - self.size] = bool(dead)
+            self._row_ids[row] = arxiv_id
+            if not dead:
+                self._ids[arxiv_id] = row
+        self._deleted = np.concatenate([self._deleted, deleted])
+        self.size = size
+
+    def _sync(self):
+        """ Pick up what other processes wrote since the last call """
+        if self._info("generation") != self.generation:
+            self._load()
+            return
+        rows = self._db.execute("SELECT row, arxiv_id, deleted FROM papers WHERE row >= ? ORDER BY row", (self.size,)).fetchall()
+        if not rows:
+            return
+        self._append_rows(rows)
+        if self.dim is None:
+            self.dim = int(self._info("dim"))
+        if self._vectors is None or self.size > self._vectors.shape[0]:
+            self._open_vectors()
+
+    def _open_vectors(self, capacity: int | None = None):
+        """ (Re)map the vector file, growing it to at least `capacity` rows """
+        current = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        capacity = max(capacity or 0, current, INITIAL_CAPACITY)
+        if capacity > current:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(capacity * 4 * self.dim)
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    # api
+
+    def add(self, papers: List[Dict], vectors: np.ndarray) -> int:
+        """ Append papers that are not in the index yet, returns the number of rows added """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._write():
+            self._sync()
+            if not len(papers):
+                return 0
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                # the embedding model changed without its name, the stored vectors are of no use
+                self._reset(f"its vectors have {self.dim} dimensions, new ones {vectors.shape[1]}")
+                self._load()
+
+            new, seen = [], set(self._ids)
+            for paper, vector in zip(papers, vectors):
+                if paper["arxiv_id"] not in seen:
+                    seen.add(paper["arxiv_id"])
+                    new.append((paper, vector))
+            if not new:
+                return 0
+
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._set_info("dim", str(self.dim))
+                self._open_vectors()
+
+            # the write transaction makes this the only process appending, so the next rows are free
+            start = self.size
+            end = start + len(new)
+            if end > self._vectors.shape[0]:
+                self._vectors.flush()
+                self._open_vectors(max(end, 2 * self._vectors.shape[0]))
+
+            # store normalized vectors so search is a plain dot product
+            block = np.stack([vector for _, vector in new])
+            self._vectors[start:end] = block / np.linalg.norm(block, axis=1, keepdims=True)
+            self._vectors.flush()
+
+            self._db.executemany(
+                "INSERT INTO papers (row, arxiv_id, paper, deleted) VALUES (?, ?, ?, 0)",
+                [(start + i, paper["arxiv_id"], json.dumps(paper)) for i, (paper, _) in enumerate(new)],
+            )
+            self._append_rows([(start + i, paper["arxiv_id"], 0) for i, (paper, _) in enumerate(new)])
+            return len(new)
+
+    def search(self, query_emb: np.ndarray, k: int = 10, min_score: float = -1.0) -> List[Tuple[float, Dict, np.ndarray]]:
+        """ Return up to k (score, paper, vector) tuples with cosine similarity >= min_score, best first """
+        with self._lock:
+            self._sync()
+            query_emb = np.asarray(query_emb, dtype=np.float32)
+            if not self._ids or query_emb.shape[0] != self.dim:
+                # a query of another model is rebuilt away by the next add()
+                return []
+            query_emb = query_emb / np.linalg.norm(query_emb)
+
+            scores = self._vectors[:self.size] @ query_emb
+            scores[self._deleted] = -np.inf
+
+            k = min(k, len(self._ids))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            top = [int(row) for row in top if scores[row] >= min_score]
+            if not top:
+                return []
+
+            # by id, not row: another process may renumber rows by compacting meanwhile
+            ids = [self._row_ids[row] for row in top]
+            marks = ",".join("?" * len(ids))
+            papers = dict(self._db.execute(f"SELECT arxiv_id, paper FROM papers WHERE arxiv_id IN ({marks})", ids).fetchall())
+            return [
+                (float(scores[row]), json.loads(papers[pid]), np.array(self._vectors[row]))
+                for row, pid in zip(top, ids) if pid in papers
+            ]
+
+    def remove(self, arxiv_ids: List[str]):
+        """ Tombstone papers, their rows are reclaimed by compact() """
+        with self._lock, self._write():
+            self._sync()
+            rows = [self._ids.pop(pid) for pid in arxiv_ids if pid in self._ids]
+            self._db.executemany("UPDATE papers SET deleted = 1 WHERE row = ?", [(row,) for row in rows])
+            self._deleted[rows] = True
+            self._bump()
+            self.generation = self._info("generation")
+
+    def compact(self) -> int:
+        """ Rewrite the index without tombstoned rows, returns the number of rows reclaimed """
+        with self._lock:
+            with self._write():
+                self._sync()
+                live = np.flatnonzero(~self._deleted)
+                reclaimed = self.size - len(live)
+                if reclaimed == 0:
+                    return 0
+
+                vectors = np.array(self._vectors[live])
+                self._vectors.flush()
+                self._vectors = None
+
+                tmp_path = self.vectors_path + ".tmp"
+                capacity = max(INITIAL_CAPACITY, len(live))
+                out = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(capacity, self.dim))
+                out[:len(live)] = vectors
+                out.flush()
+                del out
+                os.replace(tmp_path, self.vectors_path)
+
+                # renumber the surviving rows in order
+                self._db.execute("DELETE FROM papers WHERE deleted = 1")
+                self._db.executemany(
+                    "UPDATE papers SET row = ? WHERE row = ?",
+                    [(new_row, int(old_row)) for new_row, old_row in enumerate(live)],
+                )
+                self._bump()
+            self._db.execute("VACUUM")
+            self._load()
+            return reclaimed
+
+
+_index: VectorIndex | None = None
+
+
+def get_vector_index() -> VectorIndex:
+    """ Process wide local index, opened on first use """
+    global _index
+    if _index is None:
+        _index = VectorIndex(os.path.join(CACHE_DIR, "index"), EMBEDDING_MODEL)
+    return _index
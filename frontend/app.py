@@ -5,10 +5,13 @@ import json
 import subprocess
 import atexit
 import os
+import time
 
 # Config
 FASTAPI_CMD = ["uvicorn", "api.main:app", "--port", "8000", "--reload"]
 FASTAPI_URL = "http://127.0.0.1:8000/query"
+RENDER_INTERVAL_MS = int(os.getenv("RA_RENDER_INTERVAL_MS", 150)) # re-render a section at most this often
+SEGMENT_CHARS = int(os.getenv("RA_RENDER_SEGMENT_CHARS", 3000)) # freeze rendered text into a segment past this size
 
 # Start Backend
 if "backend_proc" not in st.session_state:
@@ -50,6 +53,62 @@ st.title("🧠 Research Agent — Streaming Workflow")
 query = st.text_input("Enter your research query:", placeholder="e.g., vulnerabilities in LLMs")
 run = st.button("Run Agent")
 
+# rendering
+class SectionRenderer:
+    """
+    Streams markdown into one section.
+    Finished paragraphs are frozen into their own placeholder once the live tail grows past
+    SEGMENT_CHARS, so each re-render only sends the tail instead of the whole growing buffer.
+    """
+    def __init__(self, container):
+        self.container = container
+        self.placeholders = [container.empty()]
+        self.tail = ""
+        self.dirty = False
+
+    def append(self, text: str):
+        self.tail += text
+        self.dirty = True
+
+    def replace(self, text: str):
+        for ph in self.placeholders:
+            ph.empty()
+        self.placeholders = [self.container.empty()]
+        self.tail = text
+        self.dirty = True
+        self.render()
+
+    def render(self):
+        if not self.dirty:
+            return
+        if len(self.tail) > SEGMENT_CHARS:
+            # freeze everything up to the last paragraph break, markdown never spans it
+            cut = self.tail.rfind("\n\n")
+            if cut > 0:
+                self.placeholders[-1].markdown(self.tail[:cut], unsafe_allow_html=True)
+                self.tail = self.tail[cut:]
+                self.placeholders.append(self.container.empty())
+        self.placeholders[-1].markdown(self.tail, unsafe_allow_html=True)
+        self.dirty = False
+
+
+class RenderScheduler:
+    """ Batches incoming events and re-renders dirty sections at most every RENDER_INTERVAL_MS """
+    def __init__(self, sections, interval_ms: int = RENDER_INTERVAL_MS):
+        self.sections = sections
+        self.interval = interval_ms / 1000
+        self.last_render = 0.0
+
+    def tick(self):
+        now = time.monotonic()
+        if now - self.last_render >= self.interval:
+            self.flush()
+            self.last_render = now
+
+    def flush(self):
+        for section in self.sections.values():
+            section.render()
+
 # main
 async def run_agent(query_text: str):
     async with httpx.AsyncClient(timeout=None) as client:
@@ -67,14 +126,14 @@ async def run_agent(query_text: str):
             refl_status    = refl_exp.empty()
             summ_status    = summ_exp.empty()
 
-            # Single markdown placeholders (scrollable via CSS above)
-            planner_md = planner_exp.empty()
-            search_md  = search_exp.empty()
-            refl_md    = refl_exp.empty()
-            summ_md    = summ_exp.empty()
+            # Markdown renderers (scrollable via CSS above)
+            planner_md = SectionRenderer(planner_exp.container())
+            search_md  = SectionRenderer(search_exp.container())
+            refl_md    = SectionRenderer(refl_exp.container())
+            summ_md    = SectionRenderer(summ_exp.container())
 
-            # Buffers for streaming text per section
-            buffers = {"planner": "", "search": "", "reflection": "", "summary": ""}
+            # Streaming text per section, rendered in batches
+            scheduler = RenderScheduler({"planner": planner_md, "search": search_md, "reflection": refl_md, "summary": summ_md})
 
             SECTION_MAP = {
                 "planner": ("planner", planner_md, planner_status),
@@ -113,8 +172,8 @@ async def run_agent(query_text: str):
                     sec, ph, _ = SECTION_MAP.get(sname, (None, None, None))
                     if not sec:
                         continue
-                    buffers[sec] += msg
-                    ph.markdown(buffers[sec], unsafe_allow_html=True)
+                    ph.append(msg)
+                    scheduler.tick()
                     continue
 
                 # End-of-stage
@@ -123,16 +182,21 @@ async def run_agent(query_text: str):
                     sec, _, stat = SECTION_MAP.get(sname, (None, None, None))
                     if not sec:
                         continue
+                    scheduler.flush()
                     stat.empty()
                     continue
 
                 # Final summary
                 if "final_state" in obj:
+                    scheduler.flush()
                     summ_status.empty()
-                    summ_md.markdown(obj["final_state"]["summary"], unsafe_allow_html=True)
+                    summ_md.replace(obj["final_state"]["summary"])
                     st.success("✅ Agent completed successfully!")
                     return
 
+            # stream ended without a final state, show whatever is still pending
+            scheduler.flush()
+
 # Run
 if run and query:
     with st.spinner("Running Agent..."):